@@ -0,0 +1,55 @@
+import argparse
+import json
+import time
+
+import cli_api
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def measure(func, iterations: int) -> dict[str, float]:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "p50_ms": round(percentile(samples, 50), 2),
+        "p99_ms": round(percentile(samples, 99), 2),
+        "max_ms": round(max(samples), 2),
+    }
+
+
+def run_benchmark(username: str, iterations: int) -> dict[str, dict[str, dict[str, float]]]:
+    operations = {
+        "list_users": lambda: cli_api.list_users(),
+        "get_user": lambda: cli_api.get_user(username),
+        "show_user_uri_json": lambda: cli_api.show_user_uri_json([username]),
+    }
+
+    results = {}
+    for backend in (cli_api.SubprocessBackend.name, cli_api.InProcessBackend.name):
+        cli_api.set_backend(backend)
+        active = cli_api.get_backend().name
+        if active != backend:
+            results[backend] = {"error": f"backend unavailable, fell back to {active}"}
+            continue
+        results[backend] = {name: measure(op, iterations) for name, op in operations.items()}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare cli_api latency between the subprocess and in-process backends.")
+    parser.add_argument("-u", "--username", required=True, help="Existing user to query.")
+    parser.add_argument("-n", "--iterations", type=int, default=50, help="Calls per operation (default: 50).")
+    args = parser.parse_args()
+
+    print(json.dumps(run_benchmark(args.username, args.iterations), indent=2))
+
+
+if __name__ == "__main__":
+    main()
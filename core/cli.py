@@ -96,9 +96,14 @@ def restore_hysteria2(backup_file_path):
 
 
 @cli.command('list-users')
-def list_users():
-    try:
-        res = cli_api.list_users()
+@click.option('--page', type=int, help='Page number (enables paging)')
+@click.option('--limit', type=int, help='Users per page')
+@click.option('--sort', type=str, help='username, created, expiration, quota or usage; prefix with - for descending')
+@click.option('--status', type=click.Choice(['Online', 'Offline', 'Disabled']), help='Filter by status')
+@click.option('--query', '-q', type=str, help='Match username or note')
+def list_users(page: int | None, limit: int | None, sort: str | None, status: str | None, query: str | None):
+    try:
+        res = cli_api.list_users(page, limit, sort, status, query)
         if res:
             pretty_print(res)
         else:
@@ -146,6 +151,30 @@ def bulk_user_add(traffic_gb: float, expiration_days: int, count: int, prefix: s
     except Exception as e:
         click.echo(f'Error during bulk user addition: {e}', err=True)
 
+
+@cli.command('bulk-user-import')
+@click.option('--file', '-f', 'path', required=True, help='CSV (with header) or JSONL manifest of users.', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default='csv', help='Manifest format.')
+@click.option('--traffic-gb', '-t', help='Traffic limit in GB for rows that do not set one.', type=float)
+@click.option('--expiration-days', '-e', help='Expiration days for rows that do not set them.', type=int)
+@click.option('--unlimited', is_flag=True, default=False, help='Mark imported users as unlimited unless a row says otherwise.')
+def bulk_user_import(path: str, fmt: str, traffic_gb: float | None, expiration_days: int | None, unlimited: bool):
+    try:
+        click.echo(cli_api.bulk_user_import(path, fmt, traffic_gb, expiration_days, unlimited))
+    except Exception as e:
+        click.echo(f'Error during bulk user import: {e}', err=True)
+
+
+@cli.command('bulk-user-export')
+@click.option('--file', '-f', 'path', required=True, help='Destination file.', type=click.Path(dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default='csv', help='Export format.')
+def bulk_user_export(path: str, fmt: str):
+    try:
+        cli_api.bulk_user_export(path, fmt)
+        click.echo(f'Users exported to {path}.')
+    except Exception as e:
+        click.echo(f'Error during bulk user export: {e}', err=True)
+
 @cli.command('edit-user')
 @click.option('--username', '-u', required=True, help='Username for the user to edit', type=str)
 @click.option('--new-username', '-nu', required=False, help='New username for the user', type=str)
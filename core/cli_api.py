@@ -9,10 +9,12 @@ from dotenv import dotenv_values
 import re
 import secrets
 import string
+import sys
 
 import traffic
 
 DEBUG = False
+BACKEND = os.environ.get('CLI_API_BACKEND', 'inprocess')
 
 if os.name == 'nt' or not os.path.exists('/etc/hysteria'):
     BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -283,14 +285,122 @@ def set_hysteria2_config_file(data: dict[str, Any]):
 
 
 
-def list_users() -> dict[str, dict[str, Any]] | None:
-    if res := run_cmd(['python3', Command.LIST_USERS.value]):
-        return json.loads(res)
+class SubprocessBackend:
+    name = 'subprocess'
+
+    def list_users(self) -> list[dict[str, Any]] | None:
+        if res := run_cmd(['python3', Command.LIST_USERS.value]):
+            return json.loads(res)
+
+    def list_users_page(self, page: int, limit: int, sort: str | None, status: str | None, q: str | None) -> dict[str, Any] | None:
+        command = ['python3', Command.LIST_USERS.value, '--page', str(page), '--limit', str(limit)]
+        if sort:
+            command += ['--sort', sort]
+        if status:
+            command += ['--status', status]
+        if q:
+            command += ['--query', q]
+        if res := run_cmd(command):
+            return json.loads(res)
+
+    def get_user(self, username: str) -> dict[str, Any] | None:
+        if res := run_cmd(['python3', Command.GET_USER.value, '-u', str(username)]):
+            return json.loads(res)
+
+    def show_user_uri_json(self, usernames: list[str]) -> list[dict[str, Any]] | None:
+        script_path = Command.WRAPPER_URI.value
+        if not os.path.exists(script_path):
+            raise ScriptNotFoundError(f"Wrapper URI script not found at: {script_path}")
+        try:
+            process = subprocess.run(['python3', script_path, *usernames], capture_output=True, text=True, check=True)
+            return json.loads(process.stdout)
+        except subprocess.CalledProcessError as e:
+            raise CommandExecutionError(f"Failed to execute wrapper URI script: {e}\nError: {e.stderr}")
+        except FileNotFoundError:
+            raise ScriptNotFoundError(f'Script not found: {script_path}')
+        except json.JSONDecodeError:
+            raise CommandExecutionError(f"Failed to decode JSON output from script: {script_path}\nOutput: {process.stdout if 'process' in locals() else 'No output'}")
+        except Exception as e:
+            raise HysteriaError(f'An unexpected error occurred: {e}')
+
+
+class InProcessBackend:
+    name = 'inprocess'
+
+    def __init__(self):
+        hysteria2_dir = os.path.join(SCRIPT_DIR, 'hysteria2')
+        for path in (SCRIPT_DIR, hysteria2_dir):
+            if path not in sys.path:
+                sys.path.append(path)
+
+        from db.database import db
+        import list_users as list_users_script
+        import wrapper_uri as wrapper_uri_script
+
+        if db is None:
+            raise HysteriaError('Database connection is not available.')
+        self.db = db
+        self._list_users_script = list_users_script
+        self._wrapper_uri_script = wrapper_uri_script
+
+    def list_users(self) -> list[dict[str, Any]] | None:
+        return self._list_users_script.collect_users()
+
+    def list_users_page(self, page: int, limit: int, sort: str | None, status: str | None, q: str | None) -> dict[str, Any] | None:
+        try:
+            return self._list_users_script.query_users(page, limit, sort, status, q)
+        except ValueError as e:
+            raise InvalidInputError(str(e))
+
+    def get_user(self, username: str) -> dict[str, Any] | None:
+        user = self.db.get_user(str(username))
+        if not user:
+            raise CommandExecutionError(f"User '{username.lower()}' not found in the database.")
+        return user
+
+    def show_user_uri_json(self, usernames: list[str]) -> list[dict[str, Any]] | None:
+        try:
+            return self._wrapper_uri_script.process_users(usernames)
+        except self._wrapper_uri_script.UriGenerationError as e:
+            raise CommandExecutionError(f"Failed to generate user URIs: {e}")
+        except Exception as e:
+            raise HysteriaError(f'An unexpected error occurred: {e}')
+
+
+_backend = None
+
+
+def set_backend(name: str):
+    global _backend, BACKEND
+    BACKEND = name
+    _backend = None
+
+
+def get_backend() -> SubprocessBackend | InProcessBackend:
+    global _backend
+    if _backend is None:
+        if BACKEND == InProcessBackend.name:
+            try:
+                _backend = InProcessBackend()
+            except Exception as e:
+                if DEBUG:
+                    print(f"In-process backend unavailable, falling back to subprocess: {e}")
+                _backend = SubprocessBackend()
+        else:
+            _backend = SubprocessBackend()
+    return _backend
+
+
+def list_users(page: int | None = None, limit: int | None = None, sort: str | None = None,
+               status: str | None = None, q: str | None = None) -> list[dict[str, Any]] | dict[str, Any] | None:
+    # Any paging/filter argument switches to one page: {"users", "total", "page", "limit"}.
+    if all(value is None for value in (page, limit, sort, status, q)):
+        return get_backend().list_users()
+    return get_backend().list_users_page(page or 1, limit or 50, sort, status, q)
 
 
 def get_user(username: str) -> dict[str, Any] | None:
-    if res := run_cmd(['python3', Command.GET_USER.value, '-u', str(username)]):
-        return json.loads(res)
+    return get_backend().get_user(username)
 
 
 def add_user(username: str, traffic_limit: int, expiration_days: int, password: str | None, creation_date: str | None, unlimited: bool, note: str | None):
@@ -329,6 +439,22 @@ def bulk_user_add(traffic_gb: float, expiration_days: int, count: int, prefix: s
         
     run_cmd(command)
 
+
+def bulk_user_import(path: str, fmt: str, traffic_gb: float | None, expiration_days: int | None, unlimited: bool) -> str:
+    command = ['python3', Command.BULK_USER.value, '--import', path, '--format', fmt]
+    if traffic_gb is not None:
+        command += ['--traffic-gb', str(traffic_gb)]
+    if expiration_days is not None:
+        command += ['--expiration-days', str(expiration_days)]
+    if unlimited:
+        command.append('--unlimited')
+
+    return run_cmd(command)
+
+
+def bulk_user_export(path: str, fmt: str):
+    run_cmd(['python3', Command.BULK_USER.value, '--export', path, '--format', fmt])
+
 def edit_user(username: str, new_username: str | None, new_password: str | None, new_traffic_limit: int | None, new_expiration_days: int | None, renew_password: bool, renew_creation_date: bool, blocked: bool | None, unlimited_ip: bool | None, note: str | None):
     if not username:
         raise InvalidInputError('Error: username is required')
@@ -423,21 +549,8 @@ def show_user_uri(username: str, qrcode: bool, ipv: int, all: bool, singbox: boo
     return run_cmd(command_args)
 
 def show_user_uri_json(usernames: list[str]) -> list[dict[str, Any]] | None:
-    script_path = Command.WRAPPER_URI.value
-    if not os.path.exists(script_path):
-        raise ScriptNotFoundError(f"Wrapper URI script not found at: {script_path}")
-    try:
-        process = subprocess.run(['python3', script_path, *usernames], capture_output=True, text=True, check=True)
-        return json.loads(process.stdout)
-    except subprocess.CalledProcessError as e:
-        raise CommandExecutionError(f"Failed to execute wrapper URI script: {e}\nError: {e.stderr}")
-    except FileNotFoundError:
-        raise ScriptNotFoundError(f'Script not found: {script_path}')
-    except json.JSONDecodeError:
-        raise CommandExecutionError(f"Failed to decode JSON output from script: {script_path}\nOutput: {process.stdout if 'process' in locals() else 'No output'}")
-    except Exception as e:
-        raise HysteriaError(f'An unexpected error occurred: {e}')
-        
+    return get_backend().show_user_uri_json(usernames)
+
 
 
 
@@ -2,32 +2,228 @@ import asyncio
 import json
 import logging
 import os
-from datetime import datetime, timedelta
+import sys
+import time
 from aiohttp import web
-from pymongo import MongoClient
+from pymongo.errors import OperationFailure
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from db.async_database import AsyncDatabase, expiry_timestamp
 
 # Configuration
-MONGO_URI = "mongodb://localhost:27017/"
 DB_NAME = "blitz_panel"
 COLLECTION_NAME = "users"
 HOST = "127.0.0.1"
 PORT = 28262
+MONGO_POOL_SIZE = int(os.getenv("AUTH_MONGO_POOL_SIZE", "50"))
 
 # Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("AuthServer")
 
+CACHE_POLL_INTERVAL = float(os.getenv("AUTH_CACHE_POLL_INTERVAL", "15"))
+# Without change streams, blocks (which kick.py also sets for exhausted quota
+# and expiry) are picked up from the blocked_1 index at this shorter cadence.
+CACHE_BLOCKED_POLL_INTERVAL = float(os.getenv("AUTH_CACHE_BLOCKED_POLL_INTERVAL", "2"))
+CACHED_FIELDS = (
+    "password", "blocked", "unlimited_user", "expiration_days",
+    "account_creation_date", "max_download_bytes", "upload_bytes", "download_bytes", "expires_at"
+)
+EXPIRY_INPUTS = {"expiration_days", "account_creation_date", "expires_at"}
+RESET_OPERATIONS = ("drop", "rename", "dropDatabase", "invalidate")
+CACHE_PROJECTION = {field: 1 for field in CACHED_FIELDS}
+
 # MongoDB Client
-mongo_client = MongoClient(MONGO_URI)
-db = mongo_client[DB_NAME]
-users_collection = db[COLLECTION_NAME]
+users_db = AsyncDatabase(DB_NAME, COLLECTION_NAME, max_pool_size=MONGO_POOL_SIZE)
+
+
+class UserCache:
+    def __init__(self, database: AsyncDatabase, poll_interval: float = CACHE_POLL_INTERVAL,
+                 blocked_poll_interval: float = CACHE_BLOCKED_POLL_INTERVAL):
+        self.db = database
+        self.poll_interval = poll_interval
+        self.blocked_poll_interval = min(blocked_poll_interval, poll_interval)
+        self.users = {}
+        self.mode = "cold"
+        self.last_sync = 0.0
+        self.last_blocked_sync = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.changes_applied = 0
+        self._resume_token = None
+        self._task = None
+
+    @staticmethod
+    def _fill_expiry(entry):
+        # Writers store expires_at alongside the expiry fields; only documents
+        # that predate it need it computed here.
+        if "expires_at" not in entry:
+            entry["expires_at"] = expiry_timestamp(entry.get("account_creation_date"), entry.get("expiration_days", 0))
+
+    def _store(self, username, fields):
+        entry = {field: fields[field] for field in CACHED_FIELDS if field in fields}
+        self._fill_expiry(entry)
+        self.users[username] = entry
+        return entry
+
+    def _apply_update(self, username, updated_fields, removed_fields):
+        entry = self.users.get(username)
+        if entry is None:
+            return False
+        for field, value in updated_fields.items():
+            if field in CACHED_FIELDS:
+                entry[field] = value
+        for field in removed_fields:
+            entry.pop(field, None)
+        if "expires_at" not in updated_fields and EXPIRY_INPUTS.intersection(updated_fields, removed_fields):
+            entry.pop("expires_at", None)
+        self._fill_expiry(entry)
+        return True
+
+    async def warm(self):
+        users = {}
+        async for doc in self.db.collection.find({}, CACHE_PROJECTION):
+            users[doc["_id"]] = doc
+        self.users = {}
+        for username, doc in users.items():
+            self._store(username, doc)
+        self.last_sync = time.time()
+        logger.info(f"User cache warmed with {len(self.users)} users")
+
+    async def get(self, username):
+        entry = self.users.get(username)
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        doc = await self.db.collection.find_one({"_id": username}, CACHE_PROJECTION)
+        if not doc:
+            return None
+        return self._store(username, doc)
+
+    def start(self):
+        self._task = asyncio.create_task(self._sync_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _sync_loop(self):
+        while True:
+            try:
+                await self._watch_changes()
+            except OperationFailure as e:
+                if self._resume_token is not None:
+                    # The resume point fell off the oplog; start over from a
+                    # fresh snapshot.
+                    logger.info(f"Could not resume user change stream ({e}), reloading the cache")
+                    self._resume_token = None
+                    continue
+                # Change streams need a replica set; a standalone mongod
+                # rejects them, so fall back to periodic reloads.
+                logger.info(f"Change streams unavailable ({e}), polling every {self.poll_interval}s")
+                await self._poll_changes()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"User cache sync failed: {e}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _watch_changes(self):
+        # The stream is opened before the snapshot is taken, so a write that
+        # lands while warm() runs is replayed from the stream afterwards. A
+        # reconnect resumes from the last token instead of reloading.
+        async with await self.db.collection.watch(max_await_time_ms=1000, resume_after=self._resume_token) as stream:
+            self.mode = "change_stream"
+            if self._resume_token is None:
+                await self.warm()
+            while stream.alive:
+                change = await stream.try_next()
+                self.last_sync = time.time()
+                if change is not None:
+                    await self._apply_change(change)
+                    if change.get("operationType") in RESET_OPERATIONS:
+                        # The stream cannot be resumed past these; reopen it
+                        # and take a new snapshot.
+                        self._resume_token = None
+                        return
+                self._resume_token = stream.resume_token
+
+    async def _apply_change(self, change):
+        operation = change.get("operationType")
+        username = change.get("documentKey", {}).get("_id")
+        if operation in ("insert", "replace"):
+            self._store(username, change.get("fullDocument") or {})
+        elif operation == "update":
+            description = change.get("updateDescription", {})
+            if not self._apply_update(username, description.get("updatedFields", {}), description.get("removedFields", [])):
+                doc = await self.db.collection.find_one({"_id": username}, CACHE_PROJECTION)
+                if doc:
+                    self._store(username, doc)
+        elif operation == "delete":
+            self.users.pop(username, None)
+        elif operation in RESET_OPERATIONS:
+            self.users = {}
+        self.changes_applied += 1
+
+    async def _poll_blocked(self):
+        blocked = set()
+        async for doc in self.db.collection.find({"blocked": True}, {"_id": 1}):
+            blocked.add(doc["_id"])
+        for username, entry in self.users.items():
+            is_blocked = username in blocked
+            if bool(entry.get("blocked")) != is_blocked:
+                entry["blocked"] = is_blocked
+                self.changes_applied += 1
+        self.last_blocked_sync = time.time()
+
+    async def _poll_changes(self):
+        # Full reloads catch every field; in between, the indexed blocked
+        # query keeps blocks current.
+        self.mode = "polling"
+        next_reload = time.monotonic()
+        while True:
+            await asyncio.sleep(self.blocked_poll_interval)
+            try:
+                if time.monotonic() >= next_reload:
+                    next_reload = time.monotonic()
+                    await self.warm()
+                    self.last_blocked_sync = self.last_sync
+                else:
+                    await self._poll_blocked()
+            except Exception as e:
+                logger.error(f"User cache reload failed: {e}")
+
+    def metrics(self):
+        lookups = self.hits + self.misses
+        metrics = {
+            "mode": self.mode,
+            "users": len(self.users),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "changes_applied": self.changes_applied,
+            "staleness_seconds": round(time.time() - self.last_sync, 3) if self.last_sync else None,
+        }
+        if self.mode == "polling":
+            metrics["poll_interval_seconds"] = self.poll_interval
+            metrics["blocked_poll_interval_seconds"] = self.blocked_poll_interval
+            metrics["blocked_staleness_seconds"] = (
+                round(time.time() - self.last_blocked_sync, 3) if self.last_blocked_sync else None
+            )
+        return metrics
+
+
+user_cache = UserCache(users_db)
 
 async def check_user(username, password):
-    loop = asyncio.get_running_loop()
-    def query():
-        return users_collection.find_one({"_id": username})
-    
-    user = await loop.run_in_executor(None, query)
+    user = await user_cache.get(username)
     
     if not user:
         return False, "User not found"
@@ -43,17 +239,9 @@ async def check_user(username, password):
          return True, "Unlimited user"
 
     # Expiration Check
-    expiration_days = user.get("expiration_days", 0)
-    if expiration_days > 0:
-        creation_date_str = user.get("account_creation_date")
-        if creation_date_str:
-            try:
-                creation_date = datetime.strptime(creation_date_str, "%Y-%m-%d")
-                expiration_date = creation_date + timedelta(days=expiration_days)
-                if datetime.now() >= expiration_date:
-                    return False, "Account expired"
-            except ValueError:
-                pass 
+    expires_at = user.get("expires_at")
+    if expires_at is not None and time.time() >= expires_at:
+        return False, "Account expired"
 
     # Traffic Check
     max_bytes = user.get("max_download_bytes", 0)
@@ -89,8 +277,24 @@ async def auth_handler(request):
         logger.error(f"Error handling auth: {e}")
         return web.json_response({"ok": False, "msg": "Internal Error"}, status=500)
 
+async def metrics_handler(request):
+    return web.json_response(user_cache.metrics())
+
+async def on_startup(app):
+    try:
+        await users_db.connect()
+    except Exception as e:
+        logger.error(f"MongoDB is not reachable at startup: {e}")
+    user_cache.start()
+
+async def on_cleanup(app):
+    await user_cache.stop()
+    await users_db.close()
+
 app = web.Application()
-app.add_routes([web.post('/auth', auth_handler)])
+app.add_routes([web.post('/auth', auth_handler), web.get('/metrics', metrics_handler)])
+app.on_startup.append(on_startup)
+app.on_cleanup.append(on_cleanup)
 
 if __name__ == '__main__':
     print(f"Starting Auth Server on {HOST}:{PORT}")
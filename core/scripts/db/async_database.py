@@ -0,0 +1,148 @@
+from datetime import datetime, timezone
+import pymongo
+from pymongo import AsyncMongoClient
+from pymongo.errors import DuplicateKeyError
+
+try:
+    from .mongo_common import (
+        MONGO_URI, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, USER_INDEXES, TOTALS_PIPELINE,
+        build_update_ops, expiry_timestamp, index_fallback_warning, totals_from,
+    )
+except ImportError:
+    # Imported as a top-level module with the db directory on sys.path.
+    from mongo_common import (
+        MONGO_URI, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, USER_INDEXES, TOTALS_PIPELINE,
+        build_update_ops, expiry_timestamp, index_fallback_warning, totals_from,
+    )
+
+INGEST_BATCH_COLLECTION = "ingest_batches"
+INGEST_BATCH_TTL = 3600
+# Raised for transactions on a standalone mongod.
+ILLEGAL_OPERATION = 20
+
+class AsyncDatabase:
+    def __init__(self, db_name="blitz_panel", collection_name="users", max_pool_size=MONGO_MAX_POOL_SIZE, min_pool_size=MONGO_MIN_POOL_SIZE):
+        self.db_name = db_name
+        self.collection_name = collection_name
+        self.max_pool_size = max_pool_size
+        self.min_pool_size = min_pool_size
+        self.client = None
+        self.db = None
+        self._collection = None
+        self._transactions_supported = True
+
+    @property
+    def collection(self):
+        # The client binds to the running event loop on first use, so it is
+        # created lazily instead of at import time.
+        if self._collection is None:
+            self.client = AsyncMongoClient(MONGO_URI, maxPoolSize=self.max_pool_size, minPoolSize=self.min_pool_size)
+            self.db = self.client[self.db_name]
+            self._collection = self.db[self.collection_name]
+        return self._collection
+
+    async def connect(self):
+        try:
+            await self.collection.database.client.server_info()
+        except pymongo.errors.ConnectionFailure as e:
+            print(f"Could not connect to MongoDB: {e}")
+            raise
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.close()
+        self.client = None
+        self.db = None
+        self._collection = None
+
+    async def add_user(self, user_data):
+        username = user_data.pop('username', None)
+        if not username:
+            raise ValueError("Username is required")
+
+        if await self.collection.find_one({"_id": username.lower()}):
+            return None
+
+        user_data['_id'] = username.lower()
+        return await self.collection.insert_one(user_data)
+
+    async def get_user(self, username, projection=None):
+        return await self.collection.find_one({"_id": username.lower()}, projection)
+
+    async def get_all_users(self, projection=None):
+        return await self.collection.find({}, projection).to_list(None)
+
+    async def get_users(self, usernames, projection=None):
+        names = list({username.lower() for username in usernames})
+        return await self.collection.find({"_id": {"$in": names}}, projection).to_list(None)
+
+    async def user_totals(self):
+        totals = await (await self.collection.aggregate(TOTALS_PIPELINE)).to_list(1)
+        return totals_from(totals[0] if totals else None)
+
+    async def update_user(self, username, updates):
+        return await self.collection.update_one({"_id": username.lower()}, {"$set": updates})
+
+    async def delete_user(self, username):
+        return await self.collection.delete_one({"_id": username.lower()})
+
+    async def delete_users(self, usernames):
+        return await self.collection.delete_many({"_id": {"$in": usernames}})
+
+    async def bulk_update_users(self, updates, batch_size=1000):
+        return await self._bulk_write(build_update_ops(updates), batch_size)
+
+    async def _bulk_write(self, ops, batch_size, session=None):
+        matched, modified = 0, 0
+        for i in range(0, len(ops), batch_size):
+            result = await self.collection.bulk_write(ops[i:i + batch_size], ordered=False, session=session)
+            matched += result.matched_count
+            modified += result.modified_count
+        return len(ops), matched, modified
+
+    async def apply_batch(self, batch_key, source, updates, batch_size=1000):
+        """Apply an ingest batch once; returns None if it was already processed.
+
+        On a replica set the ingest_batches record and the user updates commit
+        in one transaction. A standalone mongod has no transactions, so the
+        record is written first and a batch that fails part way is not
+        applied again on retry (at-most-once). Records expire after
+        INGEST_BATCH_TTL seconds.
+        """
+        ops = build_update_ops(updates)
+        batches = self.collection.database[INGEST_BATCH_COLLECTION]
+        record = {"_id": batch_key, "source": source, "created_at": datetime.now(timezone.utc)}
+
+        async def apply(session=None):
+            await batches.insert_one(record, session=session)
+            return await self._bulk_write(ops, batch_size, session)
+
+        try:
+            if self._transactions_supported:
+                try:
+                    async with self.client.start_session() as session:
+                        return await session.with_transaction(apply)
+                except pymongo.errors.OperationFailure as e:
+                    if e.code != ILLEGAL_OPERATION:
+                        raise
+                    self._transactions_supported = False
+            return await apply()
+        except DuplicateKeyError:
+            return None
+
+    async def ensure_indexes(self):
+        for keys, options, fallback in USER_INDEXES:
+            try:
+                await self.collection.create_index(keys, **options)
+            except pymongo.errors.OperationFailure as e:
+                if fallback is None:
+                    raise
+                index_fallback_warning(options, e)
+                if options["name"] not in await self.collection.index_information():
+                    await self.collection.create_index(keys, **fallback)
+
+        await self.collection.database[INGEST_BATCH_COLLECTION].create_index(
+            "created_at", expireAfterSeconds=INGEST_BATCH_TTL, name="created_at_ttl"
+        )
+
+async_db = AsyncDatabase()
@@ -0,0 +1,286 @@
+import csv
+import io
+import json
+import re
+import secrets
+import string
+import time
+from datetime import datetime
+from itertools import islice
+from pymongo.errors import BulkWriteError
+
+CHUNK_SIZE = 1000
+MAX_ERRORS = 1000
+FORMATS = ("csv", "jsonl")
+DUPLICATE_KEY = 11000
+USERNAME_RE = re.compile(r"^[a-zA-Z0-9_]+$")
+DATE_RE = re.compile(r"^[0-9]{4}-[0-9]{2}-[0-9]{2}$")
+EXPORT_FIELDS = [
+    "username", "password", "max_download_bytes", "expiration_days", "account_creation_date",
+    "blocked", "unlimited_user", "status", "note", "upload_bytes", "download_bytes",
+]
+EXPORT_PROJECTION = {field: 1 for field in EXPORT_FIELDS if field != "username"}
+# Exported so that export -> import carries usage over.
+USAGE_FIELDS = ("upload_bytes", "download_bytes")
+
+
+class BulkProgress:
+    """Live counters for one import; safe to read while the import runs."""
+
+    def __init__(self, max_errors=MAX_ERRORS):
+        self.max_errors = max_errors
+        self.started_at = time.time()
+        self.finished_at = None
+        self.processed = 0
+        self.inserted = 0
+        self.skipped = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, row, username, message, skipped=False):
+        if skipped:
+            self.skipped += 1
+        else:
+            self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": row, "username": username, "error": message})
+
+    def finish(self):
+        self.finished_at = time.time()
+
+    def as_dict(self):
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "processed": self.processed,
+            "inserted": self.inserted,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "elapsed": round(elapsed, 3),
+            "rows_per_second": round(self.processed / elapsed, 1) if elapsed > 0 else 0.0,
+            "errors": self.errors,
+        }
+
+
+def generate_password():
+    alphabet = string.ascii_letters + string.digits
+    return ''.join(secrets.choice(alphabet) for _ in range(32))
+
+
+def generate_rows(prefix, start_number, count):
+    for i in range(count):
+        yield {"username": f"{prefix}{start_number + i}"}
+
+
+def read_manifest(lines, fmt):
+    """
+    Lazily turn CSV (with a header row) or JSON lines into row dicts. A JSON
+    line that does not parse is yielded as a ValueError so it is reported
+    against its row instead of stopping the import.
+    """
+    if fmt == "csv":
+        yield from csv.DictReader(lines)
+    elif fmt == "jsonl":
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield ValueError(f"Invalid JSON: {e}")
+    else:
+        raise ValueError(f"Unsupported format '{fmt}'. Use one of: {', '.join(FORMATS)}.")
+
+
+def _field(row, defaults, key):
+    value = row.get(key)
+    if value is None or value == "":
+        value = defaults.get(key)
+    return value
+
+
+def _flag(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y")
+    return bool(value)
+
+
+def build_user_doc(row, defaults, today, expiry):
+    if isinstance(row, Exception):
+        raise row
+    if not isinstance(row, dict):
+        raise ValueError("Row must be an object.")
+
+    username = str(row.get("username") or "").strip()
+    if not USERNAME_RE.match(username):
+        raise ValueError("Username can only contain letters, numbers, and underscores.")
+
+    try:
+        if row.get("max_download_bytes") not in (None, ""):
+            traffic_bytes = int(row["max_download_bytes"])
+        else:
+            traffic_gb = _field(row, defaults, "traffic_gb")
+            if traffic_gb is None:
+                raise ValueError("Missing traffic_gb.")
+            traffic_bytes = int(float(traffic_gb) * 1073741824)
+        expiration_days = _field(row, defaults, "expiration_days")
+        if expiration_days is None:
+            raise ValueError("Missing expiration_days.")
+        expiration_days = int(expiration_days)
+        usage = {field: int(row[field]) for field in USAGE_FIELDS if row.get(field) not in (None, "")}
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Traffic limit, expiration days and usage must be numeric ({e}).")
+    if any(value < 0 for value in usage.values()):
+        raise ValueError("Usage counters cannot be negative.")
+
+    # Generated rows and manifests without the column start today; an
+    # explicit empty date keeps the user on hold until first connection.
+    if "account_creation_date" in row:
+        creation_date = str(row["account_creation_date"] or "").strip() or None
+    else:
+        creation_date = today
+    if creation_date is not None:
+        if not DATE_RE.match(creation_date):
+            raise ValueError("Invalid date format. Expected YYYY-MM-DD.")
+        datetime.strptime(creation_date, "%Y-%m-%d")
+    status = str(row.get("status") or "").strip() or ("Offline" if creation_date else "On-hold")
+
+    doc = {
+        "_id": username.lower(),
+        "password": str(row.get("password") or generate_password()),
+        "max_download_bytes": traffic_bytes,
+        "expiration_days": expiration_days,
+        "blocked": _flag(row.get("blocked", False)),
+        "unlimited_user": _flag(_field(row, defaults, "unlimited_user") or False),
+        "status": status,
+        "account_creation_date": creation_date,
+        "expires_at": expiry(creation_date, expiration_days) if creation_date else None,
+    }
+    if row.get("note"):
+        doc["note"] = str(row["note"])
+    doc.update(usage)
+    return doc
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def prepare_chunk(chunk, defaults, today, expiry, progress):
+    # Returns the documents to insert and, per document, its manifest row number.
+    docs, rows = [], []
+    for row_number, row in chunk:
+        progress.processed += 1
+        try:
+            docs.append(build_user_doc(row, defaults, today, expiry))
+            rows.append(row_number)
+        except ValueError as e:
+            username = row.get("username") if isinstance(row, dict) else None
+            progress.error(row_number, username, str(e))
+    return docs, rows
+
+
+def duplicate_of_password(error):
+    # The unique password_1 index raises the same 11000 as a duplicate _id.
+    key_pattern = error.get("keyPattern")
+    if key_pattern:
+        return "password" in key_pattern
+    return "password_1" in error.get("errmsg", "")
+
+
+def record_write_errors(details, docs, rows, progress):
+    progress.inserted += details.get("nInserted", 0)
+    for error in details.get("writeErrors", []):
+        index = error["index"]
+        if error.get("code") == DUPLICATE_KEY and duplicate_of_password(error):
+            progress.error(rows[index], docs[index]["_id"], "Password is already used by another user.")
+        elif error.get("code") == DUPLICATE_KEY:
+            progress.error(rows[index], docs[index]["_id"], "User already exists.", skipped=True)
+        else:
+            progress.error(rows[index], docs[index]["_id"], error.get("errmsg", "Write failed."))
+
+
+class BulkImporter:
+    def __init__(self, db, expiry, chunk_size=CHUNK_SIZE):
+        self.db = db
+        self.expiry = expiry
+        self.chunk_size = chunk_size
+
+    def run(self, rows, defaults=None, progress=None):
+        progress = progress or BulkProgress()
+        today = datetime.now().strftime("%Y-%m-%d")
+        for chunk in chunked(enumerate(rows, 1), self.chunk_size):
+            docs, row_numbers = prepare_chunk(chunk, defaults or {}, today, self.expiry, progress)
+            if not docs:
+                continue
+            try:
+                self.db.collection.insert_many(docs, ordered=False)
+                progress.inserted += len(docs)
+            except BulkWriteError as e:
+                record_write_errors(e.details, docs, row_numbers, progress)
+        progress.finish()
+        return progress
+
+
+class AsyncBulkImporter:
+    # Each chunk is awaited before the next is read, which is what bounds memory.
+
+    def __init__(self, db, expiry, chunk_size=CHUNK_SIZE):
+        self.db = db
+        self.expiry = expiry
+        self.chunk_size = chunk_size
+
+    async def run(self, rows, defaults=None, progress=None):
+        progress = progress or BulkProgress()
+        today = datetime.now().strftime("%Y-%m-%d")
+        for chunk in chunked(enumerate(rows, 1), self.chunk_size):
+            docs, row_numbers = prepare_chunk(chunk, defaults or {}, today, self.expiry, progress)
+            if not docs:
+                continue
+            try:
+                await self.db.collection.insert_many(docs, ordered=False)
+                progress.inserted += len(docs)
+            except BulkWriteError as e:
+                record_write_errors(e.details, docs, row_numbers, progress)
+        progress.finish()
+        return progress
+
+
+def export_header(fmt):
+    if fmt == "csv":
+        return ",".join(EXPORT_FIELDS) + "\r\n"
+    return ""
+
+
+def export_rows(docs, fmt):
+    rows = [{"username": doc["_id"], **{field: doc.get(field) for field in EXPORT_FIELDS[1:]}} for doc in docs]
+    if fmt == "jsonl":
+        return "".join(json.dumps(row) + "\n" for row in rows)
+    buffer = io.StringIO()
+    csv.DictWriter(buffer, EXPORT_FIELDS).writerows(rows)
+    return buffer.getvalue()
+
+
+def iter_export(db, fmt, chunk_size=CHUNK_SIZE):
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format '{fmt}'. Use one of: {', '.join(FORMATS)}.")
+    yield export_header(fmt)
+    cursor = db.collection.find({}, EXPORT_PROJECTION).sort("_id", 1).batch_size(chunk_size)
+    for docs in chunked(cursor, chunk_size):
+        yield export_rows(docs, fmt)
+
+
+async def aiter_export(db, fmt, chunk_size=CHUNK_SIZE):
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format '{fmt}'. Use one of: {', '.join(FORMATS)}.")
+    yield export_header(fmt)
+    docs = []
+    async for doc in db.collection.find({}, EXPORT_PROJECTION).sort("_id", 1).batch_size(chunk_size):
+        docs.append(doc)
+        if len(docs) >= chunk_size:
+            yield export_rows(docs, fmt)
+            docs = []
+    if docs:
+        yield export_rows(docs, fmt)
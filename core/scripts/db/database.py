@@ -1,13 +1,26 @@
 import pymongo
 from bson.objectid import ObjectId
 
+try:
+    from .mongo_common import (
+        MONGO_URI, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, USER_INDEXES, TOTALS_PIPELINE,
+        build_update_ops, expiry_timestamp, index_fallback_warning, totals_from,
+    )
+except ImportError:
+    # Imported as a top-level module with the db directory on sys.path.
+    from mongo_common import (
+        MONGO_URI, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, USER_INDEXES, TOTALS_PIPELINE,
+        build_update_ops, expiry_timestamp, index_fallback_warning, totals_from,
+    )
+
 class Database:
-    def __init__(self, db_name="blitz_panel", collection_name="users"):
+    def __init__(self, db_name="blitz_panel", collection_name="users", max_pool_size=MONGO_MAX_POOL_SIZE, min_pool_size=MONGO_MIN_POOL_SIZE):
         try:
-            self.client = pymongo.MongoClient("mongodb://localhost:27017/")
+            self.client = pymongo.MongoClient(MONGO_URI, maxPoolSize=max_pool_size, minPoolSize=min_pool_size)
             self.db = self.client[db_name]
             self.collection = self.db[collection_name]
             self.client.server_info()
+            self._expiry_indexes_ready = False
         except pymongo.errors.ConnectionFailure as e:
             print(f"Could not connect to MongoDB: {e}")
             raise
@@ -23,11 +36,29 @@ class Database:
         user_data['_id'] = username.lower()
         return self.collection.insert_one(user_data)
 
-    def get_user(self, username):
-        return self.collection.find_one({"_id": username.lower()})
+    def get_user(self, username, projection=None):
+        return self.collection.find_one({"_id": username.lower()}, projection)
+
+    def get_all_users(self, projection=None):
+        return list(self.collection.find({}, projection))
 
-    def get_all_users(self):
-        return list(self.collection.find({}))
+    def get_users(self, usernames, projection=None):
+        names = list({username.lower() for username in usernames})
+        return list(self.collection.find({"_id": {"$in": names}}, projection))
+
+    def page_users(self, query, sort, skip, limit, projection=None, add_fields=None):
+        total = self.collection.count_documents(query)
+        pipeline = [{"$match": query}]
+        if add_fields:
+            pipeline.append({"$addFields": add_fields})
+        pipeline += [{"$sort": sort}, {"$skip": skip}, {"$limit": limit}]
+        if projection:
+            pipeline.append({"$project": projection})
+        # Sorts on computed fields run in memory and may exceed its 100MB limit.
+        return list(self.collection.aggregate(pipeline, allowDiskUse=True)), total
+
+    def user_totals(self):
+        return totals_from(next(self.collection.aggregate(TOTALS_PIPELINE), None))
 
     def update_user(self, username, updates):
         return self.collection.update_one({"_id": username.lower()}, {"$set": updates})
@@ -38,6 +69,82 @@ class Database:
     def delete_users(self, usernames):
         return self.collection.delete_many({"_id": {"$in": usernames}})
 
+    def bulk_update_users(self, updates, batch_size=1000):
+        ops = build_update_ops(updates)
+
+        matched, modified = 0, 0
+        for i in range(0, len(ops), batch_size):
+            result = self.collection.bulk_write(ops[i:i + batch_size], ordered=False)
+            matched += result.matched_count
+            modified += result.modified_count
+        return len(ops), matched, modified
+
+    def ensure_indexes(self):
+        for keys, options, fallback in USER_INDEXES:
+            try:
+                self.collection.create_index(keys, **options)
+            except pymongo.errors.OperationFailure as e:
+                if fallback is None:
+                    raise
+                index_fallback_warning(options, e)
+                if options["name"] not in self.collection.index_information():
+                    self.collection.create_index(keys, **fallback)
+
+    def ensure_expiry_indexes(self):
+        # Indexes are created once per connection; the backfill is cheap and
+        # reruns on every call so documents restored or imported without
+        # expires_at are picked up.
+        if not self._expiry_indexes_ready:
+            self.ensure_indexes()
+            self._expiry_indexes_ready = True
+        return self.backfill_expires_at()
+
+    def backfill_expires_at(self):
+        missing = self.collection.find(
+            {"expires_at": {"$exists": False}},
+            {"account_creation_date": 1, "expiration_days": 1}
+        )
+        ops = [
+            pymongo.UpdateOne(
+                {"_id": doc["_id"], "expires_at": {"$exists": False}},
+                {"$set": {"expires_at": expiry_timestamp(doc.get("account_creation_date"), doc.get("expiration_days", 0))}}
+            )
+            for doc in missing
+        ]
+        if ops:
+            self.collection.bulk_write(ops, ordered=False)
+        return len(ops)
+
+    def find_users_to_block(self, now_ts):
+        self.backfill_expires_at()
+        projection = {"online_count": 1, "status": 1}
+        expired_by_date = self.collection.find(
+            {"expires_at": {"$ne": None, "$lte": now_ts}, "blocked": {"$ne": True}},
+            projection
+        )
+        expired_by_traffic = self.collection.find(
+            {
+                "max_download_bytes": {"$gt": 0},
+                "blocked": {"$ne": True},
+                "account_creation_date": {"$ne": None},
+                "$expr": {"$gte": [
+                    {"$add": [{"$ifNull": ["$upload_bytes", 0]}, {"$ifNull": ["$download_bytes", 0]}]},
+                    "$max_download_bytes"
+                ]}
+            },
+            projection
+        )
+        users = {doc["_id"]: doc for doc in expired_by_date}
+        for doc in expired_by_traffic:
+            users.setdefault(doc["_id"], doc)
+        return list(users.values())
+
+    def block_users(self, usernames, extra_updates=None):
+        updates = {"blocked": True}
+        if extra_updates:
+            updates.update(extra_updates)
+        return self.collection.update_many({"_id": {"$in": usernames}}, {"$set": updates})
+
 try:
     db = Database()
 except pymongo.errors.ConnectionFailure:
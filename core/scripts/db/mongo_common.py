@@ -0,0 +1,74 @@
+import os
+from datetime import datetime, timedelta
+import pymongo
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+
+# Indexes every service relies on; created idempotently at startup as
+# (keys, options, fallback options). Duplicate passwords (or an older
+# non-unique index) must not keep a service from starting, so the unique
+# password index falls back to a plain lookup index.
+USER_INDEXES = [
+    ([("blocked", pymongo.ASCENDING)], {"name": "blocked_1"}, None),
+    ([("status", pymongo.ASCENDING)], {"name": "status_1"}, None),
+    ([("expires_at", pymongo.ASCENDING)], {"name": "expires_at_1"}, None),
+    ([("max_download_bytes", pymongo.ASCENDING), ("blocked", pymongo.ASCENDING)], {"name": "max_download_bytes_1_blocked_1"}, None),
+    ([("note", pymongo.TEXT)], {"name": "note_text", "default_language": "none"}, None),
+    # Serve the paged user list's created/expiration/quota sorts (with the
+    # _id tiebreaker) without an in-memory sort.
+    ([("account_creation_date", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)], {"name": "account_creation_date_1__id_1"}, None),
+    ([("expires_at", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)], {"name": "expires_at_1__id_1"}, None),
+    ([("max_download_bytes", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)], {"name": "max_download_bytes_1__id_1"}, None),
+    (
+        [("password", pymongo.ASCENDING)],
+        {"name": "password_1", "unique": True, "partialFilterExpression": {"password": {"$type": "string"}}},
+        {"name": "password_1"},
+    ),
+]
+TOTALS_PIPELINE = [
+    {"$group": {
+        "_id": None,
+        "online": {"$sum": {"$ifNull": ["$online_count", 0]}},
+        "upload": {"$sum": {"$ifNull": ["$upload_bytes", 0]}},
+        "download": {"$sum": {"$ifNull": ["$download_bytes", 0]}},
+    }},
+]
+
+
+def expiry_timestamp(account_creation_date, expiration_days):
+    # Malformed documents (e.g. expiration_days stored as a string) yield
+    # None instead of raising, so one bad user cannot abort a batch.
+    try:
+        expiration_days = int(expiration_days or 0)
+        if not account_creation_date or expiration_days <= 0:
+            return None
+        creation_date = datetime.strptime(account_creation_date, "%Y-%m-%d")
+        return (creation_date + timedelta(days=expiration_days)).timestamp()
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+
+def totals_from(doc):
+    doc = doc or {}
+    return {key: int(doc.get(key) or 0) for key in ("online", "upload", "download")}
+
+
+def build_update_ops(updates):
+    # updates is an iterable of (username, set_fields, inc_fields).
+    ops = []
+    for username, set_fields, inc_fields in updates:
+        update_doc = {}
+        if set_fields:
+            update_doc["$set"] = set_fields
+        if inc_fields:
+            update_doc["$inc"] = inc_fields
+        if not update_doc:
+            continue
+        ops.append(pymongo.UpdateOne({"_id": username.lower()}, update_doc))
+    return ops
+
+
+def index_fallback_warning(options, error):
+    print(f"Warning: Could not create index {options['name']}, falling back to a plain index: {error}")
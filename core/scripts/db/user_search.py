@@ -0,0 +1,142 @@
+import re
+import time
+from collections import OrderedDict
+from pymongo.errors import OperationFailure
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 50
+SEARCH_PROJECTION = {
+    "password": 1, "max_download_bytes": 1, "expiration_days": 1, "account_creation_date": 1,
+    "blocked": 1, "unlimited_user": 1, "note": 1, "status": 1,
+    "upload_bytes": 1, "download_bytes": 1, "online_count": 1,
+}
+
+
+class SearchCache:
+    def __init__(self, maxsize=256, ttl=10.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        results, expires = entry
+        if expires < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return [dict(doc) for doc in results]
+
+    def set(self, key, results):
+        # Copies on the way in and out, so callers can modify what they get.
+        self._data[key] = ([dict(doc) for doc in results], time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+
+def normalize(query, limit):
+    query = (query or "").strip().lower().replace("\\_", "_")
+    limit = max(1, min(int(limit or DEFAULT_LIMIT), MAX_LIMIT))
+    return query, limit
+
+
+def text_phrase(query):
+    # Quoted as one phrase so "-" and '"' in user input are not read as
+    # negation or phrase operators.
+    return '"' + query.replace('"', ' ') + '"'
+
+
+def search_plan(query, blocked=False):
+    """
+    Return (filter, sort) steps in priority order.
+
+    Usernames are stored lowercase, so an anchored regex on _id is an index
+    range scan; notes are matched word-wise through the note_text index.
+    With blocked=True the query is ignored and blocked users are listed
+    through the blocked index.
+    """
+    if blocked:
+        return [({"blocked": True}, [("_id", 1)])]
+    return [
+        ({"_id": {"$regex": f"^{re.escape(query)}"}}, [("_id", 1)]),
+        ({"$text": {"$search": text_phrase(query)}}, None),
+    ]
+
+
+def finish(doc):
+    doc["username"] = doc.pop("_id")
+    doc.pop("score", None)
+    return doc
+
+
+class UserSearch:
+    def __init__(self, db, cache_size=256, cache_ttl=10.0):
+        self.db = db
+        self.cache = SearchCache(cache_size, cache_ttl)
+
+    def search(self, query, limit=DEFAULT_LIMIT, blocked=False):
+        query, limit = normalize(query, limit)
+        if not query:
+            return []
+        cached = self.cache.get((query, limit, blocked))
+        if cached is not None:
+            return cached
+
+        results, seen = [], set()
+        for filter_doc, sort in search_plan(query, blocked):
+            if seen and "$text" in filter_doc:
+                filter_doc = {**filter_doc, "_id": {"$nin": list(seen)}}
+            cursor = self.db.collection.find(filter_doc, SEARCH_PROJECTION)
+            if sort:
+                cursor = cursor.sort(sort)
+            try:
+                for doc in cursor.limit(limit - len(results)):
+                    seen.add(doc["_id"])
+                    results.append(finish(doc))
+            except OperationFailure:
+                # No note_text index yet (ensure_indexes has not run).
+                continue
+            if len(results) >= limit:
+                break
+
+        self.cache.set((query, limit, blocked), results)
+        return results
+
+
+class AsyncUserSearch:
+    def __init__(self, db, cache_size=256, cache_ttl=10.0):
+        self.db = db
+        self.cache = SearchCache(cache_size, cache_ttl)
+
+    async def search(self, query, limit=DEFAULT_LIMIT, blocked=False):
+        query, limit = normalize(query, limit)
+        if not query:
+            return []
+        cached = self.cache.get((query, limit, blocked))
+        if cached is not None:
+            return cached
+
+        results, seen = [], set()
+        for filter_doc, sort in search_plan(query, blocked):
+            if seen and "$text" in filter_doc:
+                filter_doc = {**filter_doc, "_id": {"$nin": list(seen)}}
+            cursor = self.db.collection.find(filter_doc, SEARCH_PROJECTION)
+            if sort:
+                cursor = cursor.sort(sort)
+            try:
+                async for doc in cursor.limit(limit - len(results)):
+                    seen.add(doc["_id"])
+                    results.append(finish(doc))
+            except OperationFailure:
+                continue
+            if len(results) >= limit:
+                break
+
+        self.cache.set((query, limit, blocked), results)
+        return results
@@ -5,7 +5,7 @@ import re
 import secrets
 import string
 from datetime import datetime
-from db.database import db
+from db.database import db, expiry_timestamp
 
 def add_user(username, traffic_gb, expiration_days, password=None, unlimited_user=False, note=None, creation_date=None):
     if not username or not traffic_gb or not expiration_days:
@@ -49,7 +49,8 @@ def add_user(username, traffic_gb, expiration_days, password=None, unlimited_use
             "blocked": False,
             "unlimited_user": unlimited_user,
             "status": "Offline",
-            "account_creation_date": creation_date
+            "account_creation_date": creation_date,
+            "expires_at": expiry_timestamp(creation_date, expiration_days)
         }
         
         if note:
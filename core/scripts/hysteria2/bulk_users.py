@@ -2,84 +2,103 @@ import init_paths
 import sys
 import argparse
 import re
-import secrets
-import string
-from datetime import datetime
-from db.database import db
+from contextlib import nullcontext
+from db.database import db, expiry_timestamp
+from db.bulk_import import BulkImporter, FORMATS, generate_rows, iter_export, read_manifest
+
+
+def print_summary(progress):
+    summary = progress.as_dict()
+    print(f"\nProcessed {summary['processed']} rows in {summary['elapsed']}s ({summary['rows_per_second']} rows/s).")
+    print(f"Added: {summary['inserted']}, already existing: {summary['skipped']}, failed: {summary['failed']}.")
+    for error in summary['errors']:
+        if error['error'] != "User already exists.":
+            print(f"  Row {error['row']} ({error['username'] or '-'}): {error['error']}")
+
 
 def add_bulk_users(traffic_gb, expiration_days, count, prefix, start_number, unlimited_user):
     if db is None:
         print("Error: Database connection failed. Please ensure MongoDB is running.")
         return 1
-        
-    try:
-        traffic_bytes = int(float(traffic_gb) * 1073741824)
-    except ValueError:
-        print("Error: Traffic limit must be a numeric value.")
-        return 1
 
-    potential_usernames = []
-    for i in range(count):
-        username = f"{prefix}{start_number + i}"
-        if not re.match(r"^[a-zA-Z0-9_]+$", username):
-            print(f"Error: Generated username '{username}' contains invalid characters. Aborting.")
-            return 1
-        potential_usernames.append(username.lower())
+    if not re.match(r"^[a-zA-Z0-9_]*$", prefix):
+        print(f"Error: Prefix '{prefix}' contains invalid characters. Aborting.")
+        return 1
 
+    defaults = {"traffic_gb": traffic_gb, "expiration_days": expiration_days, "unlimited_user": unlimited_user}
     try:
-        existing_docs = db.collection.find({"_id": {"$in": potential_usernames}}, {"_id": 1})
-        existing_users_set = {doc['_id'] for doc in existing_docs}
+        progress = BulkImporter(db, expiry_timestamp).run(generate_rows(prefix, start_number, count), defaults)
     except Exception as e:
-        print(f"Error querying database for existing users: {e}")
+        print(f"An unexpected error occurred during database insert: {e}")
         return 1
-        
-    new_usernames = [u for u in potential_usernames if u not in existing_users_set]
-    new_users_count = len(new_usernames)
 
-    if new_users_count == 0:
+    if progress.skipped:
+        print(f"Warning: {progress.skipped} user(s) already exist. Skipping them.")
+    if progress.inserted == 0 and not progress.failed:
         print("No new users to add. All generated usernames already exist.")
         return 0
+    print_summary(progress)
+    return 1 if progress.failed else 0
 
-    if count > new_users_count:
-        print(f"Warning: {count - new_users_count} user(s) already exist. Skipping them.")
-
-    alphabet = string.ascii_letters + string.digits
-    passwords = [''.join(secrets.choice(alphabet) for _ in range(32)) for _ in range(new_users_count)]
-    today_date = datetime.now().strftime("%Y-%m-%d")
-
-    users_to_insert = []
-    for i, username in enumerate(new_usernames):
-        user_doc = {
-            "_id": username,
-            "password": passwords[i],
-            "max_download_bytes": traffic_bytes,
-            "expiration_days": expiration_days,
-            "blocked": False,
-            "unlimited_user": unlimited_user,
-            "status": "Offline",
-            "account_creation_date": today_date
-        }
-        users_to_insert.append(user_doc)
 
+def import_users(path, fmt, traffic_gb, expiration_days, unlimited_user):
+    if db is None:
+        print("Error: Database connection failed. Please ensure MongoDB is running.")
+        return 1
+
+    defaults = {"traffic_gb": traffic_gb, "expiration_days": expiration_days, "unlimited_user": unlimited_user}
     try:
-        db.collection.insert_many(users_to_insert, ordered=False)
-        print(f"\nSuccessfully added {len(users_to_insert)} new users.")
-        return 0
+        with (open(path, 'r', encoding='utf-8', newline='') if path != '-' else nullcontext(sys.stdin)) as f:
+            progress = BulkImporter(db, expiry_timestamp).run(read_manifest(f, fmt), defaults)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return 1
     except Exception as e:
         print(f"An unexpected error occurred during database insert: {e}")
         return 1
 
+    print_summary(progress)
+    return 1 if progress.failed else 0
+
+
+def export_users(path, fmt):
+    if db is None:
+        print("Error: Database connection failed. Please ensure MongoDB is running.", file=sys.stderr)
+        return 1
+
+    try:
+        with (open(path, 'w', encoding='utf-8', newline='') if path != '-' else nullcontext(sys.stdout)) as f:
+            for chunk in iter_export(db, fmt):
+                f.write(chunk)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Add bulk users to Hysteria2 via database.")
-    parser.add_argument("-t", "--traffic-gb", dest="traffic_gb", type=float, required=True, help="Traffic limit for each user in GB.")
-    parser.add_argument("-e", "--expiration-days", dest="expiration_days", type=int, required=True, help="Expiration duration for each user in days.")
-    parser.add_argument("-c", "--count", type=int, required=True, help="Number of users to create.")
-    parser.add_argument("-p", "--prefix", type=str, required=True, help="Prefix for usernames.")
+    parser = argparse.ArgumentParser(description="Add, import or export users in bulk via database.")
+    parser.add_argument("-t", "--traffic-gb", dest="traffic_gb", type=float, help="Traffic limit for each user in GB (default for manifest rows without one).")
+    parser.add_argument("-e", "--expiration-days", dest="expiration_days", type=int, help="Expiration duration for each user in days (default for manifest rows without one).")
+    parser.add_argument("-c", "--count", type=int, help="Number of users to create.")
+    parser.add_argument("-p", "--prefix", type=str, help="Prefix for usernames.")
     parser.add_argument("-s", "--start-number", type=int, default=1, help="Starting number for username suffix (default: 1).")
     parser.add_argument("-u", "--unlimited", action='store_true', help="Flag to mark users as unlimited (exempt from IP limits).")
+    parser.add_argument("-i", "--import", dest="import_path", help="CSV or JSONL user manifest to import ('-' for stdin).")
+    parser.add_argument("-x", "--export", dest="export_path", help="Write all users to this file ('-' for stdout).")
+    parser.add_argument("-f", "--format", choices=FORMATS, default="csv", help="Manifest format for --import/--export (default: csv).")
 
     args = parser.parse_args()
 
+    if args.export_path:
+        sys.exit(export_users(args.export_path, args.format))
+
+    if args.import_path:
+        sys.exit(import_users(args.import_path, args.format, args.traffic_gb, args.expiration_days, args.unlimited))
+
+    if args.traffic_gb is None or args.expiration_days is None or args.count is None or args.prefix is None:
+        parser.error("--traffic-gb, --expiration-days, --count and --prefix are required unless --import or --export is given.")
+
     sys.exit(add_bulk_users(
         traffic_gb=args.traffic_gb,
         expiration_days=args.expiration_days,
@@ -87,4 +106,4 @@ if __name__ == "__main__":
         prefix=args.prefix,
         start_number=args.start_number,
         unlimited_user=args.unlimited
-    ))
\ No newline at end of file
+    ))
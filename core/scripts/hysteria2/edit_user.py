@@ -4,7 +4,7 @@ import os
 import argparse
 import re
 from datetime import datetime
-from db.database import db
+from db.database import db, expiry_timestamp
 
 def edit_user(username, new_username=None, new_password=None, traffic_gb=None, expiration_days=None, creation_date=None, blocked=None, unlimited_user=None, note=None, reset_traffic=False):
     if db is None:
@@ -50,6 +50,12 @@ def edit_user(username, new_username=None, new_password=None, traffic_gb=None, e
     if reset_traffic:
         updates['download_bytes'] = 0
         updates['upload_bytes'] = 0
+
+    if 'expiration_days' in updates or 'account_creation_date' in updates:
+        updates['expires_at'] = expiry_timestamp(
+            updates.get('account_creation_date', user_data.get('account_creation_date')),
+            updates.get('expiration_days', user_data.get('expiration_days', 0))
+        )
         
     try:
         if updates:
@@ -0,0 +1,481 @@
+import init_paths
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import signal
+import asyncio
+import logging
+import argparse
+import ipaddress
+from dotenv import dotenv_values
+from pymongo import UpdateOne, DeleteOne
+from db.async_database import AsyncDatabase
+from paths import CONFIG_ENV, BLOCK_LIST, IP_LIMIT_STATS
+
+logging.basicConfig(
+    stream=sys.stdout,
+    level=logging.INFO,
+    format='%(asctime)s: [%(levelname)s] %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+logger = logging.getLogger()
+
+DB_NAME = "blitz_panel"
+CONNECTIONS_COLLECTION = "active_connections"
+HYSTERIA_UNIT = "hysteria-server.service"
+SET_NAME = "hysteria_ip_limit"
+DEFAULT_BLOCK_DURATION = 60
+DEFAULT_MAX_IPS = 1
+FLUSH_INTERVAL = float(os.getenv("LIMIT_FLUSH_INTERVAL", "1"))
+USER_REFRESH_INTERVAL = float(os.getenv("LIMIT_USER_REFRESH_INTERVAL", "30"))
+REPORT_INTERVAL = float(os.getenv("LIMIT_REPORT_INTERVAL", "10"))
+
+ADDR_RE = re.compile(r'"addr": "([^"]+)"')
+ID_RE = re.compile(r'"id": "([^">]+)"')
+
+
+def load_limits():
+    env = dotenv_values(CONFIG_ENV) if os.path.exists(CONFIG_ENV) else {}
+    try:
+        block_duration = int(env.get("BLOCK_DURATION") or DEFAULT_BLOCK_DURATION)
+    except ValueError:
+        block_duration = DEFAULT_BLOCK_DURATION
+    try:
+        max_ips = int(env.get("MAX_IPS") or DEFAULT_MAX_IPS)
+    except ValueError:
+        max_ips = DEFAULT_MAX_IPS
+    return block_duration, max_ips
+
+
+def parse_event(message):
+    if "client connected" in message:
+        kind = "connect"
+    elif "client disconnected" in message:
+        kind = "disconnect"
+    else:
+        return None
+
+    addr_match = ADDR_RE.search(message)
+    id_match = ID_RE.search(message)
+    if not addr_match or not id_match:
+        return None
+
+    host = addr_match.group(1)
+    if host.startswith("["):
+        host = host[1:host.find("]")]
+    elif host.count(":") == 1:
+        host = host.split(":", 1)[0]
+    try:
+        ip = str(ipaddress.ip_address(host))
+    except ValueError:
+        return None
+    return kind, id_match.group(1), ip
+
+
+async def run_process(*args, stdin_data=None):
+    proc = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=asyncio.subprocess.PIPE if stdin_data is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    _, stderr = await proc.communicate(stdin_data.encode() if stdin_data is not None else None)
+    return proc.returncode, stderr.decode(errors="replace").strip()
+
+
+class IpsetFirewall:
+    """One timeout-enabled ipset per address family, matched by a single DROP rule."""
+
+    name = "ipset"
+
+    def __init__(self, set_name=SET_NAME):
+        self.sets = {4: f"{set_name}4", 6: f"{set_name}6"}
+
+    async def setup(self):
+        for version, set_name in self.sets.items():
+            family = "inet" if version == 4 else "inet6"
+            code, err = await run_process("ipset", "create", set_name, "hash:ip", "family", family, "timeout", "0", "-exist")
+            if code != 0:
+                raise RuntimeError(f"ipset create {set_name} failed: {err}")
+            iptables = "iptables" if version == 4 else "ip6tables"
+            rule = ["INPUT", "-m", "set", "--match-set", set_name, "src", "-j", "DROP"]
+            code, _ = await run_process(iptables, "-C", *rule)
+            if code != 0:
+                code, err = await run_process(iptables, "-I", *rule)
+                if code != 0:
+                    raise RuntimeError(f"{iptables} rule for {set_name} failed: {err}")
+
+    async def block(self, entries):
+        lines = [
+            f"add {self.sets[ipaddress.ip_address(ip).version]} {ip} timeout {max(1, int(ttl))} -exist"
+            for ip, ttl in entries
+        ]
+        if lines:
+            code, err = await run_process("ipset", "restore", "-exist", stdin_data="\n".join(lines) + "\n")
+            if code != 0:
+                logger.error(f"ipset restore failed: {err}")
+
+    async def flush(self):
+        for set_name in self.sets.values():
+            await run_process("ipset", "flush", set_name)
+
+
+class NftablesFirewall:
+    """Timeout-enabled nftables sets in a dedicated inet table."""
+
+    name = "nftables"
+
+    def __init__(self, table=SET_NAME):
+        self.table = table
+
+    async def setup(self):
+        ruleset = (
+            f"table inet {self.table} {{\n"
+            f"  set blocked4 {{ type ipv4_addr; flags timeout; }}\n"
+            f"  set blocked6 {{ type ipv6_addr; flags timeout; }}\n"
+            f"  chain input {{\n"
+            f"    type filter hook input priority -10; policy accept;\n"
+            f"    ip saddr @blocked4 drop\n"
+            f"    ip6 saddr @blocked6 drop\n"
+            f"  }}\n"
+            f"}}\n"
+        )
+        await run_process("nft", "delete", "table", "inet", self.table)
+        code, err = await run_process("nft", "-f", "-", stdin_data=ruleset)
+        if code != 0:
+            raise RuntimeError(f"nft setup failed: {err}")
+
+    async def block(self, entries):
+        by_version = {4: [], 6: []}
+        for ip, ttl in entries:
+            by_version[ipaddress.ip_address(ip).version].append(f"{ip} timeout {max(1, int(ttl))}s")
+        commands = [
+            f"add element inet {self.table} blocked{version} {{ {', '.join(items)} }}"
+            for version, items in by_version.items() if items
+        ]
+        if commands:
+            code, err = await run_process("nft", "-f", "-", stdin_data="\n".join(commands) + "\n")
+            if code != 0:
+                logger.error(f"nft add element failed: {err}")
+
+    async def flush(self):
+        for version in (4, 6):
+            await run_process("nft", "flush", "set", "inet", self.table, f"blocked{version}")
+
+
+async def select_firewall(preference=None):
+    """Return a set-up firewall; "auto" tries ipset first and falls back to nftables."""
+    preference = (preference or os.getenv("LIMIT_FIREWALL", "auto")).lower()
+    if preference == "ipset":
+        candidates = [IpsetFirewall()]
+    elif preference == "nftables":
+        candidates = [NftablesFirewall()]
+    else:
+        candidates = []
+        if shutil.which("ipset"):
+            candidates.append(IpsetFirewall())
+        if shutil.which("nft"):
+            candidates.append(NftablesFirewall())
+        if not candidates:
+            raise RuntimeError("No firewall backend found: install ipset (with iptables) or nftables")
+
+    errors = []
+    for firewall in candidates:
+        try:
+            await firewall.setup()
+            return firewall
+        except (RuntimeError, OSError) as e:
+            logger.warning(f"{firewall.name} firewall unavailable: {e}")
+            errors.append(f"{firewall.name}: {e}")
+    raise RuntimeError(f"Could not set up a firewall backend ({'; '.join(errors)})")
+
+
+class IpLimiter:
+    """
+    Tracks per-user client IPs from the Hysteria journal and blocks users who
+    exceed MAX_IPS.
+
+    IP sets live in memory; changed users are written to active_connections
+    in one bulk_write per flush interval, and blocks are pushed to the kernel
+    in batches through timed set entries, so expiry needs no extra work.
+    """
+
+    def __init__(self, firewall_preference, block_duration, max_ips):
+        self.firewall_preference = firewall_preference
+        self.firewall = None
+        self.block_duration = block_duration
+        self.max_ips = max_ips
+        self.users_db = AsyncDatabase(DB_NAME, "users")
+        self.connections_db = AsyncDatabase(DB_NAME, CONNECTIONS_COLLECTION)
+
+        self.user_ips = {}
+        self.blocked = {}
+        self.unlimited = set()
+        self.dirty = set()
+        self.pending_blocks = {}
+        self.blocklist_changed = False
+
+        self.events = 0
+        self.window_events = 0
+        self.window_started = time.monotonic()
+        self.lag_samples = []
+        self.max_lag = 0.0
+        self.last_flush_ms = 0.0
+        self.rejected = 0
+        self.blocks = 0
+
+    async def load_state(self):
+        docs = await self.connections_db.collection.find({}, {"ips": 1}).to_list(None)
+        self.user_ips = {doc["_id"]: set(doc.get("ips", [])) for doc in docs}
+        await self.refresh_unlimited()
+
+        now = time.time()
+        if BLOCK_LIST.exists():
+            for line in BLOCK_LIST.read_text().splitlines():
+                parts = line.strip().split(",")
+                if len(parts) != 3:
+                    continue
+                ip, username, expiry = parts
+                try:
+                    expiry = float(expiry)
+                except ValueError:
+                    continue
+                # Entries written by the old shell limiter carry a per-IP rule.
+                await run_process("iptables", "-D", "INPUT", "-s", ip, "-j", "DROP")
+                if expiry > now:
+                    self.blocked[ip] = (username, expiry)
+                    self.pending_blocks[ip] = expiry - now
+        self.blocklist_changed = True
+
+    async def refresh_unlimited(self):
+        docs = await self.users_db.collection.find({"unlimited_user": True}, {"_id": 1}).to_list(None)
+        self.unlimited = {doc["_id"] for doc in docs}
+
+    def handle(self, kind, username, ip):
+        now = time.time()
+        if kind == "connect":
+            blocked = self.blocked.get(ip)
+            if blocked and blocked[1] > now:
+                self.rejected += 1
+                logger.warning(f"Rejected connection from blocked IP {ip} for user {username}")
+                self.pending_blocks[ip] = blocked[1] - now
+                return
+
+            ips = self.user_ips.setdefault(username, set())
+            if ip not in ips:
+                ips.add(ip)
+                self.dirty.add(username)
+
+            if username not in self.unlimited and len(ips) > self.max_ips:
+                logger.warning(f"User {username} has {len(ips)} IPs (max: {self.max_ips}) - blocking all IPs")
+                for user_ip in ips:
+                    self.blocked[user_ip] = (username, now + self.block_duration)
+                    self.pending_blocks[user_ip] = self.block_duration
+                self.blocks += 1
+                self.blocklist_changed = True
+        else:
+            ips = self.user_ips.get(username)
+            if ips and ip in ips:
+                ips.discard(ip)
+                self.dirty.add(username)
+
+    def record(self, realtime_us):
+        self.events += 1
+        self.window_events += 1
+        if realtime_us:
+            lag = max(0.0, time.time() - int(realtime_us) / 1_000_000)
+            self.lag_samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+
+    async def flush(self):
+        started = time.perf_counter()
+
+        if self.pending_blocks:
+            entries, self.pending_blocks = list(self.pending_blocks.items()), {}
+            await self.firewall.block(entries)
+
+        if self.dirty:
+            ops = []
+            flushed = set(self.dirty)
+            for username in flushed:
+                ips = self.user_ips.get(username)
+                if ips:
+                    ops.append(UpdateOne({"_id": username}, {"$set": {"ips": sorted(ips)}}, upsert=True))
+                else:
+                    self.user_ips.pop(username, None)
+                    ops.append(DeleteOne({"_id": username}))
+            await self.connections_db.collection.bulk_write(ops, ordered=False)
+            # Only forget the changes once they are stored; a failed write
+            # is retried on the next flush, and users changed meanwhile stay dirty.
+            self.dirty -= flushed
+
+        now = time.time()
+        expired = [ip for ip, (_, expiry) in self.blocked.items() if expiry <= now]
+        for ip in expired:
+            username, _ = self.blocked.pop(ip)
+            logger.info(f"Auto-unblocked IP {ip} for user {username} (block expired)")
+        if expired or self.blocklist_changed:
+            self.write_blocklist()
+            self.blocklist_changed = False
+
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+
+    def write_blocklist(self):
+        tmp_path = BLOCK_LIST.with_suffix(".tmp")
+        tmp_path.write_text("".join(
+            f"{ip},{username},{int(expiry)}\n" for ip, (username, expiry) in self.blocked.items()
+        ))
+        os.replace(tmp_path, BLOCK_LIST)
+
+    def report(self):
+        now = time.monotonic()
+        elapsed = max(now - self.window_started, 1e-6)
+        lags = sorted(self.lag_samples)
+        stats = {
+            "timestamp": time.time(),
+            "firewall": self.firewall.name,
+            "events_total": self.events,
+            "events_per_second": round(self.window_events / elapsed, 2),
+            "lag_p50_seconds": round(lags[len(lags) // 2], 3) if lags else None,
+            "lag_max_seconds": round(self.max_lag, 3),
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "tracked_users": len(self.user_ips),
+            "blocked_ips": len(self.blocked),
+            "blocks_total": self.blocks,
+            "rejected_total": self.rejected,
+        }
+        self.window_events = 0
+        self.window_started = now
+        self.lag_samples = []
+        self.max_lag = 0.0
+
+        try:
+            tmp_path = IP_LIMIT_STATS.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(stats, indent=2))
+            os.replace(tmp_path, IP_LIMIT_STATS)
+        except OSError as e:
+            logger.error(f"Could not write limiter stats: {e}")
+        if stats["events_per_second"] or stats["lag_max_seconds"] > 5:
+            logger.info(
+                f"{stats['events_per_second']} events/s, lag p50 {stats['lag_p50_seconds']}s "
+                f"max {stats['lag_max_seconds']}s, flush {stats['last_flush_ms']}ms"
+            )
+
+    async def tail_journal(self):
+        proc = await asyncio.create_subprocess_exec(
+            "journalctl", "-u", HYSTERIA_UNIT, "-f", "-n", "0", "-o", "json",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            limit=1024 * 1024
+        )
+        try:
+            async for raw in proc.stdout:
+                try:
+                    entry = json.loads(raw)
+                except ValueError:
+                    continue
+                message = entry.get("MESSAGE")
+                if isinstance(message, list):
+                    message = bytes(message).decode(errors="replace")
+                if not message:
+                    continue
+                event = parse_event(message)
+                if event is None:
+                    continue
+                self.record(entry.get("__REALTIME_TIMESTAMP"))
+                self.handle(*event)
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+            await proc.wait()
+        raise RuntimeError("journalctl exited")
+
+    async def periodic(self):
+        last_refresh = last_report = time.monotonic()
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Flush failed: {e}")
+
+            now = time.monotonic()
+            if now - last_refresh >= USER_REFRESH_INTERVAL:
+                last_refresh = now
+                try:
+                    await self.refresh_unlimited()
+                except Exception as e:
+                    logger.error(f"Could not refresh unlimited users: {e}")
+            if now - last_report >= REPORT_INTERVAL:
+                last_report = now
+                self.report()
+
+    async def run(self):
+        self.firewall = await select_firewall(self.firewall_preference)
+        await self.load_state()
+        logger.info(
+            f"Monitoring Hysteria connections. Max IPs: {self.max_ips}, "
+            f"Block Duration: {self.block_duration} s, Firewall: {self.firewall.name}"
+        )
+        periodic = asyncio.create_task(self.periodic())
+        loop = asyncio.get_running_loop()
+        current = asyncio.current_task()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, current.cancel)
+        try:
+            while True:
+                try:
+                    await self.tail_journal()
+                except Exception as e:
+                    logger.error(f"Journal stream stopped: {e}; restarting in 1s")
+                    await asyncio.sleep(1)
+        finally:
+            periodic.cancel()
+            await self.flush()
+            await self.users_db.close()
+            await self.connections_db.close()
+
+
+async def clean():
+    logger.warning("Starting cleanup of all tracked IPs and blocks...")
+    if BLOCK_LIST.exists():
+        for line in BLOCK_LIST.read_text().splitlines():
+            ip = line.split(",", 1)[0].strip()
+            if ip:
+                await run_process("iptables", "-D", "INPUT", "-s", ip, "-j", "DROP")
+        BLOCK_LIST.write_text("")
+    for firewall in (IpsetFirewall(), NftablesFirewall()):
+        await firewall.flush()
+    logger.info("All IPs unblocked and block list file cleared.")
+
+    connections_db = AsyncDatabase(DB_NAME, CONNECTIONS_COLLECTION)
+    await connections_db.collection.drop()
+    await connections_db.close()
+    logger.info(f"MongoDB collection '{CONNECTIONS_COLLECTION}' has been dropped.")
+    logger.warning("Cleanup complete.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hysteria2 per-user IP limiter")
+    parser.add_argument("command", choices=["run", "clean"])
+    parser.add_argument("--firewall", choices=["auto", "ipset", "nftables"], default=None)
+    args = parser.parse_args()
+
+    if args.command == "clean":
+        asyncio.run(clean())
+        return
+
+    block_duration, max_ips = load_limits()
+    limiter = IpLimiter(args.firewall, block_duration, max_ips)
+    try:
+        asyncio.run(limiter.run())
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    logger.info("IP limiter stopped.")
+
+
+if __name__ == "__main__":
+    main()
@@ -19,177 +19,15 @@ fi
 
 [ ! -f "$BLOCK_LIST" ] && touch "$BLOCK_LIST"
 
+PYTHON_BIN="/etc/hysteria/hysteria2_venv/bin/python3"
+LIMITER_PY="$(dirname "$SCRIPT_PATH")/limit.py"
+
 log_message() {
     local level="$1"
     local message="$2"
     echo "[$(date +"%Y-%m-%d %H:%M:%S")] [$level] $message"
 }
 
-add_ip_to_db() {
-    local username="$1"
-    local ip_address="$2"
-    
-    mongosh "$DB_NAME" --quiet --eval "
-        db.getCollection('$CONNECTIONS_COLLECTION').updateOne(
-            { _id: '$username' },
-            { \$addToSet: { ips: '$ip_address' } },
-            { upsert: true }
-        );
-    "
-    log_message "INFO" "DB Update: Added $ip_address for user $username"
-}
-
-remove_ip_from_db() {
-    local username="$1"
-    local ip_address="$2"
-    
-    mongosh "$DB_NAME" --quiet --eval "
-        db.getCollection('$CONNECTIONS_COLLECTION').updateOne(
-            { _id: '$username' },
-            { \$pull: { ips: '$ip_address' } }
-        );
-        db.getCollection('$CONNECTIONS_COLLECTION').deleteMany(
-            { _id: '$username', ips: { \$size: 0 } }
-        );
-    "
-    log_message "INFO" "DB Update: Removed $ip_address for user $username"
-}
-
-block_ip() {
-    local ip_address="$1"
-    local username="$2"
-    local unblock_time=$(( $(date +%s) + BLOCK_DURATION ))
-
-    if iptables -C INPUT -s "$ip_address" -j DROP 2>/dev/null; then
-        log_message "INFO" "IP $ip_address is already blocked"
-        return
-    fi
-
-    iptables -I INPUT -s "$ip_address" -j DROP
-    echo "$ip_address,$username,$unblock_time" >> "$BLOCK_LIST"
-    log_message "WARN" "Blocked IP $ip_address for user $username for $BLOCK_DURATION seconds"
-}
-
-unblock_ip() {
-    local ip_address="$1"
-
-    if iptables -C INPUT -s "$ip_address" -j DROP 2>/dev/null; then
-        iptables -D INPUT -s "$ip_address" -j DROP
-        log_message "INFO" "Unblocked IP $ip_address"
-    fi
-    sed -i "/^$ip_address,/d" "$BLOCK_LIST"
-}
-
-block_all_user_ips() {
-    local username="$1"
-    
-    local ips_json
-    ips_json=$(mongosh "$DB_NAME" --quiet --eval "
-        JSON.stringify(db.getCollection('$CONNECTIONS_COLLECTION').findOne({_id: '$username'}, {_id: 0, ips: 1}))
-    ")
-
-    if [[ -z "$ips_json" || "$ips_json" == "null" ]]; then
-        log_message "INFO" "No IPs to block for user $username"
-        return
-    fi
-    
-    local ips
-    readarray -t ips < <(echo "$ips_json" | jq -r '.ips[]')
-    
-    for ip in "${ips[@]}"; do
-        if [[ -n "$ip" ]]; then
-            block_ip "$ip" "$username"
-        fi
-    done
-
-    log_message "WARN" "User $username has been completely blocked for $BLOCK_DURATION seconds"
-}
-
-check_expired_blocks() {
-    local current_time=$(date +%s)
-    local ip username expiry
-
-    while IFS=, read -r ip username expiry || [ -n "$ip" ]; do
-        if [[ -n "$ip" && -n "$expiry" ]]; then
-            if (( current_time >= expiry )); then
-                unblock_ip "$ip"
-                log_message "INFO" "Auto-unblocked IP $ip for user $username (block expired)"
-            fi
-        fi
-    done < "$BLOCK_LIST"
-}
-
-check_ip_limit() {
-    local username="$1"
-    
-    local ip_count
-    ip_count=$(mongosh "$DB_NAME" --quiet --eval "
-        db.getCollection('$CONNECTIONS_COLLECTION').findOne({_id: '$username'})?.ips?.length || 0;
-    ")
-
-    if (( ip_count > MAX_IPS )); then
-        log_message "WARN" "User $username has $ip_count IPs (max: $MAX_IPS) - blocking all IPs"
-        block_all_user_ips "$username"
-    fi
-}
-
-clean_all() {
-    log_message "WARN" "Starting cleanup of all tracked IPs and blocks..."
-
-    if [ -s "$BLOCK_LIST" ]; then
-        while IFS=, read -r ip _; do
-            if [[ -n "$ip" ]]; then
-                unblock_ip "$ip"
-            fi
-        done < "$BLOCK_LIST"
-    fi
-
-    > "$BLOCK_LIST"
-    log_message "INFO" "All IPs unblocked and block list file cleared."
-
-    mongosh "$DB_NAME" --quiet --eval "
-        db.getCollection('$CONNECTIONS_COLLECTION').drop();
-    "
-    log_message "INFO" "MongoDB collection '$CONNECTIONS_COLLECTION' has been dropped."
-
-    log_message "WARN" "Cleanup complete."
-}
-
-parse_log_line() {
-    local log_line="$1"
-    local ip_address
-    local username
-
-    ip_address=$(echo "$log_line" | grep -oP '"addr": "([^:]+)' | cut -d'"' -f4)
-    username=$(echo "$log_line" | grep -oP '"id": "([^">]+)' | cut -d'"' -f4)
-
-    if [[ -n "$username" && -n "$ip_address" ]]; then
-        if echo "$log_line" | grep -q "client connected"; then
-            if grep -q "^$ip_address," "$BLOCK_LIST"; then
-                log_message "WARN" "Rejected connection from blocked IP $ip_address for user $username"
-                if ! iptables -C INPUT -s "$ip_address" -j DROP 2>/dev/null; then
-                    iptables -I INPUT -s "$ip_address" -j DROP
-                fi
-            else
-                add_ip_to_db "$username" "$ip_address"
-                
-                local is_unlimited
-                is_unlimited=$(mongosh "$DB_NAME" --quiet --eval "
-                    db.users.findOne({_id: '$username'}, {_id: 0, unlimited_user: 1})?.unlimited_user || false;
-                ")
-
-                if [ "$is_unlimited" == "true" ]; then
-                    log_message "INFO" "User $username is exempt from IP limit. Skipping check."
-                else
-                    check_ip_limit "$username"
-                fi
-            fi
-        elif echo "$log_line" | grep -q "client disconnected"; then
-            remove_ip_from_db "$username" "$ip_address"
-        fi
-    fi
-}
-
 install_service() {
     cat <<EOF > /etc/systemd/system/${SERVICE_NAME}
 [Unit]
@@ -199,7 +37,7 @@ Requires=hysteria-server.service mongod.service
 
 [Service]
 Type=simple
-ExecStart=/bin/bash ${SCRIPT_PATH} run
+ExecStart=${PYTHON_BIN} ${LIMITER_PY} run
 Restart=always
 RestartSec=5
 User=root
@@ -255,12 +93,8 @@ if [[ $EUID -ne 0 ]]; then
     echo "Error: This script must be run as root."
     exit 1
 fi
-if ! command -v mongosh &>/dev/null; then
-    log_message "ERROR" "'mongosh' is not installed or not in PATH. This script requires the MongoDB Shell."
-    exit 1
-fi
-if ! command -v jq &>/dev/null; then
-    log_message "WARN" "'jq' is not installed. JSON parsing for blocking might fail."
+if ! command -v ipset &>/dev/null && ! command -v nft &>/dev/null; then
+    log_message "WARN" "Neither 'ipset' nor 'nft' is installed. Blocking will not take effect."
 fi
 
 case "$1" in
@@ -274,32 +108,10 @@ case "$1" in
         change_config "$2" "$3"
         ;;
     clean)
-        clean_all
+        "$PYTHON_BIN" "$LIMITER_PY" clean
         ;;
     run)
-        log_message "INFO" "Monitoring Hysteria connections. Max IPs: $MAX_IPS, Block Duration: $BLOCK_DURATION s"
-        log_message "INFO" "--------------------------------------------------------"
-
-        (
-            while true; do
-                check_expired_blocks
-                sleep 10
-            done
-        ) &
-        CHECKER_PID=$!
-        
-        cleanup() {
-            log_message "INFO" "Stopping IP limiter..."
-            kill $CHECKER_PID 2>/dev/null
-            exit 0
-        }
-        trap cleanup SIGINT SIGTERM
-
-        journalctl -u hysteria-server.service -f | while read -r line; do
-            if echo "$line" | grep -q "client connected\|client disconnected"; then
-                parse_log_line "$line"
-            fi
-        done
+        exec "$PYTHON_BIN" "$LIMITER_PY" run
         ;;
     *)
         echo "Usage: $0 {start|stop|config|run|clean} [block_duration] [max_ips]"
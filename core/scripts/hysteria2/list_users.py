@@ -1,6 +1,8 @@
 import init_paths
+import re
 import sys
 import json
+import argparse
 from pathlib import Path
 from hysteria2_api import Hysteria2Client
 from db.database import db
@@ -16,6 +18,14 @@ def get_secret() -> str | None:
     except (json.JSONDecodeError, IOError):
         return None
 
+_client = None
+
+def get_client(secret: str) -> Hysteria2Client:
+    global _client
+    if _client is None or _client.secret != secret:
+        _client = Hysteria2Client(base_url=API_BASE_URL, secret=secret)
+    return _client
+
 def get_users_from_db() -> list:
     if db is None:
         print("Error: Database connection failed.", file=sys.stderr)
@@ -29,17 +39,16 @@ def get_users_from_db() -> list:
         print(f"Error retrieving users from database: {e}", file=sys.stderr)
         return []
 
-def main():
+def collect_users() -> list:
     users_list = get_users_from_db()
     if not users_list:
-        print(json.dumps([], indent=2))
-        return
+        return []
 
     secret = get_secret()
 
     if secret:
         try:
-            client = Hysteria2Client(base_url=API_BASE_URL, secret=secret)
+            client = get_client(secret)
             online_clients = client.get_online_clients()
 
             users_dict = {user['username']: user for user in users_list}
@@ -63,7 +72,119 @@ def main():
         else:
             user['status'] = 'Offline'
 
-    print(json.dumps(users_list, indent=2))
+    return users_list
+
+LIST_PROJECTION = {
+    "password": 1, "max_download_bytes": 1, "expiration_days": 1, "account_creation_date": 1,
+    "blocked": 1, "unlimited_user": 1, "note": 1, "status": 1,
+    "upload_bytes": 1, "download_bytes": 1, "online_count": 1,
+}
+# All sorts but usage are served by an index (see USER_INDEXES); usage is
+# computed per document, so that sort runs in memory.
+SORT_FIELDS = {
+    "username": "_id",
+    "created": "account_creation_date",
+    "expiration": "expires_at",
+    "quota": "max_download_bytes",
+    "usage": "total_usage",
+}
+STATUSES = ("Online", "Offline", "Disabled")
+DEFAULT_PAGE_SIZE = 50
+
+
+def get_online_usernames() -> set | None:
+    secret = get_secret()
+    if not secret:
+        return None
+    try:
+        online_clients = get_client(secret).get_online_clients()
+    except Exception as e:
+        print(f"Warning: Could not connect to Hysteria2 API to get online status. {e}", file=sys.stderr)
+        return None
+    if online_clients is None:
+        return None
+    return {username: status.connections for username, status in online_clients.items() if status.is_online}
+
+
+def build_query(status: str | None, q: str | None, online: dict) -> dict:
+    conditions = []
+    if q:
+        pattern = {"$regex": re.escape(q), "$options": "i"}
+        conditions.append({"$or": [{"_id": pattern}, {"note": pattern}]})
+    if status == "Online":
+        conditions.append({"_id": {"$in": list(online)}})
+    elif status == "Offline":
+        conditions.append({"_id": {"$nin": list(online)}, "blocked": {"$ne": True}})
+    elif status == "Disabled":
+        conditions.append({"_id": {"$nin": list(online)}, "blocked": True})
+    if not conditions:
+        return {}
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def parse_sort(sort: str | None) -> tuple[dict, dict | None]:
+    sort = sort or "username"
+    direction = -1 if sort.startswith("-") else 1
+    field = SORT_FIELDS.get(sort.lstrip("-"))
+    if field is None:
+        raise ValueError(f"Invalid sort field: {sort.lstrip('-')}. Allowed: {', '.join(SORT_FIELDS)}")
+    add_fields = None
+    if field == "total_usage":
+        add_fields = {"total_usage": {"$add": [{"$ifNull": ["$upload_bytes", 0]}, {"$ifNull": ["$download_bytes", 0]}]}}
+    order = {field: direction}
+    if field != "_id":
+        # Same direction as the field, so one index serves both orders.
+        order["_id"] = direction
+    return order, add_fields
+
+
+def query_users(page: int = 1, limit: int = DEFAULT_PAGE_SIZE, sort: str | None = None,
+                status: str | None = None, q: str | None = None) -> dict:
+    if page < 1 or limit < 1:
+        raise ValueError("page and limit must be positive integers.")
+    if status is not None and status not in STATUSES:
+        raise ValueError(f"Invalid status: {status}. Allowed: {', '.join(STATUSES)}")
+    if db is None:
+        raise RuntimeError("Database connection failed.")
+
+    order, add_fields = parse_sort(sort)
+    online = get_online_usernames() or {}
+    users, total = db.page_users(
+        build_query(status, q, online), order, (page - 1) * limit, limit, LIST_PROJECTION, add_fields
+    )
+
+    for user in users:
+        user['username'] = user.pop('_id')
+        user['online_count'] = online.get(user['username'], 0)
+        if user['online_count'] > 0:
+            user['status'] = 'Online'
+        elif user.get('blocked'):
+            user['status'] = 'Disabled'
+        else:
+            user['status'] = 'Offline'
+
+    return {"users": users, "total": total, "page": page, "limit": limit}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List users, optionally one page at a time.")
+    parser.add_argument("--page", type=int)
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--sort", help=f"One of {', '.join(SORT_FIELDS)}; prefix with '-' for descending.")
+    parser.add_argument("--status", choices=STATUSES)
+    parser.add_argument("-q", "--query", help="Case-insensitive match on username or note.")
+    args = parser.parse_args()
+
+    if any(value is not None for value in (args.page, args.limit, args.sort, args.status, args.query)):
+        try:
+            result = query_users(args.page or 1, args.limit or DEFAULT_PAGE_SIZE, args.sort, args.status, args.query)
+        except (ValueError, RuntimeError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(json.dumps(result, default=str))
+        return
+
+    print(json.dumps(collect_users(), indent=2))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -18,7 +18,8 @@ def reset_user(username):
             {
                 '$set': {
                     'status': 'On-hold',
-                    'blocked': False
+                    'blocked': False,
+                    'expires_at': None
                 },
                 '$unset': {
                     'account_creation_date': "",
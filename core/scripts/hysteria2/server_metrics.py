@@ -0,0 +1,377 @@
+import asyncio
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def convert_bytes(bytes_val: int) -> str:
+    if bytes_val >= (1 << 40):
+        return f"{bytes_val / (1 << 40):.2f} TB"
+    elif bytes_val >= (1 << 30):
+        return f"{bytes_val / (1 << 30):.2f} GB"
+    elif bytes_val >= (1 << 20):
+        return f"{bytes_val / (1 << 20):.2f} MB"
+    elif bytes_val >= (1 << 10):
+        return f"{bytes_val / (1 << 10):.2f} KB"
+    return f"{bytes_val} B"
+
+
+def convert_speed(bytes_per_second: int) -> str:
+    if bytes_per_second >= (1 << 40):
+        return f"{bytes_per_second / (1 << 40):.2f} TB/s"
+    elif bytes_per_second >= (1 << 30):
+        return f"{bytes_per_second / (1 << 30):.2f} GB/s"
+    elif bytes_per_second >= (1 << 20):
+        return f"{bytes_per_second / (1 << 20):.2f} MB/s"
+    elif bytes_per_second >= (1 << 10):
+        return f"{bytes_per_second / (1 << 10):.2f} KB/s"
+    return f"{int(bytes_per_second)} B/s"
+
+
+def format_uptime(seconds: float) -> str:
+    seconds = int(seconds)
+    days, remainder = divmod(seconds, 86400)
+    hours, remainder = divmod(remainder, 3600)
+    minutes, _ = divmod(remainder, 60)
+    return f"{days}d {hours}h {minutes}m"
+
+
+def read_file(filepath: str) -> str:
+    try:
+        with open(filepath, 'r') as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def parse_uptime(content: str) -> float:
+    try:
+        return float(content.split()[0])
+    except (IndexError, ValueError):
+        return 0.0
+
+
+def parse_cpu_stats(content: str) -> tuple[int, int]:
+    if not content:
+        return 0, 0
+    line = content.split('\n')[0]
+    fields = list(map(int, line.strip().split()[1:]))
+    idle, total = fields[3], sum(fields)
+    return idle, total
+
+
+def parse_meminfo(content: str) -> tuple[int, int]:
+    if not content:
+        return 0, 0
+
+    mem_info = {}
+    for line in content.split('\n'):
+        if ':' in line:
+            parts = line.split()
+            if len(parts) >= 2:
+                key = parts[0].rstrip(':')
+                if parts[1].isdigit():
+                    mem_info[key] = int(parts[1])
+
+    mem_total_kb = mem_info.get("MemTotal", 0)
+    mem_free_kb = mem_info.get("MemFree", 0)
+    buffers_kb = mem_info.get("Buffers", 0)
+    cached_kb = mem_info.get("Cached", 0)
+    sreclaimable_kb = mem_info.get("SReclaimable", 0)
+
+    used_kb = mem_total_kb - mem_free_kb - buffers_kb - cached_kb - sreclaimable_kb
+
+    used_kb = max(0, used_kb)
+    return mem_total_kb // 1024, used_kb // 1024
+
+
+def parse_network_stats(content: str) -> tuple[int, int]:
+    if not content:
+        return 0, 0
+
+    rx_bytes, tx_bytes = 0, 0
+    lines = content.split('\n')
+
+    for line in lines[2:]:
+        if not line.strip():
+            continue
+        parts = line.split()
+        if len(parts) < 10:
+            continue
+        iface = parts[0].strip().replace(':', '')
+        if iface == 'lo':
+            continue
+        try:
+            rx_bytes += int(parts[1])
+            tx_bytes += int(parts[9])
+        except (IndexError, ValueError):
+            continue
+
+    return rx_bytes, tx_bytes
+
+
+def parse_connection_counts(tcp_content: str, udp_content: str) -> tuple[int, int]:
+    tcp_count = len(tcp_content.split('\n')) - 2 if tcp_content else 0
+    udp_count = len(udp_content.split('\n')) - 2 if udp_content else 0
+    return max(0, tcp_count), max(0, udp_count)
+
+
+def get_configured_addresses(env_path: str) -> tuple[str, str]:
+    '''IP4/IP6 as written to .configs.env by the installer, if present.'''
+    values = {}
+    for line in read_file(env_path).splitlines():
+        key, sep, value = line.partition('=')
+        if sep:
+            values[key.strip()] = value.strip().strip('"\'')
+    ipv4, ipv6 = values.get('IP4', ''), values.get('IP6', '')
+    return ('' if ipv4 == 'None' else ipv4), ('' if ipv6 == 'None' else ipv6)
+
+
+def get_interface_addresses() -> tuple[str, str]:
+    ipv4_address = ""
+    ipv6_address = ""
+
+    try:
+        interfaces_output = subprocess.check_output(["ip", "-o", "link", "show"]).decode()
+        interface_lines = interfaces_output.strip().splitlines()
+
+        interfaces = []
+        for line in interface_lines:
+            parts = line.split(': ')
+            if len(parts) > 1:
+                iface_name = parts[1].split('@')[0]
+                if not re.match(r"^(lo|wgcf|warp)", iface_name):
+                    interfaces.append(iface_name)
+
+        for iface in interfaces:
+            try:
+                if not ipv4_address:
+                    ipv4_output = subprocess.check_output(["ip", "-o", "-4", "addr", "show", iface]).decode()
+                    for line in ipv4_output.strip().splitlines():
+                        addr = line.split()[3].split("/")[0]
+                        if not re.match(r"^(127\.|10\.|192\.168\.|172\.(1[6-9]|2[0-9]|3[0-1]))", addr):
+                            ipv4_address = addr
+                            break
+                if not ipv6_address:
+                    ipv6_output = subprocess.check_output(["ip", "-o", "-6", "addr", "show", iface]).decode()
+                    for line in ipv6_output.strip().splitlines():
+                        addr = line.split()[3].split("/")[0]
+                        if not re.match(r"^(::1|fe80:)", addr):
+                            ipv6_address = addr
+                            break
+            except subprocess.CalledProcessError:
+                continue
+            if ipv4_address and ipv6_address:
+                break
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        pass
+
+    if not ipv4_address:
+        try:
+            ipv4_address = subprocess.check_output(["curl", "-4", "-s", "--max-time", "5", "https://api.ipify.org"], stderr=subprocess.DEVNULL).decode().strip()
+        except Exception:
+            pass
+
+    if not ipv6_address:
+        try:
+            ipv6_address = subprocess.check_output(["curl", "-6", "-s", "--max-time", "5", "https://api64.ipify.org"], stderr=subprocess.DEVNULL).decode().strip()
+        except Exception:
+            pass
+
+    return ipv4_address, ipv6_address
+
+
+def build_snapshot(uptime_seconds: float, cpu_usage: float, mem: tuple[int, int], conns: tuple[int, int],
+                   speed: tuple[int, int], reboot: tuple[int, int], totals: dict[str, int],
+                   addresses: tuple[str, str]) -> dict:
+    mem_total, mem_used = mem
+    download_speed, upload_speed = speed
+    reboot_rx, reboot_tx = reboot
+    now = time.time()
+    return {
+        'timestamp': now,
+        'uptime_seconds': int(uptime_seconds),
+        'uptime': format_uptime(uptime_seconds) if uptime_seconds else 'N/A',
+        'boot_time': time.strftime("%Y-%m-%d %H:%M", time.localtime(now - uptime_seconds)) if uptime_seconds else 'N/A',
+        'server_ipv4': addresses[0],
+        'server_ipv6': addresses[1],
+        'cpu_usage': cpu_usage,
+        'mem_total_mb': mem_total,
+        'mem_used_mb': mem_used,
+        'online_users': totals.get('online', 0),
+        'upload_speed': upload_speed,
+        'download_speed': download_speed,
+        'tcp_connections': conns[0],
+        'udp_connections': conns[1],
+        'reboot_upload_bytes': reboot_tx,
+        'reboot_download_bytes': reboot_rx,
+        'user_upload_bytes': totals.get('upload', 0),
+        'user_download_bytes': totals.get('download', 0),
+    }
+
+
+def format_snapshot(snapshot: dict) -> str:
+    reboot_tx, reboot_rx = snapshot['reboot_upload_bytes'], snapshot['reboot_download_bytes']
+    user_upload, user_download = snapshot['user_upload_bytes'], snapshot['user_download_bytes']
+    return "\n".join([
+        f"🕒 Uptime: {snapshot['uptime']} (since {snapshot['boot_time']})",
+        f"🖥️ Server IPv4: {snapshot['server_ipv4'] or 'Not Found'}",
+        f"🖥️ Server IPv6: {snapshot['server_ipv6'] or 'Not Found'}",
+        f"📈 CPU Usage: {snapshot['cpu_usage']}%",
+        f"💻 Used RAM: {snapshot['mem_used_mb']}MB / {snapshot['mem_total_mb']}MB",
+        f"👥 Online Users: {snapshot['online_users']}",
+        "",
+        f"🔼 Upload Speed: {convert_speed(snapshot['upload_speed'])}",
+        f"🔽 Download Speed: {convert_speed(snapshot['download_speed'])}",
+        f"📡 TCP Connections: {snapshot['tcp_connections']}",
+        f"📡 UDP Connections: {snapshot['udp_connections']}",
+        "",
+        "📊 Traffic Since Last Reboot:",
+        f"   🔼 Total Uploaded: {convert_bytes(reboot_tx)}",
+        f"   🔽 Total Downloaded: {convert_bytes(reboot_rx)}",
+        f"   📈 Combined Traffic: {convert_bytes(reboot_tx + reboot_rx)}",
+        "",
+        "📊 User Traffic (All Time):",
+        f"   🔼 Uploaded Traffic: {convert_bytes(user_upload)}",
+        f"   🔽 Downloaded Traffic: {convert_bytes(user_download)}",
+        f"   📈 Total Traffic: {convert_bytes(user_upload + user_download)}",
+    ])
+
+
+def load_snapshot(path: str, max_age: float) -> dict | None:
+    '''Return the snapshot written by a running MetricsSampler if it is recent enough.'''
+    try:
+        with open(path, 'r') as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(snapshot, dict) or time.time() - snapshot.get('timestamp', 0) > max_age:
+        return None
+    return snapshot
+
+
+def write_snapshot(path: str, snapshot: dict):
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.server_info.')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class MetricsSampler:
+    '''
+    Resident server status sampler.
+
+    CPU and network rates are computed from the /proc counters of the previous
+    tick instead of sleeping between two reads, user totals come from a single
+    $group aggregation on a slower cadence, and the detected addresses are
+    cached for ip_ttl. snapshot() only returns the last built dict, and the
+    same dict is written to snapshot_path for the CLI and the Telegram bot.
+    '''
+
+    def __init__(self, db=None, snapshot_path: str | None = None, env_path: str | None = None,
+                 interval: float = 2, totals_interval: float = 30, ip_ttl: float = 3600):
+        self.db = db
+        self.snapshot_path = snapshot_path
+        self.env_path = env_path
+        self.interval = interval
+        self.totals_interval = totals_interval
+        self.ip_ttl = ip_ttl
+
+        self._cpu: tuple[int, int] | None = None
+        self._net: tuple[int, int, float] | None = None
+        self._cpu_usage = 0.0
+        self._speed = (0, 0)
+        self._totals: dict[str, int] = {}
+        self._totals_at = 0.0
+        self._addresses = ('', '')
+        self._addresses_at = 0.0
+        self._snapshot: dict | None = None
+        self._task: asyncio.Task | None = None
+
+    def _sample_proc(self):
+        idle, total = parse_cpu_stats(read_file('/proc/stat'))
+        if self._cpu is not None:
+            idle_delta, total_delta = idle - self._cpu[0], total - self._cpu[1]
+            self._cpu_usage = round(100.0 * (1 - idle_delta / total_delta), 1) if total_delta > 0 else 0.0
+        self._cpu = (idle, total)
+
+        rx, tx = parse_network_stats(read_file('/proc/net/dev'))
+        now = time.monotonic()
+        if self._net is not None:
+            elapsed = now - self._net[2]
+            if elapsed > 0:
+                self._speed = (max(0, int((rx - self._net[0]) / elapsed)), max(0, int((tx - self._net[1]) / elapsed)))
+        self._net = (rx, tx, now)
+
+        return (
+            parse_uptime(read_file('/proc/uptime')),
+            parse_meminfo(read_file('/proc/meminfo')),
+            parse_connection_counts(read_file('/proc/net/tcp'), read_file('/proc/net/udp')),
+            (rx, tx),
+        )
+
+    def _detect_addresses(self) -> tuple[str, str]:
+        ipv4, ipv6 = get_configured_addresses(self.env_path) if self.env_path else ('', '')
+        if ipv4 and ipv6:
+            return ipv4, ipv6
+        detected = get_interface_addresses()
+        return ipv4 or detected[0], ipv6 or detected[1]
+
+    async def _refresh_slow(self):
+        now = time.monotonic()
+        if self.db is not None and now - self._totals_at >= self.totals_interval:
+            try:
+                self._totals = await self.db.user_totals()
+                self._totals_at = now
+            except Exception as e:
+                print(f"Metrics sampler: could not aggregate user totals: {e}", file=sys.stderr)
+        if now - self._addresses_at >= self.ip_ttl:
+            self._addresses = await asyncio.to_thread(self._detect_addresses)
+            self._addresses_at = now
+
+    async def tick(self) -> dict:
+        await self._refresh_slow()
+        uptime_seconds, mem, conns, reboot = self._sample_proc()
+        self._snapshot = build_snapshot(uptime_seconds, self._cpu_usage, mem, conns, self._speed, reboot, self._totals, self._addresses)
+        if self.snapshot_path:
+            try:
+                await asyncio.to_thread(write_snapshot, self.snapshot_path, self._snapshot)
+            except OSError as e:
+                print(f"Metrics sampler: could not write snapshot: {e}", file=sys.stderr)
+        return self._snapshot
+
+    def snapshot(self) -> dict | None:
+        return self._snapshot
+
+    async def _run_forever(self):
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                print(f"Metrics sampler tick failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -7,7 +7,7 @@ import json
 import base64
 import argparse
 from functools import lru_cache
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Iterator, TextIO
 from db.database import db
 from paths import *
 
@@ -23,9 +23,24 @@ def hex_pin_to_uri(pin: str) -> str:
     except (ValueError, Exception):
         return pin.replace(':', '')
 
-@lru_cache(maxsize=None)
+class UriGenerationError(Exception):
+    pass
+
+def _file_mtime(file_path) -> float | None:
+    try:
+        return os.path.getmtime(file_path)
+    except OSError:
+        return None
+
 def load_json_file(file_path: str) -> Any:
-    if not os.path.exists(file_path):
+    return _load_json_file(str(file_path), _file_mtime(file_path))
+
+def load_env_file(env_file: str) -> Dict[str, str]:
+    return _load_env_file(str(env_file), _file_mtime(env_file))
+
+@lru_cache(maxsize=16)
+def _load_json_file(file_path: str, mtime: float | None) -> Any:
+    if mtime is None:
         return None
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
@@ -34,10 +49,10 @@ def load_json_file(file_path: str) -> Any:
     except (json.JSONDecodeError, IOError):
         return None
 
-@lru_cache(maxsize=None)
-def load_env_file(env_file: str) -> Dict[str, str]:
+@lru_cache(maxsize=16)
+def _load_env_file(env_file: str, mtime: float | None) -> Dict[str, str]:
     env_vars = {}
-    if os.path.exists(env_file):
+    if mtime is not None:
         with open(env_file, 'r', encoding='utf-8') as f:
             for line in f:
                 line = line.strip()
@@ -46,28 +61,54 @@ def load_env_file(env_file: str) -> Dict[str, str]:
                     env_vars[key] = value.strip()
     return env_vars
 
-def generate_uri(username: str, auth_password: str, ip: str, port: str, 
-                 uri_params: Dict[str, str], ip_version: int, fragment_tag: str) -> str:
+BATCH_SIZE = 1000
+
+
+def _config_signature() -> tuple:
+    return tuple(_file_mtime(path) for path in (CONFIG_FILE, NODES_JSON_PATH, CONFIG_ENV, NORMALSUB_ENV))
+
+
+def endpoint_suffix(ip: str, port: str, uri_params: Dict[str, str], ip_version: int, fragment_tag: str) -> str:
     ip_part = f"[{ip}]" if ip_version == 6 and ':' in ip else ip
-    uri_base = f"hysteria2://{username}:{auth_password}@{ip_part}:{port}"
-    
-    query_params = [f"{k}={v}" for k, v in uri_params.items() if v is not None and v != '']
-    query_string = "&".join(query_params)
-    
-    return f"{uri_base}?{query_string}#{fragment_tag}"
+    query_string = "&".join(f"{k}={v}" for k, v in uri_params.items() if v is not None and v != '')
+    return f"@{ip_part}:{port}?{query_string}#{fragment_tag}"
 
-def process_users(target_usernames: List[str]) -> List[Dict[str, Any]]:
+
+class UriTemplates:
+    """
+    Everything in a user's URIs except the credentials, compiled once per
+    config version. Rendering a user is then plain string concatenation.
+    """
+
+    def __init__(self, ipv4: str | None, ipv6: str | None, nodes: List[tuple[str, str]], normal_sub: str | None):
+        self.ipv4 = ipv4
+        self.ipv6 = ipv6
+        self.nodes = nodes
+        self.normal_sub = normal_sub
+
+    def render(self, username: str, auth_password: str) -> Dict[str, Any]:
+        prefix = f"hysteria2://{username}:{auth_password}"
+        return {
+            "username": username,
+            "ipv4": prefix + self.ipv4 if self.ipv4 else None,
+            "ipv6": prefix + self.ipv6 if self.ipv6 else None,
+            "nodes": [{"name": name, "uri": prefix + suffix} for name, suffix in self.nodes],
+            "normal_sub": f"{self.normal_sub}{auth_password}#Hysteria2" if self.normal_sub else None,
+        }
+
+
+def get_templates() -> UriTemplates:
+    return _compile_templates(_config_signature())
+
+
+@lru_cache(maxsize=4)
+def _compile_templates(signature: tuple) -> UriTemplates:
     config = load_json_file(CONFIG_FILE)
     if not config:
-        print("Error: Could not load Hysteria2 configuration file.", file=sys.stderr)
-        sys.exit(1)
-        
-    if db is None:
-        print("Error: Database connection failed.", file=sys.stderr)
-        sys.exit(1)
+        raise UriGenerationError("Could not load Hysteria2 configuration file.")
 
     nodes = load_json_file(NODES_JSON_PATH) or []
-    
+
     default_port = config.get("listen", "").split(":")[-1]
     tls_config = config.get("tls", {})
     hy2_env = load_env_file(CONFIG_ENV)
@@ -82,116 +123,131 @@ def process_users(target_usernames: List[str]) -> List[Dict[str, Any]]:
     default_pin = tls_config.get("pinSHA256")
     default_insecure = tls_config.get("insecure", True)
     server_name = hy2_env.get('SERVER_NAME', '')
-    
-    base_uri_params = {"insecure": "1" if default_insecure else "0"}
-    if default_sni: base_uri_params["sni"] = default_sni
-    if default_obfs:
-        base_uri_params["obfs"] = "salamander"
-        base_uri_params["obfs-password"] = default_obfs
-    if default_pin: base_uri_params["pinSHA256"] = hex_pin_to_uri(default_pin)
-    if port_hopping_enabled and port_hopping_range:
-        base_uri_params["mport"] = port_hopping_range
-        if hop_interval:
-            base_uri_params["mportHopInt"] = hop_interval
+
+    def build_params(insecure, sni, obfs, pin) -> Dict[str, str]:
+        params = {"insecure": "1" if insecure else "0"}
+        if sni: params["sni"] = sni
+        if obfs:
+            params["obfs"] = "salamander"
+            params["obfs-password"] = obfs
+        if pin: params["pinSHA256"] = hex_pin_to_uri(pin)
+        if port_hopping_enabled and port_hopping_range:
+            params["mport"] = port_hopping_range
+            if hop_interval:
+                params["mportHopInt"] = hop_interval
+        return params
+
+    base_uri_params = build_params(default_insecure, default_sni, default_obfs, default_pin)
 
     ip4 = hy2_env.get('IP4')
     ip6 = hy2_env.get('IP6')
-    ns_domain, ns_port, ns_subpath = ns_env.get('HYSTERIA_DOMAIN'), ns_env.get('HYSTERIA_PORT'), ns_env.get('SUBPATH')
-
-    results = []
-    for username in target_usernames:
-        user_data = db.get_user(username)
-        if not user_data or "password" not in user_data:
-            results.append({"username": username, "error": "User not found or password not set"})
+    has_ip4 = bool(ip4) and ip4 != "None"
+    has_ip6 = bool(ip6) and ip6 != "None"
+
+    ipv4_suffix = ipv6_suffix = None
+    if has_ip4:
+        tag = server_name if server_name else "IPv4"
+        if server_name and has_ip6:
+            tag = f"{server_name} (IPv4)"
+        ipv4_suffix = endpoint_suffix(ip4, default_port, base_uri_params, 4, tag)
+
+    if has_ip6:
+        tag = server_name if server_name else "IPv6"
+        if server_name and has_ip4:
+            tag = f"{server_name} (IPv6)"
+        ipv6_suffix = endpoint_suffix(ip6, default_port, base_uri_params, 6, tag)
+
+    node_suffixes = []
+    for node in nodes:
+        node_name = node.get("name")
+        node_ip = node.get("ip")
+        if not node_name or not node_ip:
             continue
 
-        auth_password = user_data["password"]
-        user_output = {"username": username, "ipv4": None, "ipv6": None, "nodes": [], "normal_sub": None}
-
-        if ip4 and ip4 != "None":
-            tag = server_name if server_name else "IPv4"
-            if server_name and ip6 and ip6 != "None":
-                tag = f"{server_name} (IPv4)"
-            user_output["ipv4"] = generate_uri(username, auth_password, ip4, default_port, base_uri_params, 4, tag)
-            
-        if ip6 and ip6 != "None":
-            tag = server_name if server_name else "IPv6"
-            if server_name and ip4 and ip4 != "None":
-                tag = f"{server_name} (IPv6)"
-            user_output["ipv6"] = generate_uri(username, auth_password, ip6, default_port, base_uri_params, 6, tag)
-
-        for node in nodes:
-            node_name = node.get("name")
-            node_ip = node.get("ip")
-            if not node_name or not node_ip:
+        node_params = build_params(
+            node.get("insecure", default_insecure),
+            node.get("sni", default_sni),
+            node.get("obfs", default_obfs),
+            node.get("pinSHA256", default_pin),
+        )
+        node_port = str(node.get("port", default_port))
+        ip_v = 6 if ':' in node_ip else 4
+        node_suffixes.append((node_name, endpoint_suffix(node_ip, node_port, node_params, ip_v, node_name)))
+
+    normal_sub = None
+    ns_domain, ns_port, ns_subpath = ns_env.get('HYSTERIA_DOMAIN'), ns_env.get('HYSTERIA_PORT'), ns_env.get('SUBPATH')
+    if ns_domain:
+        port_part = ""
+        if ns_port and ns_port != "80" and ns_port != "443":
+            port_part = f":{ns_port}"
+        normal_sub = f"https://{ns_domain}{port_part}/{ns_subpath}/"
+
+    return UriTemplates(ipv4_suffix, ipv6_suffix, node_suffixes, normal_sub)
+
+
+def iter_users(target_usernames: List[str] | None = None) -> Iterator[Dict[str, Any]]:
+    """
+    Yield one result per user. Passwords are fetched with one projected
+    query per batch (or a single scan for all users) instead of one lookup
+    per user; explicit usernames keep their order and unknown ones yield an
+    error entry.
+    """
+    templates = get_templates()
+    if db is None:
+        raise UriGenerationError("Database connection failed.")
+
+    if target_usernames is None:
+        for user in db.collection.find({}, {"password": 1}).sort("_id", 1):
+            if user.get("password"):
+                yield templates.render(user["_id"], user["password"])
+            else:
+                yield {"username": user["_id"], "error": "User not found or password not set"}
+        return
+
+    for start in range(0, len(target_usernames), BATCH_SIZE):
+        batch = target_usernames[start:start + BATCH_SIZE]
+        passwords = {user["_id"]: user.get("password") for user in db.get_users(batch, {"password": 1})}
+        for username in batch:
+            auth_password = passwords.get(username.lower())
+            if not auth_password:
+                yield {"username": username, "error": "User not found or password not set"}
                 continue
+            yield templates.render(username, auth_password)
+
+
+def process_users(target_usernames: List[str]) -> List[Dict[str, Any]]:
+    return list(iter_users(target_usernames))
+
+
+def write_json_stream(results: Iterator[Dict[str, Any]], out: TextIO = sys.stdout):
+    out.write("[")
+    separator = "\n"
+    for result in results:
+        out.write(separator)
+        out.write(json.dumps(result))
+        separator = ",\n"
+    out.write("\n]\n")
 
-            ip_v = 6 if ':' in node_ip else 4
-            tag = node_name
-
-            node_port = str(node.get("port", default_port))
-            node_sni = node.get("sni", default_sni)
-            node_obfs = node.get("obfs", default_obfs)
-            node_pin = node.get("pinSHA256", default_pin)
-            node_insecure = node.get("insecure", default_insecure)
-            
-            node_params = {"insecure": "1" if node_insecure else "0"}
-            if node_sni: node_params["sni"] = node_sni
-            if node_obfs:
-                node_params["obfs"] = "salamander"
-                node_params["obfs-password"] = node_obfs
-            if node_pin: node_params["pinSHA256"] = hex_pin_to_uri(node_pin)
-            if port_hopping_enabled and port_hopping_range:
-                node_params["mport"] = port_hopping_range
-                if hop_interval:
-                    node_params["mportHopInt"] = hop_interval
-            
-            uri = generate_uri(username, auth_password, node_ip, node_port, node_params, ip_v, tag)
-            user_output["nodes"].append({"name": node_name, "uri": uri})
-        
-        if ns_domain:
-            port_part = ""
-            if ns_port and ns_port != "80" and ns_port != "443":
-                port_part = f":{ns_port}"
-            
-            path_part = ns_subpath if ns_subpath else ""
-            if path_part and not path_part.startswith('/'):
-                 path_part = '/' + path_part
-            elif not path_part:
-                 path_part = "/" 
-            
-            
-            user_output["normal_sub"] = f"https://{ns_domain}{port_part}/{ns_subpath}/{auth_password}#Hysteria2"
-
-        results.append(user_output)
-        
-    return results
 
 def main():
     parser = argparse.ArgumentParser(description="Efficiently generate Hysteria2 URIs for multiple users.")
     parser.add_argument('usernames', nargs='*', help="A list of usernames to process.")
     parser.add_argument('--all', action='store_true', help="Process all users from the database.")
-    
+
     args = parser.parse_args()
-    target_usernames = args.usernames
-    
-    if args.all:
-        if db is None:
-            print("Error: Database connection failed.", file=sys.stderr)
-            sys.exit(1)
-        try:
-            all_users_docs = db.get_all_users()
-            target_usernames = [user['_id'] for user in all_users_docs]
-        except Exception as e:
-            print(f"Error retrieving all users from database: {e}", file=sys.stderr)
-            sys.exit(1)
-            
-    if not target_usernames:
+
+    if not args.all and not args.usernames:
         parser.print_help()
         sys.exit(1)
 
-    output_list = process_users(target_usernames)
-    print(json.dumps(output_list, indent=2))
+    try:
+        write_json_stream(iter_users(None if args.all else args.usernames))
+    except UriGenerationError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error retrieving users from database: {e}", file=sys.stderr)
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,56 +1,98 @@
 import requests
-from types import SimpleNamespace
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, NamedTuple
+
+DEFAULT_TIMEOUT = 5
+KICK_BATCH_SIZE = 500
+KICK_MAX_WORKERS = 4
+
+
+class Hysteria2Error(Exception):
+    pass
+
+
+class TrafficStats(NamedTuple):
+    upload_bytes: int
+    download_bytes: int
+
+
+class OnlineStatus(NamedTuple):
+    is_online: bool
+    connections: Any
+
+
+def parse_traffic_stats(data: Dict[str, Any]) -> Dict[str, TrafficStats]:
+    return {
+        user: TrafficStats(stats.get('tx', 0), stats.get('rx', 0))
+        for user, stats in data.items()
+    }
+
+
+def parse_online_clients(data: Dict[str, Any]) -> Dict[str, OnlineStatus]:
+    result = {}
+    for user, conns in data.items():
+        if isinstance(conns, list):
+            result[user] = OnlineStatus(len(conns) > 0, conns)
+        elif isinstance(conns, int):
+            result[user] = OnlineStatus(conns > 0, conns)
+        else:
+            result[user] = OnlineStatus(bool(conns), [])
+    return result
+
+
+def split_batches(usernames: List[str], batch_size: int) -> List[List[str]]:
+    return [usernames[i:i + batch_size] for i in range(0, len(usernames), batch_size)]
+
 
 class Hysteria2Client:
-    def __init__(self, base_url: str, secret: str):
+    def __init__(self, base_url: str, secret: str, timeout: float = DEFAULT_TIMEOUT):
         self.base_url = base_url.rstrip('/')
         self.secret = secret
+        self.timeout = timeout
         self.headers = {'Authorization': secret}
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
 
-    def get_traffic_stats(self, clear: bool = False) -> Dict[str, Any]:
+    def close(self):
+        self.session.close()
+
+    def get_traffic_stats(self, clear: bool = False) -> Dict[str, TrafficStats] | None:
         url = f"{self.base_url}/traffic"
         params = {'clear': '1'} if clear else {}
         try:
-            resp = requests.get(url, headers=self.headers, params=params, timeout=5)
+            resp = self.session.get(url, params=params, timeout=self.timeout)
             if resp.status_code == 200:
-                data = resp.json()
-                result = {}
-                for user, stats in data.items():
-                    result[user] = SimpleNamespace(
-                        upload_bytes=stats.get('tx', 0),
-                        download_bytes=stats.get('rx', 0)
-                    )
-                return result
+                return parse_traffic_stats(resp.json())
         except Exception:
             return None
         return {}
 
-    def get_online_clients(self) -> Dict[str, Any] | None:
-        url = f"{self.base_url}/online" 
+    def get_online_clients(self) -> Dict[str, OnlineStatus] | None:
+        url = f"{self.base_url}/online"
         try:
-            resp = requests.get(url, headers=self.headers, timeout=5)
+            resp = self.session.get(url, timeout=self.timeout)
             if resp.status_code == 200:
-                data = resp.json()
-                result = {}
-                for user, conns in data.items():
-                    is_online = False
-                    conn_val = []
-                    
-                    if isinstance(conns, list):
-                        is_online = len(conns) > 0
-                        conn_val = conns
-                    elif isinstance(conns, int):
-                        is_online = conns > 0
-                        conn_val = conns
-                    elif conns:
-                         is_online = True
-                    
-                    result[user] = SimpleNamespace(
-                        is_online=is_online,
-                        connections=conn_val
-                    )
-                return result
+                return parse_online_clients(resp.json())
         except Exception:
-             return None
+            return None
         return {}
+
+    def _kick_batch(self, usernames: List[str]):
+        try:
+            resp = self.session.post(f"{self.base_url}/kick", json=usernames, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise Hysteria2Error(f"Failed to reach Hysteria2 API: {e}") from e
+        if resp.status_code >= 300:
+            raise Hysteria2Error(f"Kick request failed with status {resp.status_code}: {resp.text.strip()}")
+
+    def kick_clients(self, usernames: List[str], batch_size: int = KICK_BATCH_SIZE, max_workers: int = KICK_MAX_WORKERS):
+        batches = split_batches(list(usernames), batch_size)
+        if len(batches) <= 1:
+            for batch in batches:
+                self._kick_batch(batch)
+            return
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as executor:
+            for future in [executor.submit(self._kick_batch, batch) for batch in batches]:
+                future.result()
+
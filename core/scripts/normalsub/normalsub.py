@@ -1,13 +1,18 @@
 import os
 import json
-import subprocess
 import re
 import time
 import shlex
 import base64
+import hashlib
+import gzip
+import ipaddress
+import asyncio
 import sys
 from typing import Dict, List, Optional, Tuple, Any
 from dataclasses import dataclass, field
+from functools import cached_property
+from collections import OrderedDict
 from io import BytesIO
 
 from aiohttp import web
@@ -17,8 +22,19 @@ from dotenv import load_dotenv
 import qrcode
 from jinja2 import Environment, FileSystemLoader, BaseLoader
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-from db.database import db
+from db.async_database import AsyncDatabase
+from pymongo.errors import OperationFailure
 
 load_dotenv()
 
@@ -31,7 +47,7 @@ class AppConfig:
     aiohttp_listen_port: int
     sni_file: str
     singbox_template_path: str
-    hysteria_cli_path: str
+    hysteria_config_path: str
     nodes_json_path: str
     extra_config_path: str
     rate_limit: int
@@ -43,26 +59,125 @@ class AppConfig:
     show_username: bool
     support_url: str
     announce: str # New Field
+    mongo_pool_size: int
+    uri_cache_size: int
+    token_cache_size: int
+    token_cache_ttl: float
+    miss_cache_ttl: float
+    qr_format: str
+    qr_cache_size: int
+    qr_cache_dir: str
+    qr_cache_disk_max_files: int
+    singbox_compact: bool
+    etag_traffic_bucket: int
+    compress_min_size: int
+    rate_limit_max_entries: int
+    rate_limit_ipv6_prefix: int
+    rate_limit_stats_path: str
+    debug: bool
+    config_inotify: bool
 
 
 
 class RateLimiter:
-    def __init__(self, limit: int, window: int):
+    """Sliding-window request limiter with bounded memory.
+
+    Each client key keeps the request counts of the current and the previous
+    window; the previous one is weighted by how much of it still overlaps the
+    sliding window. Keys live in an LRU of at most ``max_entries``, idle keys
+    are swept every ``sweep_interval`` seconds, and IPv6 clients are grouped
+    by their /``ipv6_prefix`` network since one host usually owns a whole /64.
+    """
+
+    def __init__(self, limit: int, window: int, max_entries: int = 100000, ipv6_prefix: int = 64,
+                 sweep_interval: float = 60.0, stats_path: Optional[str] = None):
         self.limit = limit
         self.window = window
-        self.store: Dict[str, Tuple[int, float]] = {}
+        self.max_entries = max_entries
+        self.ipv6_prefix = ipv6_prefix
+        self.sweep_interval = sweep_interval
+        self.stats_path = stats_path
+        # key -> [window index, current count, previous count, last seen]
+        self.store: OrderedDict = OrderedDict()
+        self.allowed = 0
+        self.rejected = 0
+        self.evicted = 0
+        self.swept = 0
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def client_key(self, client_ip: str) -> str:
+        if ':' not in client_ip:
+            return client_ip
+        try:
+            return str(ipaddress.IPv6Network(f"{client_ip}/{self.ipv6_prefix}", strict=False))
+        except ValueError:
+            return client_ip
 
     def check_limit(self, client_ip: str) -> bool:
         current_time = time.monotonic()
-        requests, last_request_time = self.store.get(client_ip, (0, 0))
-        if current_time - last_request_time < self.window:
-            if requests >= self.limit:
-                return False
+        if current_time >= self._next_sweep:
+            self.sweep(current_time)
+
+        key = self.client_key(client_ip)
+        window_index = int(current_time // self.window)
+        entry = self.store.get(key)
+        if entry is None:
+            entry = [window_index, 0, 0, current_time]
+            self.store[key] = entry
+            if len(self.store) > self.max_entries:
+                self.store.popitem(last=False)
+                self.evicted += 1
         else:
-            requests = 0
-        self.store[client_ip] = (requests + 1, current_time)
+            self.store.move_to_end(key)
+            if window_index != entry[0]:
+                entry[2] = entry[1] if window_index == entry[0] + 1 else 0
+                entry[1] = 0
+                entry[0] = window_index
+        entry[3] = current_time
+
+        overlap = 1.0 - (current_time % self.window) / self.window
+        if entry[2] * overlap + entry[1] >= self.limit:
+            self.rejected += 1
+            return False
+        entry[1] += 1
+        self.allowed += 1
         return True
 
+    def sweep(self, current_time: Optional[float] = None) -> int:
+        # The store is in LRU order, so idle keys are all at the front.
+        current_time = time.monotonic() if current_time is None else current_time
+        cutoff = current_time - 2 * self.window
+        removed = 0
+        while self.store:
+            entry = next(iter(self.store.values()))
+            if entry[3] >= cutoff:
+                break
+            self.store.popitem(last=False)
+            removed += 1
+        self.swept += removed
+        self._next_sweep = current_time + self.sweep_interval
+        if self.stats_path:
+            self._write_stats()
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'entries': len(self.store),
+            'allowed': self.allowed,
+            'rejected': self.rejected,
+            'evicted': self.evicted,
+            'swept': self.swept,
+        }
+
+    def _write_stats(self):
+        try:
+            tmp_path = f"{self.stats_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({**self.stats(), 'timestamp': int(time.time())}, f)
+            os.replace(tmp_path, self.stats_path)
+        except OSError as e:
+            print(f"Warning: Could not write rate limit stats to {self.stats_path}: {e}")
+
 
 @dataclass
 class UriComponents:
@@ -73,7 +188,7 @@ class UriComponents:
     obfs_password: str
 
 
-@dataclass
+@dataclass(frozen=True)
 class UserInfo:
     username: str
     password: str
@@ -84,11 +199,29 @@ class UserInfo:
     expiration_days: int
     blocked: bool = False
 
+    PROJECTION = {
+        "password": 1, "upload_bytes": 1, "download_bytes": 1, "max_download_bytes": 1,
+        "account_creation_date": 1, "expiration_days": 1, "blocked": 1,
+    }
+
+    @classmethod
+    def from_doc(cls, user_doc: Dict[str, Any]) -> 'UserInfo':
+        return cls(
+            username=user_doc.get('_id'),
+            password=user_doc.get('password'),
+            upload_bytes=user_doc.get('upload_bytes', 0),
+            download_bytes=user_doc.get('download_bytes', 0),
+            max_download_bytes=user_doc.get('max_download_bytes', 0),
+            account_creation_date=user_doc.get('account_creation_date', ''),
+            expiration_days=user_doc.get('expiration_days', 0),
+            blocked=user_doc.get('blocked', False)
+        )
+
     @property
     def total_usage(self) -> int:
         return self.upload_bytes + self.download_bytes
 
-    @property
+    @cached_property
     def expiration_timestamp(self) -> int:
         if not self.account_creation_date or self.expiration_days <= 0:
             return 0
@@ -162,18 +295,6 @@ class Utils:
             raise ValueError(f"Invalid value: {value}")
         return shlex.quote(value)
 
-    @staticmethod
-    def generate_qrcode_base64(data: str) -> str:
-        if not data:
-            return None
-        qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=4)
-        qr.add_data(data)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white")
-        buffered = BytesIO()
-        img.save(buffered, format="PNG")
-        return "data:image/png;base64," + base64.b64encode(buffered.getvalue()).decode()
-
     @staticmethod
     def human_readable_bytes(bytes_value: int) -> str:
         units = ["Bytes", "KB", "MB", "GB", "TB"]
@@ -197,63 +318,693 @@ class Utils:
             return False
 
 
-class HysteriaCLI:
-    def __init__(self, cli_path: str):
-        self.cli_path = cli_path
+class LRUCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
 
-    def _run_command(self, args: List[str]) -> str:
+    def get(self, key: Any) -> Any:
         try:
-            command = ['python3', self.cli_path] + args
-            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            stdout, stderr = process.communicate()
-            if process.returncode != 0:
-                if "User not found" in stderr:
-                    return None
-                else:
-                    print(f"Hysteria CLI error: {stderr}")
-                    raise subprocess.CalledProcessError(process.returncode, command, output=stdout, stderr=stderr)
-            return stdout.strip()
-        except subprocess.CalledProcessError as e:
-            print(f"Hysteria CLI error: {e}")
-            raise
-
-    def get_username_by_password(self, password_token: str) -> Optional[str]:
-        if not db:
+            self._data.move_to_end(key)
+        except KeyError:
             return None
-        user_doc = db.collection.find_one({"password": password_token}, {"_id": 1})
-        return user_doc['_id'] if user_doc else None
+        return self._data[key]
+
+    def set(self, key: Any, value: Any):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
 
-    def get_user_info(self, username: str) -> Optional[UserInfo]:
-        if not db:
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TTLCache(LRUCache):
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__(maxsize)
+        self.ttl = ttl
+
+    def get(self, key: Any) -> Any:
+        entry = super().get(key)
+        if entry is None:
             return None
-        user_doc = db.get_user(username)
-        if not user_doc:
+        value, expires = entry
+        if expires < time.monotonic():
+            self.pop(key)
             return None
-        
-        return UserInfo(
-            username=user_doc.get('_id'),
-            password=user_doc.get('password'),
-            upload_bytes=user_doc.get('upload_bytes', 0),
-            download_bytes=user_doc.get('download_bytes', 0),
-            max_download_bytes=user_doc.get('max_download_bytes', 0),
-            account_creation_date=user_doc.get('account_creation_date', ''),
-            expiration_days=user_doc.get('expiration_days', 0),
-            blocked=user_doc.get('blocked', False)
-        )
+        return value
+
+    def set(self, key: Any, value: Any):
+        super().set(key, (value, time.monotonic() + self.ttl))
+
+    def pop(self, key: Any):
+        self._data.pop(key, None)
 
-    def get_all_uris(self, username: str) -> List[str]:
-        output = self._run_command(['show-user-uri', '-u', username, '-a'])
-        if not output:
+
+@dataclass(frozen=True)
+class UriEndpoint:
+    label: str
+    host: str
+    port: str
+    query: str
+    fragment: str
+    server: str = ''
+    sni: str = ''
+    insecure: bool = True
+    obfs_password: str = ''
+    pin: str = ''
+    mport: str = ''
+
+    def render(self, username: str, password: str) -> str:
+        return f"hysteria2://{username}:{password}@{self.host}:{self.port}?{self.query}#{self.fragment}"
+
+    def singbox_outbound(self, username: str, password: str, fallback_sni: str, hop_interval: int) -> Optional[Dict[str, Any]]:
+        # Same outbound SingboxConfigGenerator.generate_config_from_uri derives from render().
+        try:
+            server_port = int(self.port)
+        except ValueError:
+            return None
+
+        tls_config = {"enabled": True, "server_name": self.sni or fallback_sni, "insecure": self.insecure}
+        if self.pin and not self.insecure:
+            tls_config["certificate"] = {"raw_sha256": self.pin.removeprefix("sha256/")}
+
+        outbound = {
+            "type": "hysteria2",
+            "tag": unquote(self.fragment),
+            "server": self.server.lower(),
+            "server_port": server_port,
+            "password": f"{username}:{password}" if password else username,
+            "tls": tls_config
+        }
+        if self.obfs_password:
+            outbound["obfs"] = {"type": "salamander", "password": self.obfs_password}
+        if self.mport:
+            outbound["server_ports"] = [self.mport.replace('-', ':')]
+            outbound.pop("server_port")
+            outbound["hop_interval"] = f"{hop_interval}s"
+        return outbound
+
+
+class UriBuilder:
+    """Builds the same URIs as ``show_user_uri.py -a`` without forking the CLI.
+
+    Server-side parameters are parsed once per config version, where the
+    version is the (mtime, size) of config.json, .configs.env and nodes.json.
+    Rendered URI lists are kept in a per-user LRU keyed by password and version.
+    """
+
+    def __init__(self, config_path: str, env_path: str, nodes_path: str, cache_size: int = 4096, check_interval: float = 1.0):
+        self.paths = (config_path, env_path, nodes_path)
+        self.check_interval = check_interval
+        self.version: Optional[Tuple] = None
+        self.endpoints: List[UriEndpoint] = []
+        self._last_check = 0.0
+        self._uri_cache = LRUCache(cache_size)
+
+    def _signature(self) -> Tuple:
+        signature = []
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def refresh(self):
+        now = time.monotonic()
+        if self.version is not None and now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        signature = self._signature()
+        if signature != self.version:
+            self.endpoints = self._build_endpoints()
+            self.version = signature
+            self._uri_cache.clear()
+
+    @staticmethod
+    def _load_env(path: str) -> Dict[str, str]:
+        env_vars = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith('#') and '=' in line:
+                        key, value = line.split('=', 1)
+                        env_vars[key.strip()] = value.strip()
+        except OSError:
+            pass
+        return env_vars
+
+    @staticmethod
+    def _load_nodes(path: str) -> List[Dict[str, Any]]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            return json.loads(content) if content else []
+        except (OSError, json.JSONDecodeError):
             return []
-        return re.findall(r'hysteria2://.*', output)
 
-    def get_all_labeled_uris(self, username: str) -> List[Dict[str, str]]:
-        output = self._run_command(['show-user-uri', '-u', username, '-a'])
-        if not output:
+    @staticmethod
+    def _build_query(obfs_password: str, sha256: str, sni: str, insecure: bool, mport: str = '', hop_interval: str = '') -> str:
+        params = []
+        if obfs_password:
+            params.append(f"obfs=salamander&obfs-password={obfs_password}")
+        if sha256:
+            params.append(f"pinSHA256={sha256.replace(':', '')}")
+        if sni:
+            params.append(f"sni={sni}")
+        params.append(f"insecure={'1' if insecure else '0'}")
+        if mport:
+            params.append(f"mport={mport}")
+        if mport and hop_interval:
+            params.append(f"mportHopInt={hop_interval}")
+        return "&".join(params)
+
+    @staticmethod
+    def _host(ip: str, ip_version: int) -> str:
+        return f"[{ip}]" if ip_version == 6 and ':' in ip else ip
+
+    def _build_endpoints(self) -> List[UriEndpoint]:
+        config_path, env_path, nodes_path = self.paths
+        try:
+            with open(config_path, 'r') as f:
+                config = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Warning: Could not load Hysteria2 config {config_path}: {e}")
             return []
-        
-        matches = re.findall(r"^(.*?):\s*(hysteria2://.*)$", output, re.MULTILINE)
-        return [{'label': label.strip(), 'uri': uri} for label, uri in matches]
+
+        env = self._load_env(env_path)
+        ip4, ip6 = env.get('IP4', 'None'), env.get('IP6', 'None')
+        sni = env.get('SNI', '')
+        server_name = env.get('SERVER_NAME', '')
+        port_hopping_enabled = env.get('PORT_HOPPING', 'false').lower() == 'true'
+        port_hopping_range = env.get('PORT_HOPPING_RANGE', '')
+        hop_interval = env.get('HOP_INTERVAL', '') if port_hopping_enabled else ''
+        mport = port_hopping_range if port_hopping_enabled and port_hopping_range else ''
+
+        local_port = config.get("listen", "").split(":")[-1]
+        local_sha256 = config.get("tls", {}).get("pinSHA256", "")
+        local_obfs = config.get("obfs", {}).get("salamander", {}).get("password", "")
+        local_insecure = config.get("tls", {}).get("insecure", True)
+        local_query = self._build_query(local_obfs, local_sha256, sni, local_insecure, mport, hop_interval)
+
+        local_fields = {
+            'sni': sni, 'insecure': bool(local_insecure), 'obfs_password': local_obfs,
+            'pin': local_sha256.replace(':', '') if local_sha256 else '', 'mport': mport,
+        }
+
+        has_ip4 = bool(ip4) and ip4 != "None"
+        has_ip6 = bool(ip6) and ip6 != "None"
+        endpoints = []
+        if has_ip4:
+            tag = f"{server_name} (IPv4)" if server_name and has_ip6 else (server_name or "IPv4")
+            endpoints.append(UriEndpoint(tag, self._host(ip4, 4), local_port, local_query, tag, server=ip4, **local_fields))
+        if has_ip6:
+            tag = f"{server_name} (IPv6)" if server_name and has_ip4 else (server_name or "IPv6")
+            endpoints.append(UriEndpoint(tag, self._host(ip6, 6), local_port, local_query, tag, server=ip6, **local_fields))
+
+        for node in self._load_nodes(nodes_path):
+            node_name = node.get("name")
+            node_ip = node.get("ip")
+            if not node_name or not node_ip:
+                continue
+            ip_v = 4 if '.' in node_ip else 6
+            node_obfs = node.get("obfs", local_obfs)
+            node_sha256 = node.get("pinSHA256", local_sha256)
+            node_sni = node.get("sni", sni)
+            node_insecure = node.get("insecure", local_insecure)
+            query = self._build_query(node_obfs, node_sha256, node_sni, node_insecure)
+            endpoints.append(UriEndpoint(
+                f"Node: {node_name} (IPv{ip_v})",
+                self._host(node_ip, ip_v),
+                str(node.get("port", local_port)),
+                query,
+                node_name,
+                server=node_ip,
+                sni=node_sni or '',
+                insecure=bool(node_insecure),
+                obfs_password=node_obfs or '',
+                pin=node_sha256.replace(':', '') if node_sha256 else ''
+            ))
+        return endpoints
+
+    def get_endpoints(self) -> Tuple[Optional[Tuple], List[UriEndpoint]]:
+        self.refresh()
+        return self.version, self.endpoints
+
+    def get_labeled_uris(self, username: str, password: str) -> List[Dict[str, str]]:
+        self.refresh()
+        key = (username, password, self.version)
+        labeled = self._uri_cache.get(key)
+        if labeled is None:
+            labeled = [{'label': e.label, 'uri': e.render(username, password)} for e in self.endpoints]
+            self._uri_cache.set(key, labeled)
+        return labeled
+
+
+class QRCodeCache:
+    """Rendered QR images keyed by a hash of their payload.
+
+    Pages only embed ``/qr/<key>.<fmt>`` URLs; the image itself is encoded the
+    first time it is requested and then served from memory (and optionally
+    from ``disk_dir``) with a strong ETag. With a ``disk_dir`` the payloads
+    are stored next to the images, so keys stay valid across restarts and
+    memory evictions; the directory is pruned to ``disk_max_files`` keys,
+    least recently registered first.
+    """
+
+    FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+    PAYLOAD_SUFFIX = 'txt'
+    PRUNE_EVERY = 256
+
+    def __init__(self, maxsize: int = 2048, disk_dir: Optional[str] = None, disk_max_files: int = 20000):
+        self._payloads = LRUCache(maxsize * 8)
+        self._images = LRUCache(maxsize)
+        self.disk_dir = disk_dir
+        self.disk_max_files = disk_max_files
+        self._disk_writes = 0
+        if disk_dir:
+            try:
+                os.makedirs(disk_dir, exist_ok=True)
+            except OSError as e:
+                print(f"Warning: QR disk cache disabled, cannot create {disk_dir}: {e}")
+                self.disk_dir = None
+            else:
+                self._prune_disk()
+
+    @staticmethod
+    def key_for(payload: str) -> str:
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+    def register(self, payload: str) -> Optional[str]:
+        if not payload:
+            return None
+        key = self.key_for(payload)
+        if self._payloads.get(key) is None:
+            self._payloads.set(key, payload)
+            self._store_payload(key, payload)
+        return key
+
+    def _store_payload(self, key: str, payload: str):
+        disk_path = self._disk_path(key, self.PAYLOAD_SUFFIX)
+        if not disk_path:
+            return
+        try:
+            # An existing file is only touched, which marks it recently used.
+            os.utime(disk_path)
+            return
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Warning: Could not touch QR cache file {disk_path}: {e}")
+            return
+        self._write_file(disk_path, payload.encode('utf-8'))
+        self._disk_writes += 1
+        if self._disk_writes % self.PRUNE_EVERY == 0:
+            self._prune_disk()
+
+    def _load_payload(self, key: str) -> Optional[str]:
+        payload = self._payloads.get(key)
+        if payload is not None:
+            return payload
+        disk_path = self._disk_path(key, self.PAYLOAD_SUFFIX)
+        if not disk_path:
+            return None
+        try:
+            with open(disk_path, 'rb') as f:
+                payload = f.read().decode('utf-8')
+        except (OSError, UnicodeDecodeError):
+            return None
+        # Reject a file that does not belong to its key.
+        if self.key_for(payload) != key:
+            return None
+        self._payloads.set(key, payload)
+        return payload
+
+    def _prune_disk(self):
+        newest = {}
+        try:
+            with os.scandir(self.disk_dir) as entries:
+                for entry in entries:
+                    key = entry.name.split('.', 1)[0]
+                    try:
+                        mtime = entry.stat().st_mtime
+                    except OSError:
+                        continue
+                    newest[key] = max(newest.get(key, 0.0), mtime)
+        except OSError as e:
+            print(f"Warning: Could not scan QR cache dir {self.disk_dir}: {e}")
+            return
+        excess = len(newest) - self.disk_max_files
+        if excess <= 0:
+            return
+        stale = set(sorted(newest, key=newest.get)[:excess])
+        for name in os.listdir(self.disk_dir):
+            if name.split('.', 1)[0] in stale:
+                try:
+                    os.remove(os.path.join(self.disk_dir, name))
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _write_file(path: str, data: bytes):
+        try:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: Could not write QR cache file {path}: {e}")
+
+    @staticmethod
+    def _encode(payload: str, fmt: str) -> bytes:
+        qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=4)
+        qr.add_data(payload)
+        qr.make(fit=True)
+        buffered = BytesIO()
+        if fmt == 'svg':
+            from qrcode.image.svg import SvgPathImage
+            qr.make_image(image_factory=SvgPathImage).save(buffered)
+        else:
+            qr.make_image(fill_color="black", back_color="white").save(buffered, format="PNG")
+        return buffered.getvalue()
+
+    def _disk_path(self, key: str, fmt: str) -> Optional[str]:
+        return os.path.join(self.disk_dir, f"{key}.{fmt}") if self.disk_dir else None
+
+    def get_image(self, key: str, fmt: str) -> Optional[bytes]:
+        image = self._images.get((key, fmt))
+        if image is not None:
+            return image
+
+        disk_path = self._disk_path(key, fmt)
+        if disk_path and os.path.exists(disk_path):
+            try:
+                with open(disk_path, 'rb') as f:
+                    image = f.read()
+            except OSError:
+                image = None
+
+        if image is None:
+            payload = self._load_payload(key)
+            if payload is None:
+                return None
+            image = self._encode(payload, fmt)
+            if disk_path:
+                self._write_file(disk_path, image)
+
+        self._images.set((key, fmt), image)
+        return image
+
+
+ENTITY_TAG_RE = re.compile(r'[\s,]*(?:W/)?("[^"]*")\s*(?:,|$)')
+
+
+def matching_etag(if_none_match: str, etags: List[str]) -> Optional[str]:
+    """Return the first of ``etags`` that an If-None-Match header matches.
+
+    Tags are compared weakly (a ``W/`` prefix is ignored) and exactly; ``*``
+    matches the first entry. A malformed header matches nothing.
+    """
+    if_none_match = if_none_match.strip()
+    if not if_none_match:
+        return None
+    if if_none_match == '*':
+        return etags[0] if etags else None
+    requested = set()
+    pos = 0
+    while if_none_match[pos:].strip(', \t'):
+        match = ENTITY_TAG_RE.match(if_none_match, pos)
+        if match is None or match.end() == pos:
+            return None
+        requested.add(match.group(1))
+        pos = match.end()
+    return next((etag for etag in etags if etag in requested), None)
+
+
+def file_signature(path: str) -> Optional[Tuple[int, int, int]]:
+    # The inode catches atomic replacements (write + rename) that keep mtime and size.
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class FileCache:
+    """The parsed contents of one file, reloaded when its signature changes.
+
+    The file is stat'ed at most once per check_interval, or only after an
+    inotify event once a FileWatcher watches it. The (signature, value) pair
+    is swapped as one tuple, and a file that fails to load keeps serving the
+    last good value until it changes again.
+    """
+
+    def __init__(self, path: str, loader, default: Any = None, check_interval: float = 1.0):
+        self.path = path
+        self.loader = loader
+        self.default = default
+        self.check_interval = check_interval
+        self.watched = False
+        self._state: Tuple[Optional[Tuple], Any] = (None, default)
+        self._dirty = True
+        self._last_check = 0.0
+
+    def invalidate(self):
+        self._dirty = True
+
+    def get(self) -> Any:
+        now = time.monotonic()
+        if not self._dirty and (self.watched or now - self._last_check < self.check_interval):
+            return self._state[1]
+        self._dirty = False
+        self._last_check = now
+        signature = file_signature(self.path)
+        if signature != self._state[0]:
+            value = self.default
+            if signature is not None:
+                try:
+                    value = self.loader(self.path)
+                except Exception as e:
+                    print(f"Warning: Could not load {self.path}, keeping the previous version: {e}")
+                    value = self._state[1]
+            self._state = (signature, value)
+        return self._state[1]
+
+    def version(self) -> Optional[Tuple]:
+        self.get()
+        return self._state[0]
+
+
+class FileWatcher:
+    """Invalidates FileCaches from inotify events on their parent directories.
+
+    Directories are watched rather than files so that editors and tools that
+    replace a file by renaming over it are still noticed. Without the optional
+    inotify_simple package every cache keeps polling.
+    """
+
+    def __init__(self):
+        self._caches: List[FileCache] = []
+        self._watches: Dict[int, Dict[str, List[FileCache]]] = {}
+        self._inotify = None
+        self._loop = None
+
+    def add(self, cache: FileCache):
+        self._caches.append(cache)
+
+    def start(self, loop) -> bool:
+        if INotify is None or not self._caches:
+            return False
+        mask = (inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO | inotify_flags.MOVED_FROM
+                | inotify_flags.CREATE | inotify_flags.DELETE)
+        try:
+            self._inotify = INotify()
+        except OSError as e:
+            print(f"Warning: inotify is unavailable, polling config files instead: {e}")
+            return False
+        directories: Dict[str, int] = {}
+        for cache in self._caches:
+            directory, name = os.path.split(os.path.abspath(cache.path))
+            try:
+                if directory not in directories:
+                    directories[directory] = self._inotify.add_watch(directory, mask)
+            except OSError as e:
+                print(f"Warning: Could not watch {directory}, polling {cache.path} instead: {e}")
+                continue
+            self._watches.setdefault(directories[directory], {}).setdefault(name, []).append(cache)
+            cache.watched = True
+            cache.invalidate()
+        self._loop = loop
+        loop.add_reader(self._inotify.fileno(), self._on_events)
+        return True
+
+    def _on_events(self):
+        for event in self._inotify.read(timeout=0):
+            if event.mask & inotify_flags.Q_OVERFLOW:
+                for cache in self._caches:
+                    cache.invalidate()
+                continue
+            for cache in self._watches.get(event.wd, {}).get(event.name, ()):
+                cache.invalidate()
+
+    def stop(self):
+        if self._inotify is None:
+            return
+        self._loop.remove_reader(self._inotify.fileno())
+        self._inotify.close()
+        self._inotify = None
+        for cache in self._caches:
+            cache.watched = False
+            cache.invalidate()
+
+
+class BodyCompressor:
+    """gzip/brotli copies of response bodies, cached per ETag and coding.
+
+    Only bodies of at least ``min_size`` bytes are compressed; brotli is used
+    when the module is installed and the client accepts it.
+    """
+
+    def __init__(self, min_size: int = 1024, cache_size: int = 1024):
+        self.min_size = min_size
+        self._cache = LRUCache(cache_size)
+
+    def negotiate(self, accept_encoding: str, size: int) -> Optional[str]:
+        if size < self.min_size or not accept_encoding:
+            return None
+        accepted = set()
+        for item in accept_encoding.lower().split(','):
+            coding, _, params = item.partition(';')
+            params = params.strip()
+            try:
+                quality = float(params[2:]) if params.startswith('q=') else 1.0
+            except ValueError:
+                quality = 0.0
+            if quality > 0:
+                accepted.add(coding.strip())
+        if brotli is not None and 'br' in accepted:
+            return 'br'
+        if 'gzip' in accepted:
+            return 'gzip'
+        return None
+
+    def compress(self, digest: str, coding: str, body: bytes) -> bytes:
+        key = (digest, coding)
+        compressed = self._cache.get(key)
+        if compressed is None:
+            if coding == 'br':
+                compressed = brotli.compress(body, quality=5)
+            else:
+                compressed = gzip.compress(body, compresslevel=6)
+            self._cache.set(key, compressed)
+        return compressed
+
+
+class HysteriaCLI:
+    # Changes that can alter how a token resolves; traffic counters are left
+    # to expire with the cache so the stream stays quiet.
+    WATCH_PIPELINE = [{"$match": {"$or": [
+        {"operationType": {"$in": ["insert", "replace", "delete", "drop", "rename", "dropDatabase", "invalidate"]}},
+        *({f"updateDescription.updatedFields.{field}": {"$exists": True}}
+          for field in ("password", "blocked", "max_download_bytes", "expiration_days", "account_creation_date")),
+        {"updateDescription.removedFields": {"$in": ["password", "blocked"]}},
+    ]}}]
+
+    def __init__(self, uri_builder: UriBuilder, db: AsyncDatabase, token_cache_size: int = 10000, token_cache_ttl: float = 30.0,
+                 miss_cache_ttl: float = 5.0):
+        self.uri_builder = uri_builder
+        self.db = db
+        self.token_cache = TTLCache(token_cache_size, token_cache_ttl)
+        self.miss_cache = TTLCache(token_cache_size, miss_cache_ttl)
+        self._tokens_by_user: Dict[str, str] = {}
+        self._watch_task = None
+
+    async def resolve_token(self, password_token: str) -> Tuple[Optional[UserInfo], int]:
+        """
+        Load the user owning password_token with one indexed find_one. Returns
+        the user (or None) and the number of database round trips it took.
+
+        Resolved users are cached for token_cache_ttl and unknown tokens for
+        the much shorter miss_cache_ttl. When change streams are available,
+        watch_users() drops entries as soon as a user is re-keyed, blocked,
+        deleted or created; otherwise the TTLs bound the staleness.
+        """
+        user_info = self.token_cache.get(password_token)
+        if user_info is not None:
+            return user_info, 0
+        if self.miss_cache.get(password_token) is not None:
+            return None, 0
+        user_doc = await self.db.collection.find_one({"password": password_token}, UserInfo.PROJECTION)
+        if not user_doc:
+            self.miss_cache.set(password_token, True)
+            return None, 1
+        user_info = UserInfo.from_doc(user_doc)
+        self.token_cache.set(password_token, user_info)
+        self._tokens_by_user[user_info.username] = password_token
+        return user_info, 1
+
+    def forget_user(self, username: str):
+        password_token = self._tokens_by_user.pop(username, None)
+        if password_token is not None:
+            self.token_cache.pop(password_token)
+
+    def forget_all(self):
+        self.token_cache.clear()
+        self.miss_cache.clear()
+        self._tokens_by_user.clear()
+
+    def _apply_change(self, change: Dict[str, Any]):
+        operation = change.get("operationType")
+        if operation in ("drop", "rename", "dropDatabase", "invalidate"):
+            self.forget_all()
+            return
+        self.forget_user(change.get("documentKey", {}).get("_id"))
+        if operation != "delete":
+            # A new or re-keyed user may own a token that was just probed.
+            self.miss_cache.clear()
+
+    async def watch_users(self):
+        while True:
+            try:
+                async with await self.db.collection.watch(self.WATCH_PIPELINE, max_await_time_ms=1000) as stream:
+                    # Anything cached before the stream opened may already be stale.
+                    self.forget_all()
+                    async for change in stream:
+                        self._apply_change(change)
+            except OperationFailure as e:
+                # Standalone mongod: no change streams, the TTLs apply.
+                print(f"Info: User change stream unavailable ({e}); token cache relies on TTL expiry.")
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Warning: User change stream failed: {e}")
+                await asyncio.sleep(5)
+
+    def start(self):
+        self._watch_task = asyncio.create_task(self.watch_users())
+
+    async def stop(self):
+        if self._watch_task:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+
+    def get_all_uris(self, username: str, password: str) -> List[str]:
+        return [item['uri'] for item in self.uri_builder.get_labeled_uris(username, password)]
+
+    def get_all_labeled_uris(self, username: str, password: str) -> List[Dict[str, str]]:
+        return list(self.uri_builder.get_labeled_uris(username, password))
 
 
 class UriParser:
@@ -283,25 +1034,66 @@ class UriParser:
 
 
 class SingboxConfigGenerator:
-    def __init__(self, hysteria_cli: HysteriaCLI, default_sni: str):
+    """Assembles per-user sing-box profiles from the template and URI endpoints.
+
+    The template is parsed once per (mtime, size) and never mutated; each
+    render copies only the containers it changes. Hysteria outbounds come
+    straight from the structured endpoints, and the serialized bytes are
+    cached per user, keyed by config and template version.
+    """
+
+    MUTABLE_TAGS = ('select', 'auto')
+
+    def __init__(self, hysteria_cli: HysteriaCLI, default_sni: str, cache_size: int = 4096, compact: bool = False):
         self.hysteria_cli = hysteria_cli
         self.default_sni = default_sni
+        self.compact = compact
         self._template_cache = None
+        self._template_version = None
         self.template_path = None
         self.hop_interval = 30
+        self._rendered = LRUCache(cache_size)
 
     def set_template_path(self, path: str):
         self.template_path = path
         self._template_cache = None
+        self._template_version = None
+        self._rendered.clear()
 
-    def get_template(self) -> Dict[str, Any]:
-        if self._template_cache is None:
+    def _load_template(self) -> Dict[str, Any]:
+        try:
+            stat = os.stat(self.template_path)
+            version = (stat.st_mtime_ns, stat.st_size)
+        except OSError as e:
+            raise RuntimeError(f"Error loading Singbox template: {e}") from e
+        if self._template_cache is None or version != self._template_version:
             try:
                 with open(self.template_path, 'r') as f:
-                    self._template_cache = json.load(f)
+                    template = json.load(f)
             except (FileNotFoundError, json.JSONDecodeError, IOError) as e:
                 raise RuntimeError(f"Error loading Singbox template: {e}") from e
-        return self._template_cache.copy()
+            template['outbounds'] = [out for out in template.get('outbounds', []) if out.get('type') != 'hysteria2']
+            self._template_cache = template
+            self._template_version = version
+            self._rendered.clear()
+        return self._template_cache
+
+    def template_version(self) -> Optional[Tuple[int, int]]:
+        self._load_template()
+        return self._template_version
+
+    def get_template(self) -> Dict[str, Any]:
+        # Copy-on-write: only the outbounds list and the selector entries are
+        # modified per user, so everything else is shared with the cached template.
+        template = self._load_template()
+        config = dict(template)
+        config['outbounds'] = [dict(out) if out.get('tag') in self.MUTABLE_TAGS else out for out in template['outbounds']]
+        return config
+
+    def dumps(self, config: Dict[str, Any], compact: Optional[bool] = None) -> bytes:
+        if self.compact if compact is None else compact:
+            return json.dumps(config, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        return json.dumps(config, indent=4, sort_keys=True).encode('utf-8')
 
     def generate_config_from_uri(self, uri: str, username: str, fragment: str) -> Optional[Dict[str, Any]]:
         if not uri:
@@ -366,19 +1158,46 @@ class SingboxConfigGenerator:
     def combine_configs(self, all_uris: List[str], username: str, fragment: str) -> Optional[Dict[str, Any]]:
         if not all_uris:
             return None
-        
-        combined_config = self.get_template()
-        combined_config['outbounds'] = [out for out in combined_config['outbounds'] if out.get('type') != 'hysteria2']
 
         hysteria_outbounds = []
         for uri in all_uris:
             outbound = self.generate_config_from_uri(uri, username, fragment)
             if outbound:
                 hysteria_outbounds.append(outbound)
+        return self.assemble(hysteria_outbounds)
+
+    def render_user(self, username: str, password: str, fragment: str, extra_uris: List[str], compact: Optional[bool] = None) -> Optional[bytes]:
+        compact = self.compact if compact is None else compact
+        template_version = self.template_version()
+        uri_version, endpoints = self.hysteria_cli.uri_builder.get_endpoints()
+        key = (username, password, fragment, tuple(extra_uris), compact, uri_version, template_version)
+        body = self._rendered.get(key)
+        if body is not None:
+            return body
+
+        fallback_sni = fragment if fragment else self.default_sni
+        hysteria_outbounds = []
+        for endpoint in endpoints:
+            outbound = endpoint.singbox_outbound(username, password, fallback_sni, self.hop_interval)
+            if outbound:
+                hysteria_outbounds.append(outbound)
+        for uri in extra_uris:
+            outbound = self.generate_config_from_uri(uri, username, fragment)
+            if outbound:
+                hysteria_outbounds.append(outbound)
 
+        combined_config = self.assemble(hysteria_outbounds)
+        if combined_config is None:
+            return None
+        body = self.dumps(combined_config, compact)
+        self._rendered.set(key, body)
+        return body
+
+    def assemble(self, hysteria_outbounds: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
         if not hysteria_outbounds:
             return None
 
+        combined_config = self.get_template()
         all_tags = [out['tag'] for out in hysteria_outbounds]
 
         for outbound in combined_config['outbounds']:
@@ -395,48 +1214,44 @@ class SubscriptionManager:
     def __init__(self, hysteria_cli: HysteriaCLI, config: AppConfig):
         self.hysteria_cli = hysteria_cli
         self.config = config
+        self.extra_configs = FileCache(config.extra_config_path, self._load_extra_configs, default=())
+
+    @staticmethod
+    def _load_extra_configs(path: str) -> Tuple[str, ...]:
+        with open(path, 'r') as f:
+            content = f.read()
+        if not content:
+            return ()
+        configs = json.loads(content)
+        if not isinstance(configs, list):
+            return ()
+        cleaned_uris = []
+        for c in configs:
+            is_enabled = c.get('enabled', True)
+            if 'uri' in c and is_enabled:
+                uri = str(c['uri']).replace('%20%5B%2ACIDR%5D', '')
+
+                if 'name' in c and c['name']:
+                    try:
+                        if '#' in uri:
+                            base_uri = uri.split('#')[0]
+                        else:
+                            base_uri = uri
+
+                        new_name = quote(str(c['name']))
+                        uri = f"{base_uri}#{new_name}"
+                    except Exception as e:
+                        print(f"Error applying name override: {e}")
+
+                cleaned_uris.append(uri)
+        return tuple(cleaned_uris)
 
     def _get_extra_configs(self) -> List[str]:
-        if not os.path.exists(self.config.extra_config_path):
-            return []
-        try:
-            with open(self.config.extra_config_path, 'r') as f:
-                content = f.read()
-                if not content:
-                    return []
-                configs = json.loads(content)
-                if isinstance(configs, list):
-                    cleaned_uris = []
-                    for c in configs:
-                        is_enabled = c.get('enabled', True)
-                        if 'uri' in c and is_enabled:
-                            uri = str(c['uri']).replace('%20%5B%2ACIDR%5D', '')
-                            
-                            if 'name' in c and c['name']:
-                                try:
-                                    if '#' in uri:
-                                        base_uri = uri.split('#')[0]
-                                    else:
-                                        base_uri = uri
-                                    
-                                    new_name = quote(str(c['name']))
-                                    uri = f"{base_uri}#{new_name}"
-                                except Exception as e:
-                                    print(f"Error applying name override: {e}")
-
-                            cleaned_uris.append(uri)
-                    return cleaned_uris
-                return []
-        except (json.JSONDecodeError, IOError, KeyError) as e:
-            print(f"Warning: Could not read or parse extra configs from {self.config.extra_config_path}: {e}")
-            return []
+        return list(self.extra_configs.get())
 
-    def get_normal_subscription(self, username: str, user_agent: str) -> str:
-        user_info = self.hysteria_cli.get_user_info(username)
-        if user_info is None:
-            return "User not found"
-            
-        all_uris = self.hysteria_cli.get_all_uris(username)
+    def get_normal_subscription(self, user_info: UserInfo, user_agent: str) -> str:
+        username = user_info.username
+        all_uris = self.hysteria_cli.get_all_uris(user_info.username, user_info.password)
 
         processed_uris = []
         for uri in all_uris:
@@ -494,14 +1309,17 @@ class TemplateRenderer:
         self.env = Environment(loader=FileSystemLoader(template_dir), autoescape=False)
         self.html_template = self.env.get_template('index.html')
         self.config = config
+        self.custom_env = Environment(loader=BaseLoader(), autoescape=False)
+        self.custom_template = FileCache(self.CUSTOM_HTML_PATH, self._compile_custom)
+
+    def _compile_custom(self, path: str):
+        with open(path, 'r', encoding='utf-8') as f:
+            return self.custom_env.from_string(f.read())
 
     def render(self, context: TemplateContext) -> str:
-        if os.path.exists(self.CUSTOM_HTML_PATH):
+        tmpl = self.custom_template.get()
+        if tmpl is not None:
             try:
-                with open(self.CUSTOM_HTML_PATH, 'r', encoding='utf-8') as f:
-                    custom_html = f.read()
-                custom_env = Environment(loader=BaseLoader(), autoescape=False)
-                tmpl = custom_env.from_string(custom_html)
                 return tmpl.render(vars(context))
             except Exception as e:
                 print(f"Error rendering custom HTML template: {e}")
@@ -511,9 +1329,40 @@ class TemplateRenderer:
 class HysteriaServer:
     def __init__(self):
         self.config = self._load_config()
-        self.rate_limiter = RateLimiter(self.config.rate_limit, self.config.rate_limit_window)
-        self.hysteria_cli = HysteriaCLI(self.config.hysteria_cli_path)
-        self.singbox_generator = SingboxConfigGenerator(self.hysteria_cli, self.config.sni)
+        self.rate_limiter = RateLimiter(
+            self.config.rate_limit,
+            self.config.rate_limit_window,
+            max_entries=self.config.rate_limit_max_entries,
+            ipv6_prefix=self.config.rate_limit_ipv6_prefix,
+            stats_path=self.config.rate_limit_stats_path
+        )
+        self.db = AsyncDatabase(max_pool_size=self.config.mongo_pool_size)
+        self.uri_builder = UriBuilder(
+            self.config.hysteria_config_path,
+            self.config.sni_file,
+            self.config.nodes_json_path,
+            cache_size=self.config.uri_cache_size
+        )
+        self.hysteria_cli = HysteriaCLI(
+            self.uri_builder,
+            self.db,
+            token_cache_size=self.config.token_cache_size,
+            token_cache_ttl=self.config.token_cache_ttl,
+            miss_cache_ttl=self.config.miss_cache_ttl
+        )
+        self.qr_cache = QRCodeCache(
+            self.config.qr_cache_size, self.config.qr_cache_dir or None, self.config.qr_cache_disk_max_files
+        )
+        self.compressor = BodyCompressor(self.config.compress_min_size)
+        # Settings such as the profile title or announce are part of every body,
+        # so a restart with different settings must not validate old ETags.
+        self._config_digest = hashlib.sha256(repr(self.config).encode('utf-8')).hexdigest()[:16]
+        self.singbox_generator = SingboxConfigGenerator(
+            self.hysteria_cli,
+            self.config.sni,
+            cache_size=self.config.uri_cache_size,
+            compact=self.config.singbox_compact
+        )
         self.singbox_generator.set_template_path(self.config.singbox_template_path)
         panel_env = self._load_panel_config(self.config.sni_file)
         try:
@@ -522,11 +1371,18 @@ class HysteriaServer:
             self.singbox_generator.hop_interval = 30
         self.subscription_manager = SubscriptionManager(self.hysteria_cli, self.config)
         self.template_renderer = TemplateRenderer(self.config.template_dir, self.config)
-        self.app = web.Application(middlewares=[
+        self.file_watcher = FileWatcher()
+        if self.config.config_inotify:
+            self.file_watcher.add(self.subscription_manager.extra_configs)
+            self.file_watcher.add(self.template_renderer.custom_template)
+        middlewares = [
             self._invalid_endpoint_middleware,
             self._rate_limit_middleware,
             self._noindex_middleware
-        ])
+        ]
+        if self.config.debug:
+            middlewares.append(self._round_trip_middleware)
+        self.app = web.Application(middlewares=middlewares)
 
         safe_subpath = self.validate_subpath_for_routing(self.config.subpath)
 
@@ -534,9 +1390,26 @@ class HysteriaServer:
         self.app.router.add_get(f'{base_path}/style.css', self.handle_style)
         self.app.router.add_get(f'{base_path}/script.js', self.handle_script)
         self.app.router.add_get(f'{base_path}/happ/{{password_token}}', self.handle_force_sub)
+        self.app.router.add_get(f'{base_path}/qr/{{qr_key:[a-f0-9]{{32}}}}.{{qr_format:png|svg}}', self.handle_qrcode)
         self.app.router.add_get(f'{base_path}/{{password_token}}', self.handle)
         self.app.router.add_get(f'{base_path}/robots.txt', self.robots_handler)
         self.app.router.add_route('*', f'{base_path}/{{tail:.*}}', self.handle_404_subpath)
+        self.app.on_startup.append(self._on_startup)
+        self.app.on_cleanup.append(self._on_cleanup)
+
+    async def _on_startup(self, app: web.Application):
+        self.file_watcher.start(asyncio.get_running_loop())
+        try:
+            await self.db.connect()
+            await self.db.ensure_indexes()
+        except Exception as e:
+            print(f"Warning: MongoDB is not reachable at startup: {e}")
+        self.hysteria_cli.start()
+
+    async def _on_cleanup(self, app: web.Application):
+        self.file_watcher.stop()
+        await self.hysteria_cli.stop()
+        await self.db.close()
 
     def _load_config(self) -> AppConfig:
         domain = os.getenv('HYSTERIA_DOMAIN', 'localhost')
@@ -554,12 +1427,31 @@ class HysteriaServer:
 
         sni_file = '/etc/hysteria/.configs.env'
         singbox_template_path = '/etc/hysteria/core/scripts/normalsub/singbox.json'
-        hysteria_cli_path = '/etc/hysteria/core/cli.py'
+        hysteria_config_path = '/etc/hysteria/config.json'
         nodes_json_path = '/etc/hysteria/nodes.json'
         extra_config_path = '/etc/hysteria/extra.json'
-        rate_limit = 100
-        rate_limit_window = 60
+        rate_limit = int(os.getenv('RATE_LIMIT', '100'))
+        rate_limit_window = int(os.getenv('RATE_LIMIT_WINDOW', '60'))
+        rate_limit_max_entries = int(os.getenv('RATE_LIMIT_MAX_ENTRIES', '100000'))
+        rate_limit_ipv6_prefix = min(128, max(0, int(os.getenv('RATE_LIMIT_IPV6_PREFIX', '64'))))
+        rate_limit_stats_path = '/etc/hysteria/normalsub_rate_limit_stats.json'
+        mongo_pool_size = int(os.getenv('MONGO_POOL_SIZE', '50'))
+        token_cache_size = int(os.getenv('TOKEN_CACHE_SIZE', '10000'))
+        token_cache_ttl = float(os.getenv('TOKEN_CACHE_TTL', '30'))
+        miss_cache_ttl = float(os.getenv('TOKEN_MISS_CACHE_TTL', '5'))
+        qr_format = os.getenv('QR_FORMAT', 'svg').lower()
+        if qr_format not in QRCodeCache.FORMATS:
+            qr_format = 'svg'
+        qr_cache_size = int(os.getenv('QR_CACHE_SIZE', '2048'))
+        qr_cache_dir = os.getenv('QR_CACHE_DIR', '/etc/hysteria/normalsub_qr_cache')
+        qr_cache_disk_max_files = int(os.getenv('QR_CACHE_DISK_MAX_FILES', '20000'))
+        uri_cache_size = int(os.getenv('URI_CACHE_SIZE', '4096'))
+        singbox_compact = os.getenv('SINGBOX_COMPACT', 'false').lower() == 'true'
+        etag_traffic_bucket = int(os.getenv('ETAG_TRAFFIC_BUCKET', str(8 * 1024 * 1024)))
+        compress_min_size = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
         template_dir = os.path.join(os.path.dirname(__file__), 'template')
+        debug = os.getenv('DEBUG', 'false').lower() == 'true'
+        config_inotify = os.getenv('CONFIG_INOTIFY', 'true').lower() == 'true'
 
         panel_config = self._load_panel_config(sni_file)
         sni = panel_config.get('SNI', 'bts.com')
@@ -592,13 +1484,27 @@ class HysteriaServer:
                          aiohttp_listen_port=aiohttp_listen_port,
                          sni_file=sni_file,
                          singbox_template_path=singbox_template_path,
-                         hysteria_cli_path=hysteria_cli_path,
+                         hysteria_config_path=hysteria_config_path,
                          nodes_json_path=nodes_json_path,
                          extra_config_path=extra_config_path,
                          rate_limit=rate_limit, rate_limit_window=rate_limit_window,
                          sni=sni, template_dir=template_dir,
                          subpath=subpath, profile_title=profile_title, show_username=show_username,
-                         support_url=support_url, announce=announce)
+                         support_url=support_url, announce=announce,
+                         mongo_pool_size=mongo_pool_size,
+                         uri_cache_size=uri_cache_size,
+                         token_cache_size=token_cache_size, token_cache_ttl=token_cache_ttl,
+                         miss_cache_ttl=miss_cache_ttl,
+                         qr_format=qr_format, qr_cache_size=qr_cache_size,
+                         qr_cache_dir=qr_cache_dir, qr_cache_disk_max_files=qr_cache_disk_max_files,
+                         singbox_compact=singbox_compact,
+                         etag_traffic_bucket=etag_traffic_bucket,
+                         compress_min_size=compress_min_size,
+                         rate_limit_max_entries=rate_limit_max_entries,
+                         rate_limit_ipv6_prefix=rate_limit_ipv6_prefix,
+                         rate_limit_stats_path=rate_limit_stats_path,
+                         debug=debug,
+                         config_inotify=config_inotify)
 
     def _load_panel_config(self, env_file: str) -> Dict[str, str]:
         config = {}
@@ -642,6 +1548,11 @@ class HysteriaServer:
             raise web.HTTPForbidden()
         return await handler(request)
 
+    async def _resolve_token(self, request: web.Request, password_token: str) -> Optional[UserInfo]:
+        user_info, round_trips = await self.hysteria_cli.resolve_token(password_token)
+        request['db_round_trips'] = request.get('db_round_trips', 0) + round_trips
+        return user_info
+
     async def handle_force_sub(self, request: web.Request) -> web.Response:
         try:
             password_token_raw = request.match_info.get('password_token', '')
@@ -650,13 +1561,10 @@ class HysteriaServer:
             
             password_token = Utils.sanitize_input(password_token_raw, r'^[a-zA-Z0-9]+$')
 
-            username = self.hysteria_cli.get_username_by_password(password_token)
-            if username is None:
-                return web.Response(status=404, text="User not found for the provided token.")
-
-            user_info = self.hysteria_cli.get_user_info(username)
+            user_info = await self._resolve_token(request, password_token)
             if user_info is None:
-                return web.Response(status=404, text=f"User '{username}' details not found.")
+                return web.Response(status=404, text="User not found for the provided token.")
+            username = user_info.username
 
             if user_info.blocked:
                 fake_uri = "hysteria2://x@end.com:443?sni=support.me#⛔Account-Expired⚠️"
@@ -668,12 +1576,72 @@ class HysteriaServer:
             print(f"Force Sub Internal Error: {e}")
             return web.Response(status=500, text="Error")
 
+    @middleware
+    async def _round_trip_middleware(self, request: web.Request, handler):
+        response = await handler(request)
+        round_trips = request.get('db_round_trips', 0)
+        response.headers['X-DB-Round-Trips'] = str(round_trips)
+        print(f"Debug: {request.method} {request.path} -> {response.status}, {round_trips} DB round trip(s)")
+        return response
+
     @middleware
     async def _noindex_middleware(self, request: web.Request, handler):
         response = await handler(request)
         response.headers['X-Robots-Tag'] = 'noindex, nofollow, noarchive, nosnippet'
         return response
 
+    def _subscription_digest(self, kind: str, request: web.Request, user_info: UserInfo) -> str:
+        # Traffic counters are bucketed so an idle client keeps getting 304s
+        # while its usage moves by less than etag_traffic_bucket bytes.
+        bucket = max(1, self.config.etag_traffic_bucket)
+        self.uri_builder.refresh()
+        parts = (
+            kind,
+            self._config_digest,
+            user_info.username,
+            user_info.password,
+            user_info.upload_bytes // bucket,
+            user_info.download_bytes // bucket,
+            user_info.max_download_bytes,
+            user_info.account_creation_date,
+            user_info.expiration_days,
+            self.uri_builder.version,
+            self.subscription_manager.extra_configs.version(),
+            self.singbox_generator.template_version() if kind == 'singbox' else None,
+            request.headers.get('User-Agent', '').lower(),
+            request.query.get('fragment', ''),
+            request.query.get('compact', ''),
+        )
+        return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()[:32]
+
+    @staticmethod
+    def _validator_headers(digest: str, coding: Optional[str] = None) -> Dict[str, str]:
+        return {
+            'ETag': f'"{digest}-{coding}"' if coding else f'"{digest}"',
+            'Cache-Control': 'private, no-cache',
+            'Vary': 'User-Agent, Accept-Encoding',
+        }
+
+    def _not_modified(self, request: web.Request, digest: str) -> Optional[web.Response]:
+        # Any representation of the same digest (identity, gzip or br) is
+        # current; the 304 carries the tag the client already holds.
+        etags = [self._validator_headers(digest, coding)['ETag'] for coding in (None, 'gzip', 'br')]
+        etag = matching_etag(request.headers.get('If-None-Match', ''), etags)
+        if etag is None:
+            return None
+        headers = self._validator_headers(digest)
+        headers['ETag'] = etag
+        return web.Response(status=304, headers=headers)
+
+    def _conditional_response(self, request: web.Request, digest: str, body: bytes, content_type: str,
+                              headers: Dict[str, str]) -> web.Response:
+        coding = self.compressor.negotiate(request.headers.get('Accept-Encoding', ''), len(body))
+        if coding:
+            body = self.compressor.compress(digest, coding, body)
+            headers = {**headers, 'Content-Encoding': coding}
+        headers.update(self._validator_headers(digest, coding))
+        return web.Response(body=body, content_type=content_type, charset='utf-8', headers=headers)
+
     async def handle(self, request: web.Request) -> web.Response:
         try:
             password_token_raw = request.match_info.get('password_token', '')
@@ -682,13 +1650,10 @@ class HysteriaServer:
             
             password_token = Utils.sanitize_input(password_token_raw, r'^[a-zA-Z0-9]+$')
 
-            username = self.hysteria_cli.get_username_by_password(password_token)
-            if username is None:
-                return web.Response(status=404, text="User not found for the provided token.")
-
-            user_info = self.hysteria_cli.get_user_info(username)
+            user_info = await self._resolve_token(request, password_token)
             if user_info is None:
-                return web.Response(status=404, text=f"User '{username}' details not found.")
+                return web.Response(status=404, text="User not found for the provided token.")
+            username = user_info.username
 
             if user_info.blocked:
                 return await self._handle_blocked_user(request, user_info)
@@ -706,7 +1671,7 @@ class HysteriaServer:
                  return await self._handle_normalsub(request, username, user_info, password_token)
 
             if 'singbox' in user_agent or 'sing' in user_agent:
-                return await self._handle_singbox(username, fragment, user_info, password_token)
+                return await self._handle_singbox(request, username, fragment, user_info, password_token)
             return await self._handle_normalsub(request, username, user_info, password_token)
         except ValueError as e:
             return web.Response(status=400, text=f"Error: {e}")
@@ -725,7 +1690,8 @@ class HysteriaServer:
         fragment = request.query.get('fragment', '')
         if 'singbox' in user_agent or 'sing' in user_agent:
             combined_config = self.singbox_generator.combine_configs([fake_uri], "blocked", fragment)
-            return web.Response(text=json.dumps(combined_config, indent=4, sort_keys=True), content_type='application/json')
+            body = self.singbox_generator.dumps(combined_config, self._compact_requested(request))
+            return web.Response(body=body, content_type='application/json')
         
         return web.Response(text=fake_uri, content_type='text/plain')
 
@@ -757,14 +1723,24 @@ class HysteriaServer:
         context = await self._get_template_context(username, user_info)
         return web.Response(text=self.template_renderer.render(context), content_type='text/html')
 
-    async def _handle_singbox(self, username: str, fragment: str, user_info: UserInfo, password_token: str) -> web.Response:
-        all_uris = self.hysteria_cli.get_all_uris(username)
-        extra_uris = self.subscription_manager._get_extra_configs()
-        all_uris.extend(extra_uris)
+    def _compact_requested(self, request: web.Request) -> Optional[bool]:
+        value = request.query.get('compact')
+        if value is None:
+            return None
+        return value.lower() in ('1', 'true', 'yes')
 
-        if not all_uris:
+    async def _handle_singbox(self, request: web.Request, username: str, fragment: str, user_info: UserInfo, password_token: str) -> web.Response:
+        digest = self._subscription_digest('singbox', request, user_info)
+        not_modified = self._not_modified(request, digest)
+        if not_modified is not None:
+            return not_modified
+
+        extra_uris = self.subscription_manager._get_extra_configs()
+        body = self.singbox_generator.render_user(
+            user_info.username, user_info.password, fragment, extra_uris, self._compact_requested(request)
+        )
+        if body is None:
             return web.Response(status=404, text=f"Error: No valid URIs found for user {username}.")
-        combined_config = self.singbox_generator.combine_configs(all_uris, username, fragment)
         
         upload = user_info.upload_bytes
         download = user_info.download_bytes
@@ -806,18 +1782,17 @@ class HysteriaServer:
         if self.config.support_url:
             headers['support-url'] = self.config.support_url
 
-        return web.Response(
-            text=json.dumps(combined_config, indent=4, sort_keys=True), 
-            content_type='application/json',
-            headers=headers
-        )
+        return self._conditional_response(request, digest, body, 'application/json', headers)
 
     async def _handle_normalsub(self, request: web.Request, username: str, user_info: UserInfo, password_token: str) -> web.Response:
+        digest = self._subscription_digest('normal', request, user_info)
+        not_modified = self._not_modified(request, digest)
+        if not_modified is not None:
+            return not_modified
+
         user_agent = request.headers.get('User-Agent', '').lower()
-        subscription = self.subscription_manager.get_normal_subscription(username, user_agent)
-        if subscription == "User not found":
-            return web.Response(status=404, text=f"User '{username}' not found.")
-        
+        subscription = self.subscription_manager.get_normal_subscription(user_info, user_agent)
+
         port_str = f":{self.config.external_port}" if self.config.external_port not in [80, 443, 0] else ""
         web_page_url = f"https://{self.config.domain}{port_str}/{self.config.subpath}/{password_token}"
         
@@ -842,10 +1817,10 @@ class HysteriaServer:
         if self.config.support_url:
             headers['Support-Url'] = self.config.support_url
         
-        return web.Response(text=subscription, content_type='text/plain', headers=headers)
+        return self._conditional_response(request, digest, subscription.encode('utf-8'), 'text/plain', headers)
 
     async def _get_template_context(self, username: str, user_info: UserInfo) -> TemplateContext:
-        labeled_uris = self.hysteria_cli.get_all_labeled_uris(username)
+        labeled_uris = self.hysteria_cli.get_all_labeled_uris(user_info.username, user_info.password)
         port_str = f":{self.config.external_port}" if self.config.external_port not in [80, 443, 0] else ""
         base_url = f"https://{self.config.domain}{port_str}"
 
@@ -855,14 +1830,14 @@ class HysteriaServer:
         sub_link = f"{base_url}/{self.config.subpath}/{user_info.password}"
         happ_sub_link = f"{base_url}/{self.config.subpath}/happ/{user_info.password}"
         sub_link_encoded = quote(sub_link, safe='')
-        sublink_qrcode = Utils.generate_qrcode_base64(sub_link)
+        sublink_qrcode = self._qrcode_url(sub_link)
         
         profile_title_encoded = quote(self.config.profile_title)
         
-        singbox_qrcode = Utils.generate_qrcode_base64(f"sing-box://import-remote-profile?url={sub_link_encoded}#{profile_title_encoded}")
-        hiddify_qrcode = Utils.generate_qrcode_base64(f"hiddify://import/{sub_link}#{profile_title_encoded}")
-        streisand_qrcode = Utils.generate_qrcode_base64(f"streisand://import/sub?url={sub_link_encoded}#{profile_title_encoded}")
-        nekobox_qrcode = Utils.generate_qrcode_base64(f"nekobox://import?url={sub_link_encoded}#{profile_title_encoded}")
+        singbox_qrcode = self._qrcode_url(f"sing-box://import-remote-profile?url={sub_link_encoded}#{profile_title_encoded}")
+        hiddify_qrcode = self._qrcode_url(f"hiddify://import/{sub_link}#{profile_title_encoded}")
+        streisand_qrcode = self._qrcode_url(f"streisand://import/sub?url={sub_link_encoded}#{profile_title_encoded}")
+        nekobox_qrcode = self._qrcode_url(f"nekobox://import?url={sub_link_encoded}#{profile_title_encoded}")
         
         local_uris = []
         node_uris = []
@@ -871,7 +1846,7 @@ class HysteriaServer:
             node_uri = NodeURI(
                 label=item['label'], 
                 uri=item['uri'], 
-                qrcode=Utils.generate_qrcode_base64(item['uri'])
+                qrcode=self._qrcode_url(item['uri'])
             )
             if item['label'].startswith('Node:'):
                 node_uris.append(node_uri)
@@ -924,6 +1899,28 @@ class HysteriaServer:
             nekobox_qrcode=nekobox_qrcode
         )
 
+    def _qrcode_url(self, payload: str) -> Optional[str]:
+        key = self.qr_cache.register(payload)
+        if key is None:
+            return None
+        return f"/{self.config.subpath}/qr/{key}.{self.config.qr_format}"
+
+    async def handle_qrcode(self, request: web.Request) -> web.Response:
+        key = request.match_info['qr_key']
+        fmt = request.match_info['qr_format']
+        etag = f'"{key}-{fmt}"'
+        headers = {
+            'ETag': etag,
+            'Cache-Control': 'private, max-age=86400, immutable'
+        }
+        if matching_etag(request.headers.get('If-None-Match', ''), [etag]):
+            return web.Response(status=304, headers=headers)
+
+        image = self.qr_cache.get_image(key, fmt)
+        if image is None:
+            return web.Response(status=404, text="QR code not found.")
+        return web.Response(body=image, content_type=QRCodeCache.FORMATS[fmt], headers=headers)
+
     async def robots_handler(self, request: web.Request) -> web.Response:
         return web.Response(text="User-agent: *\nDisallow: /", content_type="text/plain")
 
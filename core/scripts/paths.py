@@ -19,5 +19,8 @@ LOCALVERSION = BASE_DIR / "VERSION"
 LATESTVERSION = "https://raw.githubusercontent.com/0xd5f/ANY/main/VERSION"
 LASTESTCHANGE = "https://raw.githubusercontent.com/0xd5f/ANY/main/changelog.md"
 CONNECTIONS_FILE = BASE_DIR / "hysteria_connections.json"
+TRAFFIC_COLLECTOR_STATS = BASE_DIR / "traffic_collector_stats.json"
+IP_LIMIT_STATS = BASE_DIR / "ip_limit_stats.json"
+SERVER_INFO_SNAPSHOT = BASE_DIR / "server_info_snapshot.json"
 BLOCK_LIST = Path("/tmp/hysteria_blocked_ips.txt")
 SCRIPT_PATH = BASE_DIR / "core/scripts/hysteria2/limit.sh"
@@ -1,9 +1,15 @@
+import os
+import sys
+import json
 import time
 import schedule
 import logging
 import subprocess
 import fcntl
+import threading
+from collections import deque
 from pathlib import Path
+from dotenv import dotenv_values
 from paths import *
 
 logging.basicConfig(
@@ -19,6 +25,10 @@ logger = logging.getLogger("HysteriaScheduler")
 BASE_DIR = Path("/etc/hysteria")
 VENV_ACTIVATE = BASE_DIR / "hysteria2_venv/bin/activate"
 LOCK_FILE = "/tmp/hysteria_scheduler.lock"
+DEFAULT_POLL_INTERVAL = 60
+MAX_DB_RETRY_DELAY = 300
+
+sys.path.append(str(BASE_DIR / "core"))
 
 def acquire_lock():
     try:
@@ -58,17 +68,139 @@ def run_command(command, log_success=False):
         logger.exception(f"Exception running command: {full_cmd}")
         return False
 
-def check_traffic_status():
-    lock_fd = acquire_lock()
-    if not lock_fd:
-        return
-        
+def get_poll_interval():
+    value = dotenv_values(CONFIG_ENV).get('TRAFFIC_POLL_INTERVAL') or os.getenv('TRAFFIC_POLL_INTERVAL')
     try:
-        success = run_command(f"python3 {CLI_PATH} traffic-status --no-gui", log_success=False)
-        if not success:
-            pass
-    finally:
-        release_lock(lock_fd)
+        return max(5.0, float(value)) if value else DEFAULT_POLL_INTERVAL
+    except ValueError:
+        logger.warning(f"Invalid TRAFFIC_POLL_INTERVAL '{value}', using {DEFAULT_POLL_INTERVAL}s")
+        return DEFAULT_POLL_INTERVAL
+
+
+class TrafficCollector:
+    def __init__(self, interval):
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.manager = None
+        self.db = None
+        self.db_retry_at = 0.0
+        self.db_retry_delay = 0.0
+        self.config_mtime = None
+        self.durations = deque(maxlen=120)
+        self.stats = {
+            "interval_seconds": interval,
+            "cycles": 0,
+            "overruns": 0,
+            "missed_cycles": 0,
+            "skipped_locked": 0,
+            "failures": 0,
+        }
+
+    def _get_db(self, traffic):
+        # traffic.db is created once at import; if MongoDB was down then it
+        # stays None, so connect again here with an exponential backoff.
+        if self.db is None:
+            self.db = traffic.db
+        if self.db is not None:
+            return self.db
+
+        now = time.monotonic()
+        if now < self.db_retry_at:
+            raise ConnectionError(f"Database unavailable, next reconnect attempt in {self.db_retry_at - now:.0f}s")
+        from db.database import Database
+        try:
+            self.db = Database()
+        except Exception:
+            self.db_retry_delay = min(MAX_DB_RETRY_DELAY, max(self.interval, self.db_retry_delay * 2))
+            self.db_retry_at = now + self.db_retry_delay
+            raise
+        self.db_retry_delay = 0.0
+        logger.warning("Reconnected to the database")
+        return self.db
+
+    def _get_manager(self):
+        import traffic
+
+        db = self._get_db(traffic)
+        try:
+            mtime = CONFIG_FILE.stat().st_mtime
+        except OSError:
+            mtime = None
+        if self.manager is None or mtime != self.config_mtime:
+            self.manager = traffic.TrafficManager(db_conn=db, api_base_url=API_BASE_URL)
+            self.config_mtime = mtime
+        return self.manager
+
+    def run_cycle(self):
+        lock_fd = acquire_lock()
+        if not lock_fd:
+            self.stats["skipped_locked"] += 1
+            return
+
+        try:
+            manager = self._get_manager()
+            manager.process_and_update_traffic()
+            manager.kick_expired_users()
+            self.stats["last_tick"] = manager.last_tick_stats
+        except Exception:
+            self.stats["failures"] += 1
+            self.manager = None
+            logger.exception("Traffic collection cycle failed")
+        finally:
+            release_lock(lock_fd)
+
+    def _record(self, duration):
+        self.durations.append(duration)
+        ordered = sorted(self.durations)
+        self.stats.update({
+            "cycles": self.stats["cycles"] + 1,
+            "last_duration_ms": round(duration * 1000, 2),
+            "p50_duration_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+            "p95_duration_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+            "max_duration_ms": round(ordered[-1] * 1000, 2),
+            "updated_at": time.time(),
+        })
+        try:
+            tmp_path = f"{TRAFFIC_COLLECTOR_STATS}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.stats, f, indent=2)
+            os.replace(tmp_path, TRAFFIC_COLLECTOR_STATS)
+        except OSError as e:
+            logger.error(f"Failed to write collector stats: {e}")
+
+    def _loop(self):
+        # Deadlines advance by a fixed interval from the first run, so cycle
+        # duration does not accumulate as drift.
+        next_run = time.monotonic()
+        while not self.stop_event.is_set():
+            delay = next_run - time.monotonic()
+            if delay > 0:
+                self.stop_event.wait(delay)
+                continue
+
+            started = time.monotonic()
+            self.run_cycle()
+            duration = time.monotonic() - started
+            self._record(duration)
+
+            next_run += self.interval
+            now = time.monotonic()
+            if now > next_run:
+                missed = int((now - next_run) // self.interval) + 1
+                next_run += missed * self.interval
+                self.stats["overruns"] += 1
+                self.stats["missed_cycles"] += missed
+                logger.warning(f"Traffic cycle took {duration:.2f}s (interval {self.interval}s), skipped {missed} cycle(s)")
+
+    def start(self):
+        self.thread = threading.Thread(target=self._loop, name="TrafficCollector", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=self.interval)
 
 def backup_hysteria():
     lock_fd = acquire_lock()
@@ -84,10 +216,11 @@ def backup_hysteria():
 def main():
     logger.info("Starting Hysteria Scheduler")
     
-    schedule.every(1).minutes.do(check_traffic_status)
+    collector = TrafficCollector(get_poll_interval())
+    collector.start()
+
     schedule.every(6).hours.do(backup_hysteria)
     
-    check_traffic_status()
     backup_hysteria()
     
     while True:
@@ -96,6 +229,7 @@ def main():
             time.sleep(1)
         except KeyboardInterrupt:
             logger.info("Shutting down scheduler")
+            collector.stop()
             break
         except Exception as e:
             logger.exception("Error in main loop")
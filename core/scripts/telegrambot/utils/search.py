@@ -1,56 +1,57 @@
 from telebot import types
 from utils.command import *
+import sys
+
+db_path = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../db'))
+if db_path not in sys.path:
+    sys.path.append(db_path)
+from database import Database
+from user_search import UserSearch, MAX_LIMIT
+
+try:
+    user_search = UserSearch(Database())
+except Exception as e:
+    print(f"Failed to connect to DB for user search: {e}")
+    user_search = None
+
+INLINE_CACHE_TIME = 5
+# Typing this in inline mode lists blocked users instead of matching names.
+BLOCKED_KEYWORD = "block"
+
+
+def build_result(user):
+    username = user['username']
+    blocked = user.get('blocked', False)
+    title = f"{username} (Blocked)" if blocked else f"{username}"
+    description = f"Traffic Limit: {user.get('max_download_bytes', 0) / (1024 ** 3):.2f} GB, Expiration Days: {user.get('expiration_days', 'N/A')}"
+    message_content = (
+        f"Name: {username}\n"
+        f"Traffic limit: {user.get('max_download_bytes', 0) / (1024 ** 3):.2f} GB\n"
+        f"Days: {user.get('expiration_days', 'N/A')}\n"
+        f"Account Creation: {user.get('account_creation_date', 'N/A')}\n"
+        f"Blocked: {blocked}"
+    )
+    return types.InlineQueryResultArticle(
+        id=username,
+        title=title,
+        description=description,
+        input_message_content=types.InputTextMessageContent(message_text=message_content)
+    )
+
 
 @bot.inline_handler(lambda query: is_admin(query.from_user.id))
 def handle_inline_query(query):
-    command = f"python3 {CLI_PATH} list-users"
-    result = run_cli_command(command)
+    if user_search is None:
+        bot.answer_inline_query(query.id, results=[], switch_pm_text="Error retrieving users.", switch_pm_user_id=query.from_user.id)
+        return
+
     try:
-        users = json.loads(result)
-    except json.JSONDecodeError:
+        blocked = query.query.strip().lower() == BLOCKED_KEYWORD
+        users = user_search.search(query.query, MAX_LIMIT, blocked=blocked)
+    except Exception as e:
+        print(f"Inline user search failed: {e}")
         bot.answer_inline_query(query.id, results=[], switch_pm_text="Error retrieving users.", switch_pm_user_id=query.from_user.id)
         return
 
-    query_text = query.query.lower().replace('\\_', '_')
-    results = []
-
-    if query_text == "block":
-        for user in users:
-            if user.get('blocked', False):
-                username = user['username']
-                title = f"{username} (Blocked)"
-                description = f"Traffic Limit: {user.get('max_download_bytes', 0) / (1024 ** 3):.2f} GB, Expiration Days: {user.get('expiration_days', 'N/A')}"
-                message_content = (
-                    f"Name: {username}\n"
-                    f"Traffic limit: {user.get('max_download_bytes', 0) / (1024 ** 3):.2f} GB\n"
-                    f"Days: {user.get('expiration_days', 'N/A')}\n"
-                    f"Account Creation: {user.get('account_creation_date', 'N/A')}\n"
-                    f"Blocked: {user.get('blocked', False)}"
-                )
-                results.append(types.InlineQueryResultArticle(
-                    id=username,
-                    title=title,
-                    description=description,
-                    input_message_content=types.InputTextMessageContent(message_text=message_content)
-                ))
-    else:
-        for user in users:
-            username = user['username']
-            if query_text in username.lower():
-                title = f"{username}"
-                description = f"Traffic Limit: {user.get('max_download_bytes', 0) / (1024 ** 3):.2f} GB, Expiration Days: {user.get('expiration_days', 'N/A')}"
-                message_content = (
-                    f"Name: {username}\n"
-                    f"Traffic limit: {user.get('max_download_bytes', 0) / (1024 ** 3):.2f} GB\n"
-                    f"Days: {user.get('expiration_days', 'N/A')}\n"
-                    f"Account Creation: {user.get('account_creation_date', 'N/A')}\n"
-                    f"Blocked: {user.get('blocked', False)}"
-                )
-                results.append(types.InlineQueryResultArticle(
-                    id=username,
-                    title=title,
-                    description=description,
-                    input_message_content=types.InputTextMessageContent(message_text=message_content)
-                ))
-
-    bot.answer_inline_query(query.id, results, cache_time=0)
\ No newline at end of file
+    results = [build_result(user) for user in users]
+    bot.answer_inline_query(query.id, results, cache_time=INLINE_CACHE_TIME, is_personal=True)
@@ -1,13 +1,14 @@
 import sys
 import os
 import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from starlette.staticfiles import StaticFiles
 
 from config import CONFIGS
 from middleware import AuthMiddleware
 from middleware import AfterRequestMiddleware
-from dependency import get_session_manager
+from dependency import get_session_manager, get_node_registry, get_metrics_sampler, get_bulk_jobs
 from openapi import setup_openapi_schema
 from exception_handler import setup_exception_handler
 
@@ -15,6 +16,34 @@ HYSTERIA_CORE_DIR = '/etc/hysteria/core/'
 sys.path.append(HYSTERIA_CORE_DIR)
 
 import routers
+from scripts.db.async_database import async_db
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await async_db.ensure_indexes()
+    except Exception as e:
+        print(f"Warning: Could not ensure MongoDB indexes: {e}")
+    node_registry = get_node_registry()
+    try:
+        await node_registry.load()
+    except Exception as e:
+        print(f"Warning: Could not load node registry: {e}")
+    node_registry.start()
+    metrics_sampler = get_metrics_sampler()
+    metrics_sampler.start()
+    session_manager = get_session_manager()
+    try:
+        await session_manager.start()
+    except Exception as e:
+        print(f"Warning: Could not start session store: {e}")
+    yield
+    await get_bulk_jobs().stop()
+    await session_manager.stop()
+    await metrics_sampler.stop()
+    await node_registry.stop()
+    await async_db.close()
 
 
 def create_app() -> FastAPI:
@@ -25,6 +54,7 @@ def create_app() -> FastAPI:
         version='0.2.0',
         debug=CONFIGS.DEBUG,
         root_path=f'/{CONFIGS.ROOT_PATH}',
+        lifespan=lifespan,
     )
 
     current_dir = os.path.dirname(os.path.abspath(__file__))
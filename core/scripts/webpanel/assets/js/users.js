@@ -671,7 +671,7 @@ $(function () {
         $('#limit-select').on('change', function() {
             const newLimit = $(this).val();
             setCookie('limit', newLimit, 365);
-            window.location.href = USERS_BASE_URL;
+            window.location.href = USERS_BASE_URL + window.location.search;
         });
     }
     
@@ -0,0 +1,222 @@
+import argparse
+import asyncio
+import json
+import secrets
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
+
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import RedirectResponse, StreamingResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp
+
+from config import CONFIGS
+from exception_handler import exception_handler
+from middleware import AuthMiddleware, AfterRequestMiddleware
+from session import MemorySessionStorage, SessionData, SessionManager
+
+
+# The "before" stack: the baseline middleware/auth.py, middleware/request.py
+# and the synchronous session manager they called, copied verbatim apart from
+# the Legacy prefix on the class names.
+class LegacySessionStorage:
+
+    def __init__(self):
+        self.sessions: dict[str, SessionData] = {}
+
+    def set(self, session_id: str, data: SessionData):
+        self.sessions[session_id] = data
+
+    def get(self, session_id: str) -> SessionData | None:
+        return self.sessions.get(session_id)
+
+    def delete(self, session_id: str):
+        self.sessions.pop(session_id, None)
+
+
+class LegacySessionManager:
+
+    def __init__(self, storage: LegacySessionStorage, expiration_minutes: int = 1440):
+        self.storage = storage
+        self.expiration = timedelta(minutes=expiration_minutes)
+
+    def set_session(self, username: str) -> str:
+        session_id = secrets.token_hex(32)
+        session_data = SessionData(username=username, created_at=datetime.now(timezone.utc), expires_at=datetime.now(timezone.utc) + self.expiration)
+
+        self.storage.set(session_id, session_data)
+
+        return session_id
+
+    def get_session(self, session_id: str) -> SessionData | None:
+        return self.storage.get(session_id)
+
+    def revoke_session(self, session_id: str):
+        self.storage.delete(session_id)
+
+
+class LegacyAuthMiddleware(BaseHTTPMiddleware):
+
+    def __init__(self, app: ASGIApp, session_manager: LegacySessionManager, api_token: str | None):
+        super().__init__(app)
+        self.__session_manager = session_manager
+        self.__api_token = api_token
+
+    async def dispatch(self, request: Request, call_next: Callable[[Request], Awaitable[Response]]):
+        public_routes = [
+            f'/{CONFIGS.ROOT_PATH}/login',
+            f'/{CONFIGS.ROOT_PATH}/verify-2fa',
+            f'/{CONFIGS.ROOT_PATH}/check-2fa-status',
+            f'/{CONFIGS.ROOT_PATH}/robots.txt'
+        ]
+        
+        if request.url.path in public_routes or '/assets/' in request.url.path:
+            return await call_next(request)
+
+        is_api_request = '/api/v1/' in request.url.path
+
+        if is_api_request:
+            if self.__api_token:
+                if api_key := request.headers.get('Authorization'):
+                    if api_key == self.__api_token:
+                        return await call_next(request)
+                    else:
+                        return self.__handle_api_failure(status=401, detail="Invalid API token.")
+
+        session_id = request.cookies.get("session_id")
+
+        if not session_id:
+            if is_api_request:
+                return self.__handle_api_failure(status=401, detail="Unauthorized.")
+
+            return self.__redirect_to_login(request)
+
+        session_data = self.__session_manager.get_session(session_id)
+
+        if not session_data:
+            if is_api_request:
+                return self.__handle_api_failure(status=401, detail="The session is invalid.")
+
+            return self.__redirect_to_login(request)
+
+        if session_data.expires_at < datetime.now(timezone.utc):
+            if is_api_request:
+                return self.__handle_api_failure(status=401, detail="The session has expired.")
+
+            return self.__redirect_to_login(request)
+
+        return await call_next(request)
+
+    def __handle_api_failure(self, status: int, detail: str):
+        exc = HTTPException(status_code=status, detail=detail)
+
+        return exception_handler(exc)
+
+    def __redirect_to_login(self, request: Request):
+        redirect_url = str(request.url_for('login'))
+        return RedirectResponse(url=redirect_url, status_code=302)
+
+
+class LegacyAfterRequestMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next: Callable[[Request], Awaitable[Response]]):
+        response = await call_next(request)
+
+        response.headers['X-Robots-Tag'] = 'noindex, nofollow'
+        return response
+
+
+def build_app(legacy: bool, session_manager: SessionManager | LegacySessionManager) -> FastAPI:
+    app = FastAPI()
+
+    @app.get('/assets/app.css')
+    async def asset():
+        return Response(b'body{}', media_type='text/css')
+
+    @app.get('/api/v1/ping')
+    async def ping():
+        return {'ok': True}
+
+    @app.get('/stream')
+    async def stream():
+        async def chunks():
+            for _ in range(10):
+                yield b'data: x\n\n'
+        return StreamingResponse(chunks(), media_type='text/event-stream')
+
+    @app.get('/login', name='login')
+    async def login():
+        return Response('login')
+
+    if legacy:
+        app.add_middleware(LegacyAuthMiddleware, session_manager=session_manager, api_token=CONFIGS.API_TOKEN)
+        app.add_middleware(LegacyAfterRequestMiddleware)
+    else:
+        app.add_middleware(AuthMiddleware, session_manager=session_manager, api_token=CONFIGS.API_TOKEN)
+        app.add_middleware(AfterRequestMiddleware)
+    return app
+
+
+async def call(app, path: str, headers: list[tuple[bytes, bytes]]):
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': b'',
+        'headers': headers, 'client': ('127.0.0.1', 50000), 'server': ('127.0.0.1', 28260),
+    }
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        pass
+
+    await app(scope, receive, send)
+
+
+async def measure(app, path: str, headers, iterations: int) -> dict[str, float]:
+    for _ in range(min(100, iterations)):
+        await call(app, path, headers)
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await call(app, path, headers)
+        samples.append((time.perf_counter() - start) * 1_000_000)
+    samples.sort()
+    return {
+        'p50_us': round(samples[len(samples) // 2], 1),
+        'p99_us': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 1),
+    }
+
+
+async def run_benchmark(iterations: int) -> dict:
+    # Each stack gets the session manager it was written against.
+    legacy_sessions = LegacySessionManager(LegacySessionStorage())
+    sessions = SessionManager(MemorySessionStorage())
+    stacks = (
+        ('before', True, legacy_sessions, legacy_sessions.set_session('admin')),
+        ('after', False, sessions, await sessions.set_session('admin')),
+    )
+    token = [(b'authorization', (CONFIGS.API_TOKEN or '').encode())]
+
+    results = {}
+    for label, legacy, session_manager, session_id in stacks:
+        cookie = [(b'cookie', f'session_id={session_id}'.encode())]
+        cases = {
+            'asset': ('/assets/app.css', []),
+            'api_token': ('/api/v1/ping', token),
+            'session_stream': ('/stream', cookie),
+        }
+        app = build_app(legacy, session_manager)
+        results[label] = {name: await measure(app, path, headers, iterations) for name, (path, headers) in cases.items()}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare per-request middleware overhead: BaseHTTPMiddleware vs pure ASGI.')
+    parser.add_argument('-n', '--iterations', type=int, default=5000, help='Requests per case (default: 5000).')
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run_benchmark(args.iterations)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
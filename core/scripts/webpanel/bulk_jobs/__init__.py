@@ -0,0 +1 @@
+from .jobs import BulkJob, BulkJobManager
@@ -0,0 +1,79 @@
+import asyncio
+import secrets
+from collections import OrderedDict
+from typing import Any, Callable, Iterable
+
+
+class BulkJob:
+
+    def __init__(self, kind: str, progress):
+        self.id = secrets.token_hex(8)
+        self.kind = kind
+        self.status = 'pending'
+        self.progress = progress
+        self.error: str | None = None
+        self.task: asyncio.Task | None = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('completed', 'failed', 'cancelled')
+
+    def as_dict(self) -> dict[str, Any]:
+        return {'id': self.id, 'kind': self.kind, 'status': self.status, 'error': self.error, **self.progress.as_dict()}
+
+
+class BulkJobManager:
+    """
+    Runs bulk imports as background tasks and keeps their progress readable.
+
+    Only the last max_jobs jobs are remembered; the oldest finished ones are
+    forgotten first.
+    """
+
+    def __init__(self, importer, progress_factory: Callable[[], Any], max_jobs: int = 50):
+        self.importer = importer
+        self.progress_factory = progress_factory
+        self.max_jobs = max_jobs
+        self.jobs: OrderedDict[str, BulkJob] = OrderedDict()
+
+    def submit(self, kind: str, rows: Iterable[Any], defaults: dict[str, Any] | None = None,
+               cleanup: Callable[[], None] | None = None) -> BulkJob:
+        job = BulkJob(kind, self.progress_factory())
+        job.task = asyncio.create_task(self.__run(job, rows, defaults, cleanup))
+        self.jobs[job.id] = job
+        self.__evict()
+        return job
+
+    async def __run(self, job: BulkJob, rows, defaults, cleanup):
+        job.status = 'running'
+        try:
+            await self.importer.run(rows, defaults, job.progress)
+            job.status = 'completed'
+        except asyncio.CancelledError:
+            job.status = 'cancelled'
+            raise
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+        finally:
+            job.progress.finish()
+            if cleanup is not None:
+                cleanup()
+
+    def __evict(self):
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.done]:
+            if len(self.jobs) <= self.max_jobs:
+                break
+            del self.jobs[job_id]
+
+    def get(self, job_id: str) -> BulkJob | None:
+        return self.jobs.get(job_id)
+
+    def list(self) -> list[BulkJob]:
+        return list(reversed(self.jobs.values()))
+
+    async def stop(self):
+        running = [job.task for job in self.jobs.values() if job.task is not None and not job.task.done()]
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
@@ -17,6 +17,24 @@ class Configs(BaseSettings):
     CUSTOM_CERT: str | None = None
     CUSTOM_KEY: str | None = None
     
+    SESSION_BACKEND: str = "mongo"
+    SESSION_MAX_ENTRIES: int = 10000
+    SESSION_SWEEP_INTERVAL: float = 300
+
+    NODE_PROBE_INTERVAL: float = 30
+    NODE_PROBE_TIMEOUT: float = 3
+    NODE_PROBE_CONCURRENCY: int = 32
+    NODE_DNS_TTL: float = 300
+    NODE_HISTORY_SIZE: int = 120
+
+    METRICS_INTERVAL: float = 2
+    METRICS_TOTALS_INTERVAL: float = 30
+    METRICS_IP_TTL: float = 3600
+
+    BULK_CHUNK_SIZE: int = 1000
+    BULK_MAX_JOBS: int = 50
+    BULK_IMPORT_MAX_BYTES: int = 512 * 1024 * 1024
+
     TELEGRAM_AUTH_ENABLED: bool = False
     
     TELEGRAM_BOT_TOKEN: str | None = None
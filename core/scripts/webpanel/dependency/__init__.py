@@ -1 +1 @@
-from .dependency import get_templates, get_session_manager
+from .dependency import get_templates, get_session_manager, get_node_registry, get_user_search, get_metrics_sampler, get_bulk_jobs
@@ -1,6 +1,8 @@
 from fastapi.templating import Jinja2Templates
 
-from session import SessionStorage, SessionManager
+from session import MemorySessionStorage, MongoSessionStorage, SessionManager
+from node_registry import NodeRegistry
+from bulk_jobs import BulkJobManager
 from config import CONFIGS
 
 __TEMPLATES = Jinja2Templates(directory='templates')
@@ -14,9 +16,86 @@ def get_templates() -> Jinja2Templates:
     return __TEMPLATES
 
 
-__SESSION_STORAGE = SessionStorage()
-__SESSION_MANAGER = SessionManager(__SESSION_STORAGE, CONFIGS.EXPIRATION_MINUTES)
+__SESSION_MANAGER: SessionManager | None = None
 
 
 def get_session_manager() -> SessionManager:
+    global __SESSION_MANAGER
+    if __SESSION_MANAGER is None:
+        if CONFIGS.SESSION_BACKEND == 'mongo':
+            from scripts.db.async_database import async_db
+
+            storage = MongoSessionStorage(async_db)
+        else:
+            storage = MemorySessionStorage(CONFIGS.SESSION_MAX_ENTRIES)
+        __SESSION_MANAGER = SessionManager(storage, CONFIGS.EXPIRATION_MINUTES, CONFIGS.SESSION_SWEEP_INTERVAL)
     return __SESSION_MANAGER
+
+
+__NODE_REGISTRY: NodeRegistry | None = None
+
+
+def get_node_registry() -> NodeRegistry:
+    global __NODE_REGISTRY
+    if __NODE_REGISTRY is None:
+        import cli_api
+        from scripts.db.async_database import async_db
+
+        __NODE_REGISTRY = NodeRegistry(
+            async_db,
+            cli_api.NODES_JSON_PATH,
+            history_size=CONFIGS.NODE_HISTORY_SIZE,
+            probe_interval=CONFIGS.NODE_PROBE_INTERVAL,
+            probe_timeout=CONFIGS.NODE_PROBE_TIMEOUT,
+            probe_concurrency=CONFIGS.NODE_PROBE_CONCURRENCY,
+            dns_ttl=CONFIGS.NODE_DNS_TTL,
+        )
+    return __NODE_REGISTRY
+
+
+__USER_SEARCH = None
+
+
+def get_user_search():
+    global __USER_SEARCH
+    if __USER_SEARCH is None:
+        from scripts.db.async_database import async_db
+        from scripts.db.user_search import AsyncUserSearch
+
+        __USER_SEARCH = AsyncUserSearch(async_db)
+    return __USER_SEARCH
+
+
+__METRICS_SAMPLER = None
+
+
+def get_metrics_sampler():
+    global __METRICS_SAMPLER
+    if __METRICS_SAMPLER is None:
+        from scripts.db.async_database import async_db
+        from scripts.hysteria2.server_metrics import MetricsSampler
+        from scripts.paths import CONFIG_ENV, SERVER_INFO_SNAPSHOT
+
+        __METRICS_SAMPLER = MetricsSampler(
+            async_db,
+            snapshot_path=str(SERVER_INFO_SNAPSHOT),
+            env_path=str(CONFIG_ENV),
+            interval=CONFIGS.METRICS_INTERVAL,
+            totals_interval=CONFIGS.METRICS_TOTALS_INTERVAL,
+            ip_ttl=CONFIGS.METRICS_IP_TTL,
+        )
+    return __METRICS_SAMPLER
+
+
+__BULK_JOBS: BulkJobManager | None = None
+
+
+def get_bulk_jobs() -> BulkJobManager:
+    global __BULK_JOBS
+    if __BULK_JOBS is None:
+        from scripts.db.async_database import async_db, expiry_timestamp
+        from scripts.db.bulk_import import AsyncBulkImporter, BulkProgress
+
+        importer = AsyncBulkImporter(async_db, expiry_timestamp, CONFIGS.BULK_CHUNK_SIZE)
+        __BULK_JOBS = BulkJobManager(importer, BulkProgress, CONFIGS.BULK_MAX_JOBS)
+    return __BULK_JOBS
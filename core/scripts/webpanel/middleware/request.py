@@ -1,11 +1,21 @@
-from starlette.middleware.base import BaseHTTPMiddleware
-from fastapi import Request, Response
-from typing import Awaitable, Callable
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 
-class AfterRequestMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next: Callable[[Request], Awaitable[Response]]):
-        response = await call_next(request)
+class AfterRequestMiddleware:
 
-        response.headers['X-Robots-Tag'] = 'noindex, nofollow'
-        return response
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message):
+            if message['type'] == 'http.response.start':
+                headers = MutableHeaders(scope=message)
+                headers['X-Robots-Tag'] = 'noindex, nofollow'
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
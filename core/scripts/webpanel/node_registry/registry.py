@@ -0,0 +1,227 @@
+import asyncio
+import json
+import os
+import socket
+import time
+from collections import deque
+from typing import Any
+
+
+class DnsCache:
+
+    def __init__(self, ttl: float = 300):
+        self.ttl = ttl
+        self.entries: dict[str, tuple[set[str], float]] = {}
+
+    async def resolve(self, host: str) -> set[str]:
+        cached = self.entries.get(host)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+
+        addresses = {host}
+        if any(c.isalpha() for c in host):
+            try:
+                infos = await asyncio.get_running_loop().getaddrinfo(host, None, proto=socket.IPPROTO_TCP)
+                addresses.update(info[4][0] for info in infos)
+            except (socket.gaierror, OSError):
+                if cached:
+                    addresses = cached[0]
+        self.entries[host] = (addresses, time.monotonic() + self.ttl)
+        return addresses
+
+    def cached(self, host: str) -> set[str]:
+        cached = self.entries.get(host)
+        return cached[0] if cached else {host}
+
+
+class NodeRegistry:
+    """
+    Heartbeats, queued commands and probe results for external nodes.
+
+    Heartbeats and commands are persisted in MongoDB so they survive restarts
+    and are shared between workers; the status endpoint only reads the
+    in-memory view, which a background task refreshes together with DNS
+    lookups and concurrent TCP probes.
+    """
+
+    COLLECTION = 'nodes'
+
+    def __init__(self, db, nodes_json_path: str, online_window: float = 70, history_size: int = 120,
+                 probe_interval: float = 30, probe_timeout: float = 3, probe_concurrency: int = 32, dns_ttl: float = 300):
+        self.db = db
+        self.nodes_json_path = nodes_json_path
+        self.online_window = online_window
+        self.history_size = history_size
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.probe_concurrency = probe_concurrency
+        self.dns = DnsCache(dns_ttl)
+
+        self.heartbeats: dict[str, dict[str, Any]] = {}
+        self.history: dict[str, deque] = {}
+        self.probes: dict[str, bool] = {}
+        self.configured_nodes: list[dict[str, Any]] = []
+        self._nodes_signature = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def collection(self):
+        return self.db.collection.database[self.COLLECTION]
+
+    def _load_configured_nodes(self):
+        try:
+            stat = os.stat(self.nodes_json_path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            self.configured_nodes, self._nodes_signature = [], None
+            return
+        if signature == self._nodes_signature:
+            return
+        try:
+            with open(self.nodes_json_path, 'r') as f:
+                content = f.read()
+            self.configured_nodes = json.loads(content) if content else []
+        except (OSError, json.JSONDecodeError):
+            self.configured_nodes = []
+        self._nodes_signature = signature
+
+    def _remember(self, name: str, doc: dict[str, Any]):
+        self.heartbeats[name] = {
+            'stats': doc.get('stats', {}),
+            'last_seen': doc.get('last_seen', 0),
+            'ip': doc.get('ip'),
+        }
+        ring = self.history.setdefault(name, deque(maxlen=self.history_size))
+        if 'history' in doc:
+            ring.clear()
+            ring.extend(doc['history'])
+
+    async def load(self):
+        async for doc in self.collection.find({'last_seen': {'$exists': True}}):
+            self._remember(doc['_id'], doc)
+
+    async def record_heartbeat(self, stats: dict[str, Any], source_ip: str | None) -> str | None:
+        name = stats['node_name']
+        now = time.time()
+        sample = {
+            'ts': now,
+            'cpu_percent': stats.get('cpu_percent'),
+            'ram_percent': stats.get('ram_percent'),
+        }
+        self._remember(name, {'stats': stats, 'last_seen': now, 'ip': source_ip})
+        self.history[name].append(sample)
+
+        previous = await self.collection.find_one_and_update(
+            {'_id': name},
+            {
+                '$set': {'stats': stats, 'last_seen': now, 'ip': source_ip, 'command': None},
+                '$push': {'history': {'$each': [sample], '$slice': -self.history_size}},
+            },
+            projection={'command': 1},
+            upsert=True,
+        )
+        return previous.get('command') if previous else None
+
+    async def queue_command(self, name: str, command: str):
+        await self.collection.update_one({'_id': name}, {'$set': {'command': command}}, upsert=True)
+
+    def get_history(self, name: str) -> list[dict[str, Any]] | None:
+        ring = self.history.get(name)
+        return list(ring) if ring is not None else None
+
+    async def _probe(self, host: str, port: int, semaphore: asyncio.Semaphore) -> bool:
+        async with semaphore:
+            try:
+                _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=self.probe_timeout)
+            except (OSError, asyncio.TimeoutError, ValueError):
+                return False
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+            return True
+
+    async def refresh(self):
+        self._load_configured_nodes()
+        try:
+            await self.load()
+        except Exception as e:
+            print(f"Warning: Could not load node heartbeats: {e}")
+
+        targets = [node for node in self.configured_nodes if node.get('name') and node.get('ip')]
+        await asyncio.gather(*(self.dns.resolve(node['ip']) for node in targets))
+
+        semaphore = asyncio.Semaphore(self.probe_concurrency)
+        probed = [node for node in targets if node.get('port')]
+        results = await asyncio.gather(*(self._probe(node['ip'], node['port'], semaphore) for node in probed))
+        self.probes = {node['name']: result for node, result in zip(probed, results)}
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Warning: Node status refresh failed: {e}")
+            await asyncio.sleep(max(0.0, self.probe_interval - (time.monotonic() - started)))
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> dict[str, dict[str, Any]]:
+        current_time = time.time()
+        results = {}
+
+        for name, data in self.heartbeats.items():
+            results[name] = {
+                **data['stats'],
+                'is_online': (current_time - data['last_seen']) < self.online_window,
+                'last_seen_ago': int(current_time - data['last_seen']),
+                'source_ip': data.get('ip'),
+            }
+
+        by_source_ip = {}
+        for stored_name, stored_data in results.items():
+            if stored_data.get('source_ip'):
+                by_source_ip.setdefault(stored_data['source_ip'], stored_data)
+
+        for node in self.configured_nodes:
+            name = node.get('name')
+
+            if name not in results and node.get('ip'):
+                for address in self.dns.cached(node['ip']):
+                    if address in by_source_ip:
+                        results[name] = by_source_ip[address].copy()
+                        results[name]['node_name'] = name
+                        break
+                if name in results and results[name].get('is_online'):
+                    continue
+
+            if name not in results or not results[name]['is_online']:
+                is_active = self.probes.get(name, False)
+                if name not in results:
+                    results[name] = {
+                        'node_name': name,
+                        'is_online': is_active,
+                        'cpu_percent': 0,
+                        'ram_percent': 0,
+                        'uptime': 'Active Check' if is_active else 'Offline',
+                        'hysteria_active': is_active,
+                    }
+                elif is_active:
+                    results[name]['is_online'] = True
+                    if results[name].get('uptime', '-') in ('-', 'Offline'):
+                        results[name]['uptime'] = 'Active Check'
+
+        return results
@@ -1,9 +1,17 @@
 from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from ..schema.response import DetailResponse
+import gzip
+import io
 import json
 import os
-from scripts.db.database import db
+from pydantic import ValidationError
+from scripts.db.async_database import async_db, expiry_timestamp
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 from ..schema.config.ip import (
     EditInputBody, 
@@ -19,33 +27,13 @@ from ..schema.config.ip import (
     TunnelExecBody
 )
 import cli_api
-import time
-import socket
 import asyncio
 from config.config import CONFIGS
+from dependency import get_node_registry
 
 router = APIRouter()
 
-NODE_STATUS_STORE = {}
-NODE_COMMAND_QUEUE = {}
-
-def check_tcp_port(host, port, timeout=3):
-    try:
-        addr_info = socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)
-        
-        for family, type, proto, canonname, sockaddr in addr_info:
-            try:
-                s = socket.socket(family, type, proto)
-                s.settimeout(timeout)
-                s.connect(sockaddr)
-                s.close()
-                return True
-            except Exception:
-                pass
-        return False
-    except (socket.timeout, ConnectionRefusedError, OSError, ValueError, TypeError):
-        return False
-
+NODE_TRAFFIC_MAX_BODY = 64 * 1024 * 1024
 @router.get('/get', response_model=StatusResponse, summary='Get Local Server IP Status')
 async def get_ip_api():
     try:
@@ -180,138 +168,127 @@ async def delete_node(body: DeleteNodeBody):
         raise HTTPException(status_code=400, detail=str(e))
 
 
-@router.post('/nodestraffic', response_model=DetailResponse, summary='Receive and Aggregate Traffic from Node')
-async def receive_node_traffic(body: NodesTrafficPayload):
-    if db is None:
-        raise HTTPException(status_code=500, detail="Database connection is not available.")
-    
-    updated_count = 0
-    for user_traffic in body.users:
+def _decode_traffic_body(raw: bytes, content_type: str, content_encoding: str) -> dict:
+    if 'gzip' in content_encoding:
         try:
-            db_user = db.get_user(user_traffic.username)
-            if not db_user:
-                continue
-
-            new_upload = db_user.get('upload_bytes', 0) + user_traffic.upload_bytes
-            new_download = db_user.get('download_bytes', 0) + user_traffic.download_bytes
-
-            update_data = {
-                'upload_bytes': new_upload,
-                'download_bytes': new_download,
-                'status': user_traffic.status,
-                'online_count': user_traffic.online_count,
-            }
-            
-            if not db_user.get('account_creation_date') and user_traffic.account_creation_date:
-                update_data['account_creation_date'] = user_traffic.account_creation_date
-
-            db.update_user(user_traffic.username, update_data)
-            updated_count += 1
-            
+            with gzip.GzipFile(fileobj=io.BytesIO(raw)) as f:
+                raw = f.read(NODE_TRAFFIC_MAX_BODY + 1)
+        except (OSError, EOFError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid gzip body: {e}")
+        if len(raw) > NODE_TRAFFIC_MAX_BODY:
+            raise HTTPException(status_code=413, detail="Decompressed body too large.")
+
+    if 'msgpack' in content_type:
+        if msgpack is None:
+            raise HTTPException(status_code=415, detail="msgpack bodies are not supported on this server.")
+        try:
+            return msgpack.unpackb(raw, raw=False)
         except Exception as e:
-            print(f"Error updating traffic for user {user_traffic.username}: {e}")
+            raise HTTPException(status_code=400, detail=f"Invalid msgpack body: {e}")
+
+    try:
+        return json.loads(raw)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON body: {e}")
+
+
+def _build_traffic_updates(body: NodesTrafficPayload, db_users: dict) -> list:
+    aggregated = {}
+    for user_traffic in body.users:
+        username = user_traffic.username.lower()
+        db_user = db_users.get(username)
+        if db_user is None:
+            continue
+
+        entry = aggregated.get(username)
+        if entry is None:
+            entry = aggregated[username] = ({}, {'upload_bytes': 0, 'download_bytes': 0})
+        set_fields, inc_fields = entry
+        inc_fields['upload_bytes'] += user_traffic.upload_bytes
+        inc_fields['download_bytes'] += user_traffic.download_bytes
+        set_fields['status'] = user_traffic.status
+        set_fields['online_count'] = user_traffic.online_count
+
+        if not db_user.get('account_creation_date') and user_traffic.account_creation_date and 'account_creation_date' not in set_fields:
+            set_fields['account_creation_date'] = user_traffic.account_creation_date
+            set_fields['expires_at'] = expiry_timestamp(user_traffic.account_creation_date, db_user.get('expiration_days', 0))
+
+    return [(username, set_fields, inc_fields) for username, (set_fields, inc_fields) in aggregated.items()]
+
+
+@router.post('/nodestraffic', response_model=DetailResponse, summary='Receive and Aggregate Traffic from Node')
+async def receive_node_traffic(request: Request):
+    """
+    Apply a node's traffic report with one lookup and one bulk write.
+
+    The body is a NodesTrafficPayload as JSON or msgpack (Content-Type
+    application/msgpack), optionally gzip-compressed (Content-Encoding: gzip).
+    A batch is identified by batch_id, or by node_name, boot_id and seq. A
+    batch that was already applied is acknowledged without being applied
+    again; batches may arrive in any order.
+    """
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > NODE_TRAFFIC_MAX_BODY:
+            raise HTTPException(status_code=413, detail="Body too large.")
+        chunks.append(chunk)
+    data = _decode_traffic_body(
+        b''.join(chunks),
+        request.headers.get('content-type', '').lower(),
+        request.headers.get('content-encoding', '').lower()
+    )
+    try:
+        body = NodesTrafficPayload.model_validate(data)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+
+    batch_key = body.batch_key()
+    try:
+        db_users = await async_db.get_users(
+            [user.username for user in body.users],
+            {'account_creation_date': 1, 'expiration_days': 1}
+        )
+        updates = _build_traffic_updates(body, {doc['_id']: doc for doc in db_users})
+        if batch_key is None:
+            result = await async_db.bulk_update_users(updates)
+        else:
+            result = await async_db.apply_batch(batch_key, body.node_name, updates)
+            if result is None:
+                return DetailResponse(detail=f"Batch '{batch_key}' was already processed.")
+        _, matched, _ = result
+    except Exception as e:
+        print(f"Error applying node traffic: {e}")
+        raise HTTPException(status_code=500, detail="Failed to apply node traffic.")
 
-    return DetailResponse(detail=f"Successfully processed and aggregated traffic for {updated_count} users.")
+    return DetailResponse(detail=f"Successfully processed and aggregated traffic for {matched} users.")
 
 @router.post('/nodes/heartbeat', summary='Receive Node Heartbeat')
 async def receive_node_heartbeat(request: Request, body: NodeHeartbeatBody):
-    NODE_STATUS_STORE[body.node_name] = {
-        "stats": body.dict(),
-        "last_seen": time.time(),
-        "ip": request.client.host
-    }
-    
-    command = None
-    if body.node_name in NODE_COMMAND_QUEUE:
-        command = NODE_COMMAND_QUEUE.pop(body.node_name)
-        
+    try:
+        command = await get_node_registry().record_heartbeat(body.model_dump(), request.client.host)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to record heartbeat: {e}")
     return {"status": "ok", "command": command}
 
 @router.get('/nodes/status', summary='Get All Nodes Status')
 async def get_nodes_status():
-    current_time = time.time()
-    results = {}
-    
-    configured_nodes = []
-    if os.path.exists(cli_api.NODES_JSON_PATH):
-        try:
-            with open(cli_api.NODES_JSON_PATH, 'r') as f:
-                content = f.read()
-                if content:
-                    configured_nodes = json.loads(content)
-        except Exception: 
-            pass
-
-    for name, data in NODE_STATUS_STORE.items():
-        is_online = (current_time - data['last_seen']) < 70
-        results[name] = {
-            **data['stats'],
-            "is_online": is_online,
-            "last_seen_ago": int(current_time - data['last_seen']),
-            "source_ip": data.get("ip")
-        }
-
-    for node in configured_nodes:
-        name = node.get('name')
-        
-        if name not in results:
-             node_ip_raw = node.get('ip')
-             found_match = False
-             
-             if node_ip_raw:
-                 resolved_ips = {node_ip_raw}
-                 try:
-                     if any(c.isalpha() for c in node_ip_raw):
-                         infos = socket.getaddrinfo(node_ip_raw, None)
-                         for info in infos:
-                             resolved_ips.add(info[4][0])
-                 except: 
-                     pass
-
-                 for stored_name, stored_data in results.items():
-                     stored_ip = stored_data.get('source_ip')
-                     if stored_ip and stored_ip in resolved_ips:
-                         results[name] = stored_data.copy()
-                         results[name]['node_name'] = name 
-                         found_match = True
-                         break
-             
-             if found_match and results[name].get('is_online'):
-                 continue
-
-        if name not in results or not results[name]['is_online']:
-            
-            ip = node.get('ip')
-            port = node.get('port')
-            
-            is_active = False
-            if ip and port:
-                try:
-                    loop = asyncio.get_running_loop()
-                    is_active = await loop.run_in_executor(None, check_tcp_port, ip, port)
-                except Exception:
-                    pass
-            
-            if name not in results:
-                results[name] = {
-                    "node_name": name,
-                    "is_online": is_active,
-                    "cpu_percent": 0,
-                    "ram_percent": 0,
-                    "uptime": "Active Check" if is_active else "Offline",
-                    "hysteria_active": is_active 
-                }
-            elif is_active:
-                results[name]['is_online'] = True
-                curr_uptime = results[name].get('uptime', '-')
-                if curr_uptime == '-' or curr_uptime == 'Offline':
-                     results[name]['uptime'] = "Active Check"
-
-    return results
+    return get_node_registry().status()
+
+@router.get('/nodes/history/{node_name}', summary='Get Node Heartbeat History')
+async def get_node_history(node_name: str):
+    history = get_node_registry().get_history(node_name)
+    if history is None:
+        raise HTTPException(status_code=404, detail=f"No heartbeats recorded for node '{node_name}'.")
+    return {"node_name": node_name, "history": history}
 
 @router.post('/nodes/restart', response_model=DetailResponse, summary='Queue Restart Command')
 async def restart_node(body: RestartNodeBody):
-    NODE_COMMAND_QUEUE[body.node_name] = "restart"
+    try:
+        await get_node_registry().queue_command(body.node_name, "restart")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to queue restart: {e}")
     return DetailResponse(detail=f"Restart command queued for node '{body.node_name}'.")
 
 @router.post('/nodes/autoinstall', summary='Auto-install any-node via SSH')
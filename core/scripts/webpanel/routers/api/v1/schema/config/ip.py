@@ -167,6 +167,19 @@ class NodeUserTraffic(BaseModel):
 
 class NodesTrafficPayload(BaseModel):
     users: List[NodeUserTraffic]
+    node_name: Optional[str] = None
+    seq: Optional[int] = None
+    boot_id: Optional[str] = None
+    batch_id: Optional[str] = None
+
+    def batch_key(self) -> Optional[str]:
+        # seq restarts when a node is reinstalled; boot_id keeps the new run's
+        # batches from colliding with the old ones.
+        if self.batch_id:
+            return f"traffic:{self.node_name or ''}:{self.batch_id}"
+        if self.node_name is not None and self.seq is not None:
+            return f"traffic:{self.node_name}:{self.boot_id or ''}:{self.seq}"
+        return None
 
 class NodeHeartbeatBody(BaseModel):
     node_name: str
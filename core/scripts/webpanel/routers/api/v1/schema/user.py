@@ -55,6 +55,26 @@ class AddBulkUsersInputBody(BaseModel):
         return v
 
 
+class BulkRowError(BaseModel):
+    row: int
+    username: Optional[str] = None
+    error: str
+
+
+class BulkJobResponse(BaseModel):
+    id: str
+    kind: str
+    status: str
+    error: Optional[str] = None
+    processed: int
+    inserted: int
+    skipped: int
+    failed: int
+    elapsed: float
+    rows_per_second: float
+    errors: List[BulkRowError]
+
+
 class EditUserInputBody(BaseModel):
     new_username: Optional[str] = Field(None, description="The new username for the user.")
     new_password: Optional[str] = Field(None, description="The new password for the user. Leave empty to keep the current one.")
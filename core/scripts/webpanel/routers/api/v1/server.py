@@ -1,5 +1,7 @@
 from fastapi import APIRouter, HTTPException, BackgroundTasks
 import cli_api
+from dependency import get_metrics_sampler
+from scripts.hysteria2.server_metrics import convert_bytes, convert_speed
 from .schema.server import ServerStatusResponse, ServerServicesStatusResponse, VersionCheckResponse, VersionInfoResponse
 
 router = APIRouter()
@@ -17,120 +19,39 @@ async def update_panel_api(background_tasks: BackgroundTasks):
 async def server_status_api():
 
     try:
-        if res := cli_api.server_info():
-            return __parse_server_status(res)
+        if snapshot := get_metrics_sampler().snapshot():
+            return __build_server_status(snapshot)
         raise HTTPException(status_code=404, detail='Server information not available.')
     except Exception as e:
         raise HTTPException(status_code=400, detail=f'Error: {str(e)}')
 
 
-def __parse_server_status(server_info: str) -> ServerStatusResponse:
-    data = {
-        'uptime': 'N/A',
-        'boot_time': 'N/A',
-        'server_ipv4': 'N/A',
-        'server_ipv6': 'N/A',
-        'cpu_usage': '0%',
-        'total_ram': '0MB',
-        'ram_usage': '0MB',
-        'ram_usage_percent': '0%',
-        'online_users': 0,
-        'upload_speed': '0 B/s',
-        'download_speed': '0 B/s',
-        'tcp_connections': 0,
-        'udp_connections': 0,
-        'reboot_uploaded_traffic': '0 B',
-        'reboot_downloaded_traffic': '0 B',
-        'reboot_total_traffic': '0 B',
-        'user_uploaded_traffic': '0 B',
-        'user_downloaded_traffic': '0 B',
-        'user_total_traffic': '0 B'
-    }
-
-    current_section = 'general'
-
-    for line in server_info.splitlines():
-        line = line.strip()
-        if not line:
-            continue
-
-        if 'Traffic Since Last Reboot' in line:
-            current_section = 'reboot'
-            continue
-        elif 'User Traffic (All Time)' in line:
-            current_section = 'user'
-            continue
-            
-        key, _, value = line.partition(":")
-        key = key.strip().lower()
-        value = value.strip()
-
-        if not key or not value:
-            continue
-        
-        try:
-            if 'uptime' in key:
-                uptime_part, _, boottime_part = value.partition('(')
-                data['uptime'] = uptime_part.strip()
-                data['boot_time'] = boottime_part.replace('since ', '').replace(')', '').strip()
-            elif 'server ipv4' in key:
-                data['server_ipv4'] = value
-            elif 'server ipv6' in key:
-                data['server_ipv6'] = value
-            elif 'cpu usage' in key:
-                data['cpu_usage'] = value
-            elif 'used ram' in key:
-                parts = value.split('/')
-                if len(parts) == 2:
-                    data['ram_usage'] = parts[0].strip()
-                    data['total_ram'] = parts[1].strip()
-                    try:
-                        def parse_size(s):
-                            s = s.upper().strip()
-                            if 'GB' in s: return float(s.replace('GB', '').strip()) * 1024
-                            if 'MB' in s: return float(s.replace('MB', '').strip())
-                            if 'KB' in s: return float(s.replace('KB', '').strip()) / 1024
-                            return float(s)
-                        
-                        used = parse_size(data['ram_usage'])
-                        total = parse_size(data['total_ram'])
-                        if total > 0:
-                            percent = (used / total) * 100
-                            data['ram_usage_percent'] = f"{percent:.1f}%"
-                    except:
-                        pass
-            elif 'online users' in key:
-                data['online_users'] = int(value)
-            elif 'upload speed' in key:
-                data['upload_speed'] = value
-            elif 'download speed' in key:
-                data['download_speed'] = value
-            elif 'tcp connections' in key:
-                data['tcp_connections'] = int(value)
-            elif 'udp connections' in key:
-                data['udp_connections'] = int(value)
-            elif 'total uploaded' in key or 'uploaded traffic' in key:
-                if current_section == 'reboot':
-                    data['reboot_uploaded_traffic'] = value
-                elif current_section == 'user':
-                    data['user_uploaded_traffic'] = value
-            elif 'total downloaded' in key or 'downloaded traffic' in key:
-                if current_section == 'reboot':
-                    data['reboot_downloaded_traffic'] = value
-                elif current_section == 'user':
-                    data['user_downloaded_traffic'] = value
-            elif 'combined traffic' in key or 'total traffic' in key:
-                if current_section == 'reboot':
-                    data['reboot_total_traffic'] = value
-                elif current_section == 'user':
-                    data['user_total_traffic'] = value
-        except (ValueError, IndexError) as e:
-            raise ValueError(f'Error parsing line \'{line}\': {e}')
-
-    try:
-        return ServerStatusResponse(**data)
-    except Exception as e:
-        raise ValueError(f'Invalid or incomplete server info: {e}')
+def __build_server_status(snapshot: dict) -> ServerStatusResponse:
+    mem_total, mem_used = snapshot['mem_total_mb'], snapshot['mem_used_mb']
+    reboot_up, reboot_down = snapshot['reboot_upload_bytes'], snapshot['reboot_download_bytes']
+    user_up, user_down = snapshot['user_upload_bytes'], snapshot['user_download_bytes']
+
+    return ServerStatusResponse(
+        uptime=snapshot['uptime'],
+        boot_time=snapshot['boot_time'],
+        server_ipv4=snapshot['server_ipv4'] or 'Not Found',
+        server_ipv6=snapshot['server_ipv6'] or 'Not Found',
+        cpu_usage=f"{snapshot['cpu_usage']}%",
+        ram_usage=f'{mem_used}MB',
+        total_ram=f'{mem_total}MB',
+        ram_usage_percent=f'{mem_used / mem_total * 100:.1f}%' if mem_total else '0%',
+        online_users=snapshot['online_users'],
+        upload_speed=convert_speed(snapshot['upload_speed']),
+        download_speed=convert_speed(snapshot['download_speed']),
+        tcp_connections=snapshot['tcp_connections'],
+        udp_connections=snapshot['udp_connections'],
+        reboot_uploaded_traffic=convert_bytes(reboot_up),
+        reboot_downloaded_traffic=convert_bytes(reboot_down),
+        reboot_total_traffic=convert_bytes(reboot_up + reboot_down),
+        user_uploaded_traffic=convert_bytes(user_up),
+        user_downloaded_traffic=convert_bytes(user_down),
+        user_total_traffic=convert_bytes(user_up + user_down),
+    )
 
 
 @router.get('/services/status', response_model=ServerServicesStatusResponse)
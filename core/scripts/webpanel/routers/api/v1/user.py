@@ -1,6 +1,9 @@
+import io
 import json
-from typing import List
-from fastapi import APIRouter, HTTPException
+import tempfile
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from .schema.user import (
     UserListResponse, 
     UserInfoResponse, 
@@ -9,20 +12,53 @@ from .schema.user import (
     RenewUserInputBody,
     UserUriResponse, 
     AddBulkUsersInputBody, 
+    BulkJobResponse,
     UsernamesRequest
 )
 from .schema.response import DetailResponse
 import cli_api
+from config import CONFIGS
+from dependency import get_user_search, get_bulk_jobs
+from scripts.db.async_database import async_db
+from scripts.db.bulk_import import aiter_export, generate_rows, read_manifest
+from scripts.db.user_search import DEFAULT_LIMIT, MAX_LIMIT
 
 router = APIRouter()
 
 
 @router.get('/', response_model=UserListResponse)
-async def list_users_api():
+async def list_users_api(
+    response: Response,
+    page: Optional[int] = Query(None, ge=1),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    sort: Optional[str] = Query(None, description='username, created, expiration, quota or usage; prefix with - for descending'),
+    status: Optional[str] = Query(None, pattern='^(Online|Offline|Disabled)$'),
+    q: Optional[str] = Query(None, max_length=100)
+):
     try:
-        if res := cli_api.list_users():
-            return res
-        raise HTTPException(status_code=404, detail='No users found.')
+        if all(value is None for value in (page, limit, sort, status, q)):
+            if res := cli_api.list_users():
+                return res
+            raise HTTPException(status_code=404, detail='No users found.')
+
+        result = cli_api.list_users(page, limit, sort, status, q) or {}
+        response.headers['X-Total-Count'] = str(result.get('total', 0))
+        response.headers['X-Page'] = str(result.get('page', page or 1))
+        response.headers['X-Page-Size'] = str(result.get('limit', limit or 50))
+        return result.get('users', [])
+    except cli_api.InvalidInputError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f'Error: {str(e)}')
+
+
+@router.get('/search', response_model=UserListResponse)
+async def search_users_api(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT)
+):
+    try:
+        return await get_user_search().search(q, limit)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f'Error: {str(e)}')
 
@@ -58,25 +94,68 @@ async def add_user_api(body: AddUserInputBody):
                             detail=f"An unexpected error occurred while adding user '{body.username}': {str(e)}")
 
 
-@router.post('/bulk/', response_model=DetailResponse, status_code=201)
+@router.post('/bulk/', response_model=BulkJobResponse, status_code=202)
 async def add_bulk_users_api(body: AddBulkUsersInputBody):
+    defaults = {'traffic_gb': body.traffic_gb, 'expiration_days': body.expiration_days, 'unlimited_user': body.unlimited}
     try:
-        cli_api.bulk_user_add(
-            traffic_gb=body.traffic_gb,
-            expiration_days=body.expiration_days,
-            count=body.count,
-            prefix=body.prefix,
-            start_number=body.start_number,
-            unlimited=body.unlimited
-        )
-        return DetailResponse(detail=f"Successfully started adding {body.count} users with prefix '{body.prefix}'.")
-    except cli_api.CommandExecutionError as e:
-        raise HTTPException(status_code=400,
-                            detail=f'Failed to add bulk users: {str(e)}')
+        job = get_bulk_jobs().submit('generate', generate_rows(body.prefix, body.start_number, body.count), defaults)
+        return job.as_dict()
     except Exception as e:
         raise HTTPException(status_code=500,
                             detail=f"An unexpected error occurred while adding bulk users: {str(e)}")
 
+
+@router.post('/bulk/import', response_model=BulkJobResponse, status_code=202)
+async def import_bulk_users_api(
+    request: Request,
+    format: str = Query('csv', pattern='^(csv|jsonl)$'),
+    traffic_gb: Optional[float] = Query(None, ge=0),
+    expiration_days: Optional[int] = Query(None, ge=0),
+    unlimited: bool = False
+):
+    # The body is the raw manifest. It is spooled to a temporary file so the
+    # job can keep reading it in chunks after this request has returned.
+    spool = tempfile.TemporaryFile()
+    try:
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > CONFIGS.BULK_IMPORT_MAX_BYTES:
+                raise HTTPException(status_code=413, detail='Manifest is too large.')
+            spool.write(chunk)
+        spool.seek(0)
+        manifest = io.TextIOWrapper(spool, encoding='utf-8-sig', newline='')
+    except BaseException:
+        spool.close()
+        raise
+
+    defaults = {'traffic_gb': traffic_gb, 'expiration_days': expiration_days, 'unlimited_user': unlimited}
+    job = get_bulk_jobs().submit('import', read_manifest(manifest, format), defaults, cleanup=manifest.close)
+    return job.as_dict()
+
+
+@router.get('/bulk/export')
+async def export_bulk_users_api(format: str = Query('csv', pattern='^(csv|jsonl)$')):
+    media_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    return StreamingResponse(
+        aiter_export(async_db, format),
+        media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="users.{format}"'}
+    )
+
+
+@router.get('/bulk/jobs', response_model=List[BulkJobResponse])
+async def list_bulk_jobs_api():
+    return [job.as_dict() for job in get_bulk_jobs().list()]
+
+
+@router.get('/bulk/jobs/{job_id}', response_model=BulkJobResponse)
+async def get_bulk_job_api(job_id: str):
+    if job := get_bulk_jobs().get(job_id):
+        return job.as_dict()
+    raise HTTPException(status_code=404, detail=f'Bulk job {job_id} not found.')
+
+
 @router.post('/uri/bulk', response_model=List[UserUriResponse])
 async def show_multiple_user_uris_api(request: UsernamesRequest):
     if not request.usernames:
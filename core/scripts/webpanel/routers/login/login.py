@@ -103,7 +103,7 @@ async def login_post(
             print(f"2FA Error: {e}")
             return templates.TemplateResponse('login.html', {'request': request, 'error': f'2FA Error: {str(e)}'})
 
-    session_id = session_manager.set_session(username)
+    session_id = await session_manager.set_session(username)
     redirect_url = request.url_for('index')
     res = RedirectResponse(url=redirect_url, status_code=302)
     res.set_cookie(key='session_id', value=session_id)
@@ -129,7 +129,7 @@ async def check_2fa_status(
         return JSONResponse({'status': 'expired'}, status_code=200)
 
     if data['status'] == 'approved':
-        session_id = session_manager.set_session(data['username'])
+        session_id = await session_manager.set_session(data['username'])
         if db:
             db.collection.delete_one({"_id": token})
         else:
@@ -173,7 +173,7 @@ async def verify_2fa(
     else:
         del pending_verifications[token]
     
-    session_id = session_manager.set_session(username)
+    session_id = await session_manager.set_session(username)
     redirect_url = request.url_for('index')
     res = RedirectResponse(url=redirect_url, status_code=302)
     res.set_cookie(key='session_id', value=session_id)
@@ -186,7 +186,7 @@ async def verify_2fa(
 async def logout(request: Request, session_manager: SessionManager = Depends(get_session_manager)):
     session_id = request.cookies.get('session_id')
     if session_id:
-        session_manager.revoke_session(session_id)
+        await session_manager.revoke_session(session_id)
 
     res = RedirectResponse(url=request.url_for('index'), status_code=302)
     res.delete_cookie('session_id')
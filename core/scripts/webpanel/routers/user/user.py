@@ -3,8 +3,10 @@ from fastapi.templating import Jinja2Templates
 from fastapi.responses import RedirectResponse
 from starlette.status import HTTP_302_FOUND
 import math
+from urllib.parse import urlencode
 
-from dependency import get_templates
+from dependency import get_templates, get_user_search
+from scripts.db.user_search import DEFAULT_LIMIT, MAX_LIMIT
 from .viewmodel import User
 import cli_api
 
@@ -16,23 +18,25 @@ async def get_users_page(
     request: Request,
     templates: Jinja2Templates,
     page: int,
-    limit: int
+    limit: int,
+    sort: str | None = None,
+    status: str | None = None,
+    q: str | None = None
 ):
+    # Carried by pagination links and redirects so a page change keeps the view.
+    params = {key: value for key, value in (('sort', sort), ('status', status), ('q', q)) if value}
+    page_query = f"?{urlencode(params)}" if params else ""
     try:
-        users_list = cli_api.list_users() or []
-        total_users = len(users_list)
+        result = cli_api.list_users(page, limit, sort, status, q) or {}
+        total_users = result.get('total', 0)
         total_pages = math.ceil(total_users / limit) if limit > 0 else 1
 
         if page > total_pages and total_pages > 0:
-            return RedirectResponse(url=f"/users/{total_pages}", status_code=HTTP_302_FOUND)
+            return RedirectResponse(url=f"/users/{total_pages}{page_query}", status_code=HTTP_302_FOUND)
         if page < 1:
-            return RedirectResponse(url=f"/users/1", status_code=HTTP_302_FOUND)
+            return RedirectResponse(url=f"/users/1{page_query}", status_code=HTTP_302_FOUND)
 
-        start_index = (page - 1) * limit
-        end_index = start_index + limit
-        paginated_list = users_list[start_index:end_index]
-
-        users: list[User] = [User.from_dict(user_data.get('username', ''), user_data) for user_data in paginated_list]
+        users: list[User] = [User.from_dict(user_data.get('username', ''), user_data) for user_data in result.get('users', [])]
 
         return templates.TemplateResponse(
             'users.html',
@@ -43,8 +47,14 @@ async def get_users_page(
                 'total_pages': total_pages,
                 'limit': limit,
                 'total_users': total_users,
+                'sort': sort,
+                'status': status,
+                'q': q,
+                'page_query': page_query,
             }
         )
+    except cli_api.InvalidInputError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f'Error: {str(e)}')
 
@@ -54,43 +64,39 @@ async def users_paginated(
     request: Request,
     templates: Jinja2Templates = Depends(get_templates),
     page: int = Path(..., ge=1),
-    limit: int = Cookie(default=50, ge=1)
+    limit: int = Cookie(default=50, ge=1),
+    sort: str | None = Query(None),
+    status: str | None = Query(None, pattern='^(Online|Offline|Disabled)$'),
+    q: str | None = Query(None, max_length=100)
 ):
-    return await get_users_page(request, templates, page, limit)
+    return await get_users_page(request, templates, page, limit, sort, status, q)
 
 
 @router.get('/', name="users")
 async def users_root(
     request: Request,
     templates: Jinja2Templates = Depends(get_templates),
-    limit: int = Cookie(default=50, ge=1)
+    limit: int = Cookie(default=50, ge=1),
+    sort: str | None = Query(None),
+    status: str | None = Query(None, pattern='^(Online|Offline|Disabled)$'),
+    q: str | None = Query(None, max_length=100)
 ):
-    return await get_users_page(request, templates, 1, limit)
+    return await get_users_page(request, templates, 1, limit, sort, status, q)
 
 @router.get("/search/", name="search_users")
 async def search_users(
     request: Request,
     q: str = Query(""),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
     templates: Jinja2Templates = Depends(get_templates)
 ):
     try:
-        if not q:
-            all_users_data = []
-        else:
-            all_users_data = cli_api.list_users() or []
-        
-        query = q.lower()
-        
-        filtered_users_data = [
-            user_data for user_data in all_users_data
-            if query in user_data.get('username', '').lower() or query in user_data.get('note', '').lower()
-        ]
-
-        users: list[User] = [User.from_dict(user_data.get('username', ''), user_data) for user_data in filtered_users_data]
+        users_data = await get_user_search().search(q, limit) if q else []
+        users: list[User] = [User.from_dict(user_data.get('username', ''), user_data) for user_data in users_data]
 
         return templates.TemplateResponse(
             'users_rows.html',
             {'request': request, 'users': users}
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
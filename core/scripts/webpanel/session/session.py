@@ -1,4 +1,7 @@
+import asyncio
 import secrets
+from abc import ABC, abstractmethod
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from pydantic import BaseModel
 
@@ -8,38 +11,143 @@ class SessionData(BaseModel):
     created_at: datetime
     expires_at: datetime
 
+    def is_expired(self) -> bool:
+        return self.expires_at < datetime.now(timezone.utc)
 
-class SessionStorage:
 
-    def __init__(self):
-        self.sessions: dict[str, SessionData] = {}
+class SessionStorage(ABC):
 
-    def set(self, session_id: str, data: SessionData):
-        self.sessions[session_id] = data
+    @abstractmethod
+    async def set(self, session_id: str, data: SessionData):
+        ...
+
+    @abstractmethod
+    async def get(self, session_id: str) -> SessionData | None:
+        ...
+
+    @abstractmethod
+    async def delete(self, session_id: str):
+        ...
+
+    @abstractmethod
+    async def sweep(self) -> int:
+        """Remove expired sessions and return how many were dropped."""
+
+    async def setup(self):
+        pass
 
-    def get(self, session_id: str) -> SessionData | None:
-        return self.sessions.get(session_id)
 
-    def delete(self, session_id: str):
+class MemorySessionStorage(SessionStorage):
+
+    def __init__(self, max_sessions: int = 10000):
+        self.max_sessions = max_sessions
+        self.sessions: OrderedDict[str, SessionData] = OrderedDict()
+
+    async def set(self, session_id: str, data: SessionData):
+        self.sessions[session_id] = data
+        self.sessions.move_to_end(session_id)
+        while len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+
+    async def get(self, session_id: str) -> SessionData | None:
+        data = self.sessions.get(session_id)
+        if data is None:
+            return None
+        if data.is_expired():
+            del self.sessions[session_id]
+            return None
+        self.sessions.move_to_end(session_id)
+        return data
+
+    async def delete(self, session_id: str):
         self.sessions.pop(session_id, None)
 
+    async def sweep(self) -> int:
+        expired = [session_id for session_id, data in self.sessions.items() if data.is_expired()]
+        for session_id in expired:
+            del self.sessions[session_id]
+        return len(expired)
+
+
+class MongoSessionStorage(SessionStorage):
+    """
+    Sessions in a MongoDB collection with a TTL index on expires_at, so they
+    survive restarts and are shared by every panel worker.
+    """
+
+    def __init__(self, db, collection_name: str = 'sessions'):
+        self.db = db
+        self.collection_name = collection_name
+
+    @property
+    def collection(self):
+        return self.db.collection.database[self.collection_name]
+
+    async def setup(self):
+        await self.collection.create_index('expires_at', expireAfterSeconds=0, name='expires_at_ttl')
+
+    async def set(self, session_id: str, data: SessionData):
+        await self.collection.replace_one({'_id': session_id}, {'_id': session_id, **data.model_dump()}, upsert=True)
+
+    async def get(self, session_id: str) -> SessionData | None:
+        # The TTL monitor only runs once a minute, so expiry is also enforced here.
+        doc = await self.collection.find_one({'_id': session_id, 'expires_at': {'$gt': datetime.now(timezone.utc)}})
+        if doc is None:
+            return None
+        doc.pop('_id')
+        for key in ('created_at', 'expires_at'):
+            if doc[key].tzinfo is None:
+                doc[key] = doc[key].replace(tzinfo=timezone.utc)
+        return SessionData(**doc)
+
+    async def delete(self, session_id: str):
+        await self.collection.delete_one({'_id': session_id})
+
+    async def sweep(self) -> int:
+        result = await self.collection.delete_many({'expires_at': {'$lt': datetime.now(timezone.utc)}})
+        return result.deleted_count
+
 
 class SessionManager:
 
-    def __init__(self, storage: SessionStorage, expiration_minutes: int = 1440):
+    def __init__(self, storage: SessionStorage, expiration_minutes: int = 1440, sweep_interval: float = 300):
         self.storage = storage
         self.expiration = timedelta(minutes=expiration_minutes)
+        self.sweep_interval = sweep_interval
+        self.__sweeper: asyncio.Task | None = None
 
-    def set_session(self, username: str) -> str:
+    async def set_session(self, username: str) -> str:
         session_id = secrets.token_hex(32)
         session_data = SessionData(username=username, created_at=datetime.now(timezone.utc), expires_at=datetime.now(timezone.utc) + self.expiration)
 
-        self.storage.set(session_id, session_data)
+        await self.storage.set(session_id, session_data)
 
         return session_id
 
-    def get_session(self, session_id: str) -> SessionData | None:
-        return self.storage.get(session_id)
-
-    def revoke_session(self, session_id: str):
-        self.storage.delete(session_id)
+    async def get_session(self, session_id: str) -> SessionData | None:
+        return await self.storage.get(session_id)
+
+    async def revoke_session(self, session_id: str):
+        await self.storage.delete(session_id)
+
+    async def __sweep_forever(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.storage.sweep()
+            except Exception as e:
+                print(f"Session sweep failed: {e}")
+
+    async def start(self):
+        await self.storage.setup()
+        if self.__sweeper is None or self.__sweeper.done():
+            self.__sweeper = asyncio.create_task(self.__sweep_forever())
+
+    async def stop(self):
+        if self.__sweeper is not None:
+            self.__sweeper.cancel()
+            try:
+                await self.__sweeper
+            except asyncio.CancelledError:
+                pass
+            self.__sweeper = None
@@ -5,13 +5,14 @@ if os.name != 'nt':
     import fcntl
 import datetime
 import logging
+import time
 from typing import Dict, Any, Optional, List, Tuple
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, os.path.join(SCRIPT_DIR, 'scripts'))
 
 from hysteria2_api import Hysteria2Client
-from db.database import db
+from db.database import db, expiry_timestamp
 
 CONFIG_FILE = '/etc/hysteria/config.json'
 API_BASE_URL = 'http://127.0.0.1:25413'
@@ -53,7 +54,7 @@ def display_traffic_data(data: Dict[str, Dict[str, Any]]):
         print(separator)
 
 class TrafficManager:
-    def __init__(self, db_conn, api_base_url: str):
+    def __init__(self, db_conn, api_base_url: str, batch_size: int = 1000):
         self.db = db_conn
         if self.db is None:
             raise ValueError("Database connection is not available.")
@@ -62,6 +63,12 @@ class TrafficManager:
             raise ValueError(f"Secret not found or failed to read {CONFIG_FILE}.")
         self.client = Hysteria2Client(base_url=api_base_url, secret=self.secret)
         self.today_date = datetime.datetime.now().strftime("%Y-%m-%d")
+        self.batch_size = batch_size
+        self.last_tick_stats: Dict[str, Any] = {}
+        try:
+            self.db.ensure_expiry_indexes()
+        except Exception as e:
+            logging.error(f"Failed to prepare expiry indexes: {e}")
 
     @staticmethod
     def _get_secret() -> Optional[str]:
@@ -86,6 +93,7 @@ class TrafficManager:
             return int(connections_attr) if isinstance(connections_attr, int) else 1
 
     def process_and_update_traffic(self) -> Dict[str, Any]:
+        tick_start = time.perf_counter()
         try:
             live_traffic = self.client.get_traffic_stats(clear=True)
             live_status = self.client.get_online_clients()
@@ -99,30 +107,47 @@ class TrafficManager:
             logging.error(f"Error communicating with Hysteria2 API or DB: {e}")
             return {}
 
-        users_to_update: List[Tuple[str, Dict[str, Any]]] = []
+        users_to_update: List[Tuple[str, Dict[str, Any], Dict[str, int]]] = []
         for username, user_data in db_users.items():
-            updates = self._calculate_user_updates(username, user_data, live_traffic, live_status)
-            if updates:
-                users_to_update.append((username, updates))
+            set_fields, inc_fields = self._calculate_user_updates(username, user_data, live_traffic, live_status)
+            if set_fields or inc_fields:
+                users_to_update.append((username, set_fields, inc_fields))
 
+        stats = {"users": len(db_users), "ops": 0, "matched": 0, "modified": 0, "write_ms": 0.0}
         if users_to_update:
-            for username, update_data in users_to_update:
-                try:
-                    self.db.update_user(username, update_data)
-                    db_users[username].update(update_data)
-                except Exception as e:
-                    logging.error(f"Failed to update user {username} in DB: {e}")
+            write_start = time.perf_counter()
+            try:
+                stats["ops"], stats["matched"], stats["modified"] = self.db.bulk_update_users(users_to_update, batch_size=self.batch_size)
+                for username, set_fields, inc_fields in users_to_update:
+                    user_data = db_users[username]
+                    user_data.update(set_fields)
+                    for field, delta in inc_fields.items():
+                        user_data[field] = user_data.get(field, 0) + delta
+            except Exception as e:
+                logging.error(f"Failed to bulk update {len(users_to_update)} users in DB: {e}")
+            stats["write_ms"] = round((time.perf_counter() - write_start) * 1000, 2)
+
+        stats["tick_ms"] = round((time.perf_counter() - tick_start) * 1000, 2)
+        self.last_tick_stats = stats
+        logging.info(
+            f"Traffic tick: {stats['users']} users, {stats['ops']} ops "
+            f"({stats['matched']} matched, {stats['modified']} modified), "
+            f"write {stats['write_ms']}ms, total {stats['tick_ms']}ms"
+        )
         return db_users
 
-    def _calculate_user_updates(self, username: str, user_data: Dict, live_traffic: Dict, live_status: Dict) -> Dict[str, Any]:
+    def _calculate_user_updates(self, username: str, user_data: Dict, live_traffic: Dict, live_status: Dict) -> Tuple[Dict[str, Any], Dict[str, int]]:
         updates = {}
+        increments = {}
         online_count = self._get_online_connection_count(live_status.get(username))
         
         has_traffic_now = False
         if username in live_traffic:
-            updates['upload_bytes'] = user_data.get('upload_bytes', 0) + live_traffic[username].upload_bytes
-            updates['download_bytes'] = user_data.get('download_bytes', 0) + live_traffic[username].download_bytes
-            if live_traffic[username].upload_bytes > 0 or live_traffic[username].download_bytes > 0:
+            upload_delta = live_traffic[username].upload_bytes
+            download_delta = live_traffic[username].download_bytes
+            if upload_delta > 0 or download_delta > 0:
+                increments['upload_bytes'] = upload_delta
+                increments['download_bytes'] = download_delta
                 has_traffic_now = True
 
         is_online_realtime = online_count > 0 or has_traffic_now
@@ -155,6 +180,7 @@ class TrafficManager:
         
         if not is_activated and has_traffic_now:
             updates["account_creation_date"] = self.today_date
+            updates["expires_at"] = expiry_timestamp(self.today_date, user_data.get("expiration_days", 0))
             updates["status"] = STATUS_ONLINE
         elif is_activated:
             new_status = STATUS_ONLINE if effective_online else STATUS_OFFLINE
@@ -163,40 +189,26 @@ class TrafficManager:
         elif not is_activated and not has_traffic_now and user_data.get("status") != STATUS_OFFLINE:
             updates["status"] = STATUS_OFFLINE
 
-        return updates
+        return updates, increments
 
     def kick_expired_users(self):
         try:
-            all_users = self.db.get_all_users()
+            expired_users = self.db.find_users_to_block(time.time())
         except Exception as e:
             logging.error(f"Failed to fetch users for expiration check: {e}")
             return
 
-        now = datetime.datetime.now()
-        users_to_kick, users_to_block = [], []
-        
-        for user in all_users:
-            username = user.get('_id')
-            if not username or user.get('blocked') or not user.get('account_creation_date'): continue
-
-            try:
-                total_bytes = user.get('download_bytes', 0) + user.get('upload_bytes', 0)
-                expired_by_date = (user.get('expiration_days', 0) > 0 and now >= datetime.datetime.strptime(user['account_creation_date'], "%Y-%m-%d") + datetime.timedelta(days=user['expiration_days']))
-                expired_by_traffic = (user.get('max_download_bytes', 0) > 0 and total_bytes >= user['max_download_bytes'])
-
-                if expired_by_date or expired_by_traffic:
-                    users_to_block.append(username)
-                    if user.get("online_count", 0) > 0 or user.get("status") == STATUS_ONLINE:
-                        users_to_kick.append(username)
-            except (ValueError, TypeError): continue
+        users_to_block = [user['_id'] for user in expired_users]
+        users_to_kick = [
+            user['_id'] for user in expired_users
+            if user.get("online_count", 0) > 0 or user.get("status") == STATUS_ONLINE
+        ]
         
         if users_to_block:
-            for username in users_to_block:
-                self.db.update_user(username, {'blocked': True, 'status': STATUS_OFFLINE, 'online_count': 0})
+            self.db.block_users(users_to_block, {'status': STATUS_OFFLINE, 'online_count': 0})
         
         if users_to_kick:
-            for i in range(0, len(users_to_kick), 50):
-                self._kick_api_call(users_to_kick[i:i+50])
+            self._kick_api_call(users_to_kick)
 
     def _kick_api_call(self, usernames: List[str]):
         try:
@@ -111,6 +111,19 @@ install_mongodb() {
     fi
 }
 
+# ========== Install ipset ==========
+install_ipset() {
+    info "Checking for ipset..."
+    if ! command -v ipset &>/dev/null; then
+        warn "ipset not found. Installing..."
+        apt-get update -qq
+        apt-get install -y ipset
+        success "ipset installed successfully."
+    else
+        success "ipset is already installed."
+    fi
+}
+
 migrate_normalsub_path() {
     local normalsub_env_file="$HYSTERIA_INSTALL_DIR/core/scripts/normalsub/.env"
     info "Checking for NormalSub configuration migration..."
@@ -222,6 +235,9 @@ fix_caddy_repo
 # ========== Install MongoDB Prerequisite ==========
 install_mongodb
 
+# ========== Install ipset Prerequisite ==========
+install_ipset
+
 # ========== Migrate NormalSub Path (if necessary) ==========
 # migrate_normalsub_path
 